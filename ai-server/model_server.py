@@ -11,15 +11,49 @@ Usage:
 
     Or with custom settings:
     python model_server.py --model models/best.onnx --port 8000
+
+    Pre-forked worker processes sharing one copy of the model weights:
+    python model_server.py --workers 4
+
+    Hot-reload the model when models/best.onnx is replaced:
+    python model_server.py --watch-model 5
+
+    Bulk detection jobs over archived photos below /data/photos:
+    python model_server.py --job-db jobs.db --job-image-root /data/photos
 """
 
-from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import asynccontextmanager, closing, contextmanager, nullcontext
+from fastapi import FastAPI, File, Form, Header, HTTPException, Query, Request, Response, UploadFile, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError, field_validator, model_validator
+from typing import AsyncIterator, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+import asyncio
 import base64
+import bisect
+import copy
+import functools
+import hashlib
+import hmac
 import io
+import itertools
+import json
+import logging
+import logging.handlers
+import math
+import os
+import platform
+import queue
+import random
+import signal
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
 import argparse
 import sys
 from pathlib import Path
@@ -42,9 +76,201 @@ except ImportError as e:
 # ============================================================================
 
 MODEL_PATH = "models/best.onnx"  # ONNX model for CPU inference
+
+# Quantized variants written next to MODEL_PATH by
+# scripts/export-onnx-model.py --quantize (e.g. models/best.int8-static.onnx)
+MODEL_VARIANTS = ("fp32", "int8-dynamic", "int8-static")
+MODEL_VARIANT = os.environ.get("MODEL_VARIANT", "fp32")
 PORT = 8000
 HOST = "0.0.0.0"
 
+# Non-Maximum Suppression defaults (overridable per request)
+NMS_IOU_THRESHOLD = 0.5
+NMS_MAX_DETECTIONS = 300
+NMS_BLOCK_SIZE = 256  # Candidates resolved per IoU block
+
+# Maximum images per ort_session.run call when the model has a dynamic batch
+# dimension (bounds the input tensor at ~4.9 MB per 640x640 image)
+MAX_BATCH_SIZE = 8
+
+# Decoding, preprocessing and inference run in a bounded thread pool so the
+# event loop keeps answering / and /health while detections are in progress.
+# This is the number of /detect requests processed concurrently; further
+# requests wait for a free worker. More than one lets the batcher below
+# combine images from concurrent requests.
+INFERENCE_WORKERS = 4
+
+# Admission control: beyond the INFERENCE_WORKERS detection requests being
+# processed, at most MAX_QUEUED_REQUESTS wait for a worker (0 = no limit);
+# further requests are answered 429 before their upload is parsed, with a
+# Retry-After of about one recent request time, instead of queueing until
+# the client gave up anyway.
+# Clients may send their remaining time budget as X-Deadline-Ms (milliseconds
+# from when the server has read the request; REQUEST_DEADLINE_SECONDS applies
+# without the header, 0 = none). A request still queued at its deadline is
+# dropped (504); images not yet decoded or submitted for inference by then
+# are skipped and returned empty with "expired": true (a partial result) if
+# the client also sends X-Allow-Partial: true; such requests run smallest
+# image first in growing chunks, as streams do. Without it, a request that
+# has started runs to completion as one batch.
+MAX_QUEUED_REQUESTS = int(os.environ.get("MAX_QUEUED_REQUESTS", 16))
+REQUEST_DEADLINE_SECONDS = float(os.environ.get("REQUEST_DEADLINE_SECONDS", 0))
+
+# Cross-request micro-batching: preprocessed images from concurrent requests
+# are queued and run together, up to MAX_BATCH_SIZE images or this long after
+# the first queued image. The wait is skipped when no other request is still
+# preprocessing, so a lone request is not delayed.
+BATCH_MAX_WAIT_MS = 10
+
+# Resolution tiers: with a dynamic-shape export (scripts/export-onnx-model.py
+# --dynamic) each request picks its square model input size by "tier" or an
+# explicit "imgsz" (a multiple of IMGSZ_STRIDE within IMGSZ_RANGE). Smaller
+# inputs cost roughly (640 / size)^2 less inference but miss small objects.
+# Models exported with a fixed input size always run at that size.
+RESOLUTION_TIERS = {"speed": 320, "balanced": 480, "accurate": 640}
+DEFAULT_TIER = os.environ.get("DEFAULT_TIER", "accurate")
+IMGSZ_STRIDE = 32  # Largest YOLOv8 feature stride
+IMGSZ_RANGE = (160, 1280)
+
+# Tiled inference (per request "tiled": true): the full-resolution photo is
+# cut into overlapping square tiles of the model input size (neighbours share
+# TILE_OVERLAP of a tile) that run as one batch with a global view of the
+# whole image, so small parts (safety_pin, pin_seal, service_tag) keep their
+# pixels instead of being squashed to 640x640. Images needing more than
+# TILE_MAX_TILES tiles get fewer, larger (downscaled) tiles instead.
+TILE_OVERLAP = 0.2
+TILE_MAX_TILES = 12
+
+# Shell-guided cascade (per request "cascade": true): a first pass at the
+# CASCADE_COARSE_TIER size finds the extinguisher shell; its box, grown by
+# CASCADE_MARGIN of its size on every side, is cropped from the decoded
+# photo and run again at the request's size to find the small parts next to
+# it. Both passes are merged with NMS. Without a shell scoring at least
+# CASCADE_SHELL_CONFIDENCE the second pass runs on the whole frame. JPEGs are
+# decoded large enough that ROIs down to CASCADE_MIN_ROI of the long side
+# still reach model resolution. Fixed-size models run both passes at their
+# own size.
+CASCADE_ROI_CLASS = "shell"
+CASCADE_COARSE_TIER = "speed"
+CASCADE_MARGIN = 0.15
+CASCADE_SHELL_CONFIDENCE = 0.25
+CASCADE_MIN_ROI = 0.3
+
+# Decode JPEGs directly at a reduced resolution (libjpeg DCT scaling by 1/2,
+# 1/4 or 1/8) to the smallest size that still covers the model input, instead
+# of decoding the full photo only to shrink it to 640x640 afterwards
+FAST_JPEG_DECODE = True
+
+# Letterbox padding value (gray 114, as used when training YOLOv8)
+LETTERBOX_PAD_VALUE = 114
+
+# Decoded pixels are copied into a per-thread buffer that is reused for the
+# next image; decodes larger than this get a one-off buffer instead (with
+# FAST_JPEG_DECODE a JPEG decodes to under 4x the model input's pixels)
+PIXEL_BUFFER_MAX_BYTES = 32 * 1024 * 1024
+
+# Images whose header declares more pixels than this are rejected before any
+# pixel data is allocated (0 = no limit). 50 MP covers current phone cameras.
+MAX_IMAGE_PIXELS = 50_000_000
+
+# Detection result cache: an image that was already processed (same bytes,
+# same model and preprocessing) is answered from its stored pre-threshold
+# candidates instead of being run again, for any minConfidence >=
+# CACHE_CANDIDATE_FLOOR. Entries expire after CACHE_TTL_SECONDS; the least
+# recently used are evicted above CACHE_MAX_MB (0 = cache disabled).
+CACHE_MAX_MB = 64
+CACHE_TTL_SECONDS = 3600
+CACHE_CANDIDATE_FLOOR = 0.05
+CACHE_DB_PATH = None  # Optional SQLite file for a cache tier that survives restarts
+
+# ONNX Runtime session options (CLI flags, defaults from environment
+# variables). 0 threads = let ONNX Runtime decide (one per core).
+ORT_INTRA_OP_THREADS = int(os.environ.get("ORT_INTRA_OP_THREADS", 0))
+ORT_INTER_OP_THREADS = int(os.environ.get("ORT_INTER_OP_THREADS", 0))
+ORT_EXECUTION_MODE = os.environ.get("ORT_EXECUTION_MODE", "sequential")  # sequential | parallel
+ORT_GRAPH_OPTIMIZATION = os.environ.get("ORT_GRAPH_OPTIMIZATION", "all")  # disable | basic | extended | all
+ORT_MEMORY_ARENA = os.environ.get("ORT_MEMORY_ARENA", "1") != "0"
+ORT_ALLOW_SPINNING = os.environ.get("ORT_ALLOW_SPINNING", "1") != "0"
+
+# ORT's optimized graph is saved under ORT_CACHE_DIR (default: .ort-cache next
+# to the model) and loaded by later starts and reloads, which then skip graph
+# optimization. Entries are keyed by model hash, ONNX Runtime version,
+# optimization level and CPU (see cpu_fingerprint).
+ORT_CACHE = os.environ.get("ORT_CACHE", "1") != "0"
+ORT_CACHE_DIR = os.environ.get("ORT_CACHE_DIR")
+
+# Blank batches run on every session before a model takes traffic, since the
+# first run of each input shape pays for allocation: "all" = every batch size
+# up to MAX_BATCH_SIZE, "minmax" = 1 and MAX_BATCH_SIZE, "off" = none
+MODEL_WARMUP = os.environ.get("MODEL_WARMUP", "all")
+
+# Startup: the port is bound at once and the model loads in the background.
+# Until it is ready, /detect waits up to MODEL_READY_WAIT_SECONDS for it and
+# /health up to HEALTH_READY_WAIT_SECONDS (under the frontend's 5 s health
+# check) before answering 503. /live and /ready answer immediately.
+MODEL_READY_WAIT_SECONDS = 20.0
+HEALTH_READY_WAIT_SECONDS = 3.0
+
+# Independent sessions over the same model. Each has its own thread pool
+# and the batcher runs up to this many batches at once. Intra-op threads are
+# capped so that sessions x threads does not exceed the available cores.
+# Every session holds its own copy of the weights.
+SESSION_POOL_SIZE = int(os.environ.get("SESSION_POOL_SIZE", 1))
+
+# Pre-fork worker processes sharing one listening socket. The parent
+# optimizes the model once and saves it with its weights in an external data
+# file; ONNX Runtime memory-maps that file in every worker, so all workers
+# share one copy of the weights in the page cache instead of each holding its
+# own. Sessions per worker and intra-op threads are capped against the cores.
+WORKERS = int(os.environ.get("WORKERS", 1))
+WORKER_REPORT_SECONDS = 300  # Interval of the parent's per-worker memory log line
+
+# Hot model reload: POST /admin/reload, or poll the model file every
+# MODEL_WATCH_SECONDS (0 = off) and reload once it has changed and stopped
+# changing. The new version is loaded and warmed up next to the old one, then
+# swapped in; requests already running finish on the old version. With
+# ADMIN_TOKEN set, /admin/* needs a matching X-Admin-Token header; without it
+# only local clients may call /admin/*.
+MODEL_WATCH_SECONDS = float(os.environ.get("MODEL_WATCH_SECONDS", 0))
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+# Live viewfinder WebSocket (/ws/live). Only the newest frame of a session
+# is processed; frames that arrive while it is busy replace the waiting one.
+# Sessions beyond LIVE_MAX_SESSIONS are refused, larger frames are skipped,
+# and each session is sent its frame and drop rates every LIVE_STATS_SECONDS.
+LIVE_MAX_SESSIONS = 4
+LIVE_MAX_FRAME_BYTES = 1_000_000
+LIVE_MAX_DETECTIONS = 50
+LIVE_STATS_SECONDS = 2.0
+
+# Bulk detection jobs (/jobs). Jobs are queued in a local SQLite database
+# (JOB_DB_PATH, unset = job API off) and survive restarts. A background
+# runner claims JOB_BATCH_SIZE images of the oldest job at a time, only while
+# no /detect request is in progress, decodes them on a lower-priority thread
+# and submits them to the batcher behind interactive work. Images may be
+# sent as data URLs or as paths below JOB_IMAGE_ROOT (unset = no paths).
+# Images claimed by a process that died, or longer than JOB_LEASE_SECONDS
+# ago, are queued again; finished jobs are deleted after
+# JOB_RETENTION_SECONDS.
+JOB_DB_PATH = os.environ.get("JOB_DB_PATH")
+JOB_IMAGE_ROOT = os.environ.get("JOB_IMAGE_ROOT")
+JOB_BATCH_SIZE = 32  # Images per claim (their encoded bytes are held in memory)
+JOB_NICENESS = 10  # Added to the runner thread's nice value (Linux)
+JOB_POLL_SECONDS = 0.05  # Runner re-check interval while /detect is busy
+JOB_LEASE_SECONDS = 600.0
+JOB_RETENTION_SECONDS = 7 * 24 * 3600.0
+JOB_RESULTS_PAGE = 1000  # Default (and maximum) results per /jobs/{id}/results page
+JOB_STREAM_POLL_SECONDS = 0.5  # /jobs/{id}/stream check interval for new results
+
+# Logging: records go through a bounded in-memory queue to a background
+# thread that writes them to stdout, so request threads never block on the
+# log stream (records are dropped if the queue is full). Per-image DEBUG
+# lines are sampled at LOG_SAMPLE_RATE.
+LOG_LEVEL = "INFO"
+LOG_FORMAT = "json"  # "json" (one object per line) or "text"
+LOG_SAMPLE_RATE = 0.01
+LOG_QUEUE_SIZE = 10_000
+
 # YOLO class names (must match yoloDetectionMapper.ts expectations)
 CLASS_NAMES = {
     0: "shell",
@@ -56,6 +282,389 @@ CLASS_NAMES = {
     6: "service_tag",     # Changed from "tag"
 }
 
+# ============================================================================
+# LOGGING
+# ============================================================================
+
+logger = logging.getLogger("model_server")
+inference_logger = logging.getLogger("model_server.inference")
+postprocess_logger = logging.getLogger("model_server.postprocess")
+image_logger = logging.getLogger("model_server.image")  # Per-image lines (sampled)
+
+# Attributes every LogRecord has; anything else was passed as `extra`
+LOG_RECORD_FIELDS = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime", "color_message"}
+
+
+class JSONLogFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and `extra` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in LOG_RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextLogFormatter(logging.Formatter):
+    """Human-readable lines with `extra` fields appended as key=value"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        extras = [f"{key}={value}" for key, value in record.__dict__.items() if key not in LOG_RECORD_FIELDS]
+        return f"{line} {' '.join(extras)}" if extras else line
+
+
+class SamplingFilter(logging.Filter):
+    """Pass a random fraction of DEBUG records; INFO and above always pass"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: records are dropped once max_size are queued"""
+
+    def __init__(self, log_queue: queue.SimpleQueue, max_size: int):
+        super().__init__(log_queue)
+        self.max_size = max_size
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only merge the message and render any traceback here; formatting
+        # happens on the listener thread. The record is copied only when the
+        # traceback is dropped, so other handlers still see exc_info.
+        if record.exc_info:
+            record = copy.copy(record)
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+        else:
+            self.queue.put_nowait(record)
+
+
+class DetectionSummary:
+    """Detections rendered for a log line only if the record is actually emitted"""
+
+    def __init__(self, detections: list):
+        self.detections = detections
+
+    def __str__(self) -> str:
+        return ", ".join(f"{det.class_name} {det.confidence:.2%}" for det in self.detections)
+
+
+image_sampler = SamplingFilter(LOG_SAMPLE_RATE)
+image_logger.addFilter(image_sampler)
+postprocess_logger.addFilter(image_sampler)
+
+# Background writer started by configure_logging
+log_listener: Optional[logging.handlers.QueueListener] = None
+log_handler: Optional[DroppingQueueHandler] = None
+
+
+def configure_logging(
+    level: str = LOG_LEVEL,
+    fmt: str = LOG_FORMAT,
+    sample_rate: float = LOG_SAMPLE_RATE,
+    stream=None
+):
+    """Route model_server and uvicorn logs through the non-blocking queue"""
+    global log_listener, log_handler
+
+    shutdown_logging()
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    if fmt == "json":
+        output.setFormatter(JSONLogFormatter())
+    else:
+        output.setFormatter(TextLogFormatter())
+
+    # Process fields are never logged
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    log_handler = DroppingQueueHandler(queue.SimpleQueue(), LOG_QUEUE_SIZE)
+    log_listener = logging.handlers.QueueListener(log_handler.queue, output)
+    logging.getLogger().addHandler(log_handler)
+    logger.setLevel(level.upper())
+    image_sampler.rate = sample_rate
+    log_listener.start()
+
+
+def shutdown_logging():
+    """Flush queued records and detach the queue handler"""
+    global log_listener, log_handler
+
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
+    if log_handler is not None:
+        logging.getLogger().removeHandler(log_handler)
+        log_handler = None
+
+# ============================================================================
+# METRICS
+# ============================================================================
+
+# Pipeline stages timed for every request (Server-Timing header and the
+# model_server_stage_duration_seconds histogram)
+STAGES = ("decode", "cache", "preprocess", "inference", "postprocess", "nms")
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    """Render {name="value",...} with Prometheus label value escaping"""
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metric:
+    """Minimal thread-safe Prometheus metric with at most one label"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, label: Optional[str] = None):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self._lock = threading.Lock()
+        self._values: Dict[Optional[str], float] = {}
+
+    def _labels(self, value: Optional[str]) -> Tuple[Tuple[str, str], ...]:
+        return ((self.label, value),) if self.label is not None else ()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            values = sorted(self._values.items(), key=lambda item: item[0] or "")
+        for label_value, value in values:
+            lines.append(f"{self.name}{format_labels(self._labels(label_value))} {value:g}")
+        return lines
+
+
+class CounterMetric(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, label: Optional[str] = None):
+        with self._lock:
+            self._values[label] = self._values.get(label, 0) + amount
+
+
+class GaugeMetric(Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, label: Optional[str] = None):
+        with self._lock:
+            self._values[label] = self._values.get(label, 0) + amount
+
+    def dec(self, amount: float = 1, label: Optional[str] = None):
+        self.inc(-amount, label)
+
+    def set(self, value: float, label: Optional[str] = None):
+        with self._lock:
+            self._values[label] = value
+
+
+class HistogramMetric(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, label: Optional[str] = None, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, label)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Optional[str], list] = {}  # label -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, label: Optional[str] = None):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = self._series[label] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series_items = sorted(((k, list(v)) for k, v in self._series.items()), key=lambda item: item[0] or "")
+        for label_value, series in series_items:
+            labels = self._labels(label_value)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {series[-1]}")
+        return lines
+
+
+stage_seconds = HistogramMetric(
+    "model_server_stage_duration_seconds", "Time spent per request in each pipeline stage", "stage"
+)
+request_seconds = HistogramMetric(
+    "model_server_request_duration_seconds", "Detection request latency", "endpoint"
+)
+ort_run_seconds = HistogramMetric(
+    "model_server_ort_run_duration_seconds", "Duration of each ONNX Runtime session run"
+)
+requests_total = CounterMetric("model_server_requests_total", "Detection requests handled", "endpoint")
+images_total = CounterMetric("model_server_images_total", "Images received for detection")
+detections_total = CounterMetric("model_server_detections_total", "Detections returned", "class")
+errors_total = CounterMetric("model_server_errors_total", "Failed images and requests", "kind")
+requests_in_flight = GaugeMetric("model_server_requests_in_flight", "Detection requests being processed")
+requests_in_flight.set(0)
+live_frames_total = CounterMetric("model_server_live_frames_total", "Live WebSocket frames by outcome", "result")
+live_sessions = GaugeMetric("model_server_live_sessions", "Open live WebSocket sessions")
+live_sessions.set(0)
+model_reloads_total = CounterMetric("model_server_model_reloads_total", "Model reloads by outcome", "result")
+tiles_total = CounterMetric("model_server_tiles_total", "Tiles run for tiled requests (global views excluded)")
+cascade_rois_total = CounterMetric(
+    "model_server_cascade_rois_total", "Second cascade passes by region (shell ROI or whole frame)", "roi"
+)
+requests_rejected_total = CounterMetric(
+    "model_server_requests_rejected_total", "Detection requests refused at admission", "reason"
+)
+deadline_expired_total = CounterMetric(
+    "model_server_deadline_expired_total",
+    "Work dropped at its deadline (whole queued requests, or single images)", "stage"
+)
+job_images_total = CounterMetric("model_server_job_images_total", "Bulk job images processed by outcome", "result")
+
+METRICS = [
+    stage_seconds, request_seconds, ort_run_seconds, requests_total,
+    images_total, detections_total, errors_total, requests_in_flight,
+    live_frames_total, live_sessions, model_reloads_total, tiles_total, cascade_rois_total,
+    requests_rejected_total, deadline_expired_total, job_images_total,
+]
+
+
+class StageTimer:
+    """Accumulates wall time per pipeline stage for one request
+
+    lap(stage) charges the time since the previous lap (or mark) to stage.
+    STAGES are always reported; other stages (e.g. the cascade's
+    coarse_inference and refine_inference) only once they are used.
+    """
+
+    __slots__ = ("durations", "_last", "_start")
+
+    def __init__(self):
+        self.durations = dict.fromkeys(STAGES, 0.0)
+        self._start = self._last = time.perf_counter()
+
+    def mark(self):
+        self._last = time.perf_counter()
+
+    def lap(self, stage: str):
+        now = time.perf_counter()
+        self.durations[stage] = self.durations.get(stage, 0.0) + now - self._last
+        self._last = now
+
+    def total(self) -> float:
+        return time.perf_counter() - self._start
+
+    def server_timing(self) -> str:
+        """Server-Timing header value (milliseconds per stage)"""
+        parts = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in self.durations.items()]
+        parts.append(f"total;dur={self.total() * 1000:.2f}")
+        return ", ".join(parts)
+
+
+def record_stage_metrics(timer: StageTimer):
+    for stage, seconds in timer.durations.items():
+        stage_seconds.observe(seconds, stage)
+
+
+@contextmanager
+def request_metrics(endpoint: str):
+    """Count, time and track in-flight state of one detection request"""
+    requests_in_flight.inc()
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        errors_total.inc(label="request")
+        raise
+    finally:
+        requests_in_flight.dec()
+        requests_total.inc(label=endpoint)
+        request_seconds.observe(time.perf_counter() - start, endpoint)
+
+
+def render_metrics() -> str:
+    """All metrics in Prometheus text exposition format"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+
+    if inference_batcher is not None:
+        batching = inference_batcher.stats()
+        lines += [
+            "# HELP model_server_batch_queue_depth Images waiting for the inference batcher",
+            "# TYPE model_server_batch_queue_depth gauge",
+            f"model_server_batch_queue_depth {batching['queue_depth']}",
+            "# HELP model_server_batches_total Inference batches run",
+            "# TYPE model_server_batches_total counter",
+            f"model_server_batches_total {batching['batches']}",
+        ]
+
+    if detection_cache is not None:
+        cache = detection_cache.stats()
+        lines += [
+            "# HELP model_server_cache_lookups_total Detection cache lookups by result",
+            "# TYPE model_server_cache_lookups_total counter",
+        ]
+        for result in ("hits", "disk_hits", "misses", "coalesced"):
+            lines.append(f'model_server_cache_lookups_total{{result="{result}"}} {cache[result]}')
+        lines += [
+            "# HELP model_server_cache_entries Entries in the in-memory detection cache",
+            "# TYPE model_server_cache_entries gauge",
+            f"model_server_cache_entries {cache['entries']}",
+            "# HELP model_server_cache_bytes Approximate size of the in-memory detection cache",
+            "# TYPE model_server_cache_bytes gauge",
+            f"model_server_cache_bytes {cache['bytes']}",
+        ]
+
+    memory = process_memory()
+    if memory:
+        lines += [
+            "# HELP model_server_process_memory_bytes Memory of this worker process (pss splits shared pages)",
+            "# TYPE model_server_process_memory_bytes gauge",
+        ]
+        for kind, mb in memory.items():
+            lines.append(f'model_server_process_memory_bytes{{kind="{kind[:-3]}"}} {int(mb * 1024 * 1024)}')
+
+    return "\n".join(lines) + "\n"
+
 # ============================================================================
 # DATA MODELS
 # ============================================================================
@@ -69,6 +678,34 @@ class DetectionRequest(BaseModel):
     images: List[ImageData]
     extinguisherInfo: Optional[dict] = {}
     minConfidence: Optional[float] = 0.5
+    iouThreshold: Optional[float] = NMS_IOU_THRESHOLD
+    maxDetections: Optional[int] = NMS_MAX_DETECTIONS
+    classAgnosticNms: Optional[bool] = False  # True = suppress across classes
+    tier: Optional[str] = None  # speed | balanced | accurate (default DEFAULT_TIER)
+    imgsz: Optional[int] = None  # Explicit square input size, overrides tier
+    tiled: Optional[bool] = False  # True = full-resolution tiles plus a global view (see TILE_MAX_TILES)
+    cascade: Optional[bool] = False  # True = coarse shell pass, then the shell region at full size (see CASCADE_MARGIN)
+
+    @field_validator("tier")
+    @classmethod
+    def check_tier(cls, tier: Optional[str]) -> Optional[str]:
+        if tier is not None and tier not in RESOLUTION_TIERS:
+            raise ValueError(f"tier must be one of {', '.join(RESOLUTION_TIERS)}")
+        return tier
+
+    @field_validator("imgsz")
+    @classmethod
+    def check_imgsz(cls, imgsz: Optional[int]) -> Optional[int]:
+        low, high = IMGSZ_RANGE
+        if imgsz is not None and (imgsz % IMGSZ_STRIDE or not low <= imgsz <= high):
+            raise ValueError(f"imgsz must be a multiple of {IMGSZ_STRIDE} between {low} and {high}")
+        return imgsz
+
+    @model_validator(mode="after")
+    def check_mode(self) -> "DetectionRequest":
+        if self.tiled and self.cascade:
+            raise ValueError("tiled and cascade cannot be combined")
+        return self
 
 class Detection(BaseModel):
     class_name: str
@@ -78,12 +715,91 @@ class Detection(BaseModel):
 class ImageResult(BaseModel):
     stepId: str
     detections: List[Detection]
+    expired: bool = False  # Skipped at the request deadline (not run, detections empty)
 
 class DetectionResponse(BaseModel):
     success: bool
     results: List[ImageResult]
+    imgsz: Optional[int] = None  # Model input size the images ran at
+    partial: bool = False  # Some images expired at the request deadline
+    error: Optional[str] = None
+
+class StreamResult(ImageResult):
+    """One NDJSON line of /detect/stream: an image's result as soon as it is done"""
+    type: str = "result"
+    index: int  # Position of the image in the request
+
+class ReloadRequest(BaseModel):
+    path: Optional[str] = None  # Model file to load (default: the configured model)
+    force: bool = False  # Reload even if the file is unchanged
+
+class StreamSummary(BaseModel):
+    """Last NDJSON line of /detect/stream"""
+    type: str = "summary"
+    success: bool
+    images: int
+    detections: int
+    expired: int = 0  # Images skipped at the request deadline
+    imgsz: Optional[int] = None
+    time_to_first_result_ms: Optional[float] = None
+    duration_ms: float
+    stages_ms: Dict[str, float]
+    error: Optional[str] = None
+
+class JobImage(BaseModel):
+    stepId: str
+    dataUrl: Optional[str] = None  # The image itself, or
+    path: Optional[str] = None  # a file below JOB_IMAGE_ROOT, read when the job runs
+
+    @model_validator(mode="after")
+    def check_source(self) -> "JobImage":
+        if (self.dataUrl is None) == (self.path is None):
+            raise ValueError("each image needs exactly one of dataUrl or path")
+        return self
+
+class JobRequest(DetectionRequest):
+    """POST /jobs: images plus the detection options of DetectionRequest"""
+    images: List[JobImage]
+
+class JobStatus(BaseModel):
+    type: str = "job"
+    id: str
+    status: str  # queued | running | done | cancelled
+    images: int
+    completed: int  # Images with a result (failed included)
+    failed: int  # Images that could not be read
+    created: float
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    images_per_second: Optional[float] = None
+
+class JobResult(StreamResult):
+    """One image of a job; seq numbers results in the order they were written"""
+    seq: int
     error: Optional[str] = None
 
+class JobResults(BaseModel):
+    job: JobStatus
+    results: List[JobResult]
+    next: int  # Pass as `after` for the following page
+
+class Candidates(NamedTuple):
+    """Pre-NMS detections for one image, already in image coordinates"""
+    boxes: np.ndarray  # [N, 4] float32 x1, y1, x2, y2
+    scores: np.ndarray  # [N] float32
+    class_ids: np.ndarray  # [N] int
+
+class Letterbox(NamedTuple):
+    """Where an image sits in the model input: model_xy = image_xy * scale + pad
+
+    Scales are relative to the uploaded image size, so they also cover any
+    reduced-resolution decode.
+    """
+    scale_x: float
+    scale_y: float
+    pad_x: float
+    pad_y: float
+
 # ============================================================================
 # LIFESPAN HANDLER
 # ============================================================================
@@ -91,14 +807,198 @@ class DetectionResponse(BaseModel):
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan event handler - load model on startup"""
-    try:
-        load_model(MODEL_PATH)
-    except Exception as e:
-        print(f"❌ Failed to load model: {e}")
-        print("   Server will start but /detect will fail until model is loaded")
+    global inference_executor, inference_batcher, detection_cache, admission, job_queue
+    global model_ready, startup_status, startup_error
+
+    # The port is bound as soon as this yields; the model loads meanwhile
+    # (the status is reset here, not in the loader, so /ready never reports
+    # a previous run of the app in this process)
+    model_ready = asyncio.Event()
+    startup_status, startup_error = "loading", None
+    loader = threading.Thread(
+        target=load_model_at_startup, args=(asyncio.get_running_loop(),), name="model-loader", daemon=True
+    )
+    loader.start()
+    pixel_paste_works()  # Logs now if preprocessing falls back to np.asarray
+
+    if CACHE_MAX_MB > 0:
+        detection_cache = DetectionCache(
+            int(CACHE_MAX_MB * 1024 * 1024),
+            CACHE_TTL_SECONDS,
+            CACHE_DB_PATH
+        )
+
+    inference_executor = ThreadPoolExecutor(
+        max_workers=INFERENCE_WORKERS,
+        thread_name_prefix="inference"
+    )
+    admission = AdmissionControl(INFERENCE_WORKERS, MAX_QUEUED_REQUESTS)
+    # Sized for the configured pool; activate_model sets the model's batch size
+    inference_batcher = InferenceBatcher(
+        MAX_BATCH_SIZE if model_batch_size is None else model_batch_size,
+        BATCH_MAX_WAIT_MS / 1000,
+        workers=max(1, SESSION_POOL_SIZE)
+    )
+    inference_batcher.start()
+    background_stop = threading.Event()
+    watcher = None
+    if MODEL_WATCH_SECONDS > 0:
+        watcher = threading.Thread(
+            target=watch_model_file, args=(MODEL_WATCH_SECONDS, background_stop), name="model-watch", daemon=True
+        )
+        watcher.start()
+    job_runner = None
+    if JOB_DB_PATH:
+        job_queue = JobQueue(JOB_DB_PATH)
+        job_runner = threading.Thread(target=run_jobs, args=(job_queue, background_stop), name="job-runner", daemon=True)
+        job_runner.start()
     yield
-    # Cleanup on shutdown (if needed)
-    print("🛑 Shutting down server...")
+    # Cleanup on shutdown
+    logger.info("🛑 Shutting down server...")
+    background_stop.set()
+    if watcher is not None:
+        watcher.join()
+    if job_runner is not None:
+        job_queue.wakeup.set()
+        job_runner.join()
+    loader.join()
+    inference_executor.shutdown(wait=True, cancel_futures=True)
+    inference_executor = None
+    admission = None
+    inference_batcher.stop()
+    inference_batcher = None
+    if detection_cache is not None:
+        detection_cache.close()
+        detection_cache = None
+    if job_queue is not None:
+        job_queue.close()
+        job_queue = None
+
+# ============================================================================
+# ADMISSION CONTROL
+# ============================================================================
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed before an inference worker picked it up"""
+
+
+class AdmissionTicket:
+    """An admitted request's place in AdmissionControl (releasing twice is a no-op)"""
+
+    __slots__ = ("control", "start", "released")
+
+    def __init__(self, control: "AdmissionControl"):
+        self.control = control
+        self.start = time.perf_counter()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.control.finished(time.perf_counter() - self.start)
+
+    def __enter__(self) -> "AdmissionTicket":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class AdmissionControl:
+    """Bounded queue of detection requests in front of the inference pool
+
+    Up to `workers` admitted requests are processed while up to `max_queued`
+    more wait for a worker; admit() refuses anything beyond that. The
+    suggested Retry-After is the moving average time of recent admitted
+    requests, queueing included - about how long a full queue takes to turn
+    over. Only used on the event loop, so there is no lock.
+    """
+
+    def __init__(self, workers: int, max_queued: int):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.admitted = 0
+        self.request_seconds: Optional[float] = None
+
+    @property
+    def capacity(self) -> Optional[int]:
+        return self.workers + self.max_queued if self.max_queued > 0 else None
+
+    def admit(self) -> Optional[AdmissionTicket]:
+        """A ticket to release once the request is done (None = queue full)"""
+        capacity = self.capacity
+        if capacity is not None and self.admitted >= capacity:
+            requests_rejected_total.inc(label="queue_full")
+            return None
+        self.admitted += 1
+        return AdmissionTicket(self)
+
+    def finished(self, seconds: float):
+        self.admitted -= 1
+        if self.request_seconds is None:
+            self.request_seconds = seconds
+        else:
+            self.request_seconds += 0.2 * (seconds - self.request_seconds)
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.request_seconds or 0))
+
+    def stats(self) -> dict:
+        return {
+            "admitted": self.admitted,
+            "waiting": max(0, self.admitted - self.workers),
+            "capacity": self.capacity,
+            "request_ms": round(self.request_seconds * 1000, 2) if self.request_seconds is not None else None,
+        }
+
+
+class AdmissionMiddleware:
+    """Admits /detect* requests into the bounded queue before their bodies are read
+
+    A full queue is answered 429 without parsing the upload (it is still
+    read and discarded: answering mid-upload would reset the connection, and
+    the client would never see the 429). The place is held until the
+    response (streams included) is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or admission is None or not scope["path"].startswith("/detect"):
+            await self.app(scope, receive, send)
+            return
+        ticket = admission.admit()
+        if ticket is None:
+            while (message := await receive())["type"] == "http.request" and message.get("more_body"):
+                pass
+            response = JSONResponse(
+                {"detail": f"Detection queue full ({admission.admitted} requests in progress or waiting)"},
+                status_code=429,
+                headers={"Retry-After": str(admission.retry_after())}
+            )
+            await response(scope, receive, send)
+            return
+        with ticket:
+            await self.app(scope, receive, send)
+
+
+def request_deadline(deadline_ms: Optional[float]) -> Optional[float]:
+    """time.monotonic() deadline of a request with this X-Deadline-Ms budget (None = no deadline)"""
+    if deadline_ms is None:
+        return time.monotonic() + REQUEST_DEADLINE_SECONDS if REQUEST_DEADLINE_SECONDS > 0 else None
+    return time.monotonic() + deadline_ms / 1000
+
+
+def deadline_passed(deadline: Optional[float]) -> bool:
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def check_deadline(deadline: Optional[float]):
+    """Drop a request whose deadline passed while it waited for a worker"""
+    if deadline_passed(deadline):
+        deadline_expired_total.inc(label="request")
+        raise DeadlineExceeded("Deadline exceeded before processing started")
 
 # ============================================================================
 # FASTAPI APP
@@ -111,6 +1011,9 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Bounded /detect queue (added first so CORS headers also cover its 429s)
+app.add_middleware(AdmissionMiddleware)
+
 # Enable CORS
 app.add_middleware(
     CORSMiddleware,
@@ -120,18 +1023,120 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global model variables
-ort_session = None
+# Global model variables. The active ModelVersion; the names below mirror
+# its fields for code that only needs the current model.
+active_model: Optional["ModelVersion"] = None
+model_lock = threading.Lock()  # Guards active_model and every ModelVersion.in_flight
+reload_lock = threading.Lock()  # One reload at a time
+pinned_models = threading.local()  # Model version pinned by the current thread (see pin_model)
+model_generations = 0  # Versions loaded so far (ModelVersion.generation)
+ort_session = None  # First session of the pool (model metadata, loaded check)
+session_pool: Optional[queue.Queue] = None  # Idle sessions, checked out per run
+session_config: dict = {}  # Active session options (reported on /health)
 input_name = None
 input_shape = None
+model_batch_size = 1  # None = dynamic batch dimension, N = fixed batch of N
+model_version = None  # Content hash of the loaded model file
+shared_model_path: Optional[str] = None  # Pre-optimized model with mmap'd weights, set before forking workers
+worker_id: Optional[int] = None  # Index of this pre-forked worker (None = single process)
+
+# Detection result cache (created in lifespan unless disabled)
+detection_cache = None
+
+# Bounded worker pool for blocking inference work (created in lifespan)
+inference_executor: Optional[ThreadPoolExecutor] = None
+
+# Bounded queue of detection requests in front of the pool (created in lifespan)
+admission: Optional["AdmissionControl"] = None
+
+# Cross-request batching scheduler in front of ort_session (created in lifespan)
+inference_batcher = None
+
+# Durable bulk job queue (created in lifespan if JOB_DB_PATH is set)
+job_queue: Optional["JobQueue"] = None
+
+# Per-thread reusable preprocessing buffers (see preprocess_buffers)
+thread_buffers = threading.local()
+
+# Whether decoded_pixels can paste into a buffer-backed image on this Pillow
+# (None = not checked yet, see pixel_paste_works)
+pixel_paste_ok: Optional[bool] = None
+
+# Open /ws/live sessions (only touched on the event loop)
+open_live_sessions: set = set()
+
+# Background model load at startup (see load_model_at_startup)
+startup_status = "starting"  # starting | loading | warming_up | ready | failed
+startup_error: Optional[str] = None
+startup_report: Dict[str, float] = {}  # Seconds from lifespan start per startup step
+model_ready: Optional[asyncio.Event] = None  # Set once the startup load finished (or failed)
 
 # ============================================================================
 # HELPER FUNCTIONS
 # ============================================================================
 
+class ReloadInProgress(RuntimeError):
+    """Another model reload is still running"""
+
+
+class ModelVersion:
+    """One loaded model file: its session pool plus input and batch metadata
+
+    Requests pin the version that was active when they started (pin_model),
+    so a reload can swap in a new version without changing the model under a
+    running request. A replaced version is closed once its last pinned
+    request has finished.
+    """
+
+    def __init__(self, path: str, model_hash: str, generation: int, sessions: list, config: dict):
+        self.path = path
+        self.generation = generation
+        self.hash = model_hash
+        self.session_config = config
+        self.sessions: queue.Queue = queue.Queue()
+        for session in sessions:
+            self.sessions.put(session)
+        self.ort_session = sessions[0]
+        self.input_name = self.ort_session.get_inputs()[0].name
+        self.input_shape = self.ort_session.get_inputs()[0].shape
+        # Batch support: a symbolic/None first dim means any batch size,
+        # an integer N means the graph was exported for exactly N images
+        batch_dim = self.input_shape[0] if self.input_shape else 1
+        self.batch_size = batch_dim if isinstance(batch_dim, int) and batch_dim > 0 else None
+        self.loaded_at = time.time()
+        self.in_flight = 0  # Pinned requests (guarded by model_lock)
+        self.retired = False
+
+    def info(self) -> dict:
+        return {
+            "version": self.generation,
+            "hash": self.hash,
+            "path": self.path,
+            "loaded_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.loaded_at)),
+            "input_size": "dynamic" if model_has_dynamic_size(self) else list(model_input_size(self)),
+        }
+
+    def close(self):
+        """Drop the sessions so ONNX Runtime frees them"""
+        while True:
+            try:
+                self.sessions.get_nowait()
+            except queue.Empty:
+                break
+        self.ort_session = None
+        logger.info("🗑️  Model version %d released", self.generation, extra={"model_hash": self.hash})
+
+
 def load_model(model_path: str):
-    """Load ONNX model using onnxruntime"""
-    global ort_session, input_name, input_shape
+    """Load an ONNX model and make it the active version"""
+    # A pre-forked worker's first load maps the parent's pre-optimized model
+    activate_model(create_model_version(
+        model_path, shared_model_path if active_model is None else None
+    ))
+
+def create_model_version(model_path: str, shared_path: Optional[str] = None) -> ModelVersion:
+    """Load an ONNX model file into a new (not yet active) ModelVersion"""
+    global model_generations
 
     if not Path(model_path).exists():
         raise FileNotFoundError(
@@ -139,28 +1144,63 @@ def load_model(model_path: str):
             f"Please ensure your trained ONNX model is in the correct location."
         )
 
-    print(f"📦 Loading ONNX model: {model_path}")
+    logger.info("📦 Loading ONNX model: %s", model_path)
+    model_hash = model_file_hash(model_path)
 
-    # Create ONNX runtime session (CPU only)
-    ort_session = ort.InferenceSession(
-        model_path,
-        providers=['CPUExecutionProvider']
-    )
+    # Create ONNX runtime sessions (CPU only)
+    sess_options, config = session_options()
+    model_source = model_path
+    if shared_path is not None:
+        # Pre-forked worker: the parent already optimized the graph, and the
+        # weights are mapped from its external data file rather than copied
+        sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        config["shared_weights"] = True
+        model_source = shared_path
+    else:
+        cached = optimized_model_cache(model_path, model_hash)
+        if cached is not None:
+            sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+            config["optimized_graph"] = cached
+            model_source = cached
+    sessions = [
+        ort.InferenceSession(
+            model_source,
+            sess_options=sess_options,
+            providers=['CPUExecutionProvider']
+        )
+        for _ in range(config["pool_size"])
+    ]
+    with model_lock:
+        model_generations += 1
+        generation = model_generations
+    model = ModelVersion(model_path, model_hash, generation, sessions, config)
 
-    # Get input details
-    input_name = ort_session.get_inputs()[0].name
-    input_shape = ort_session.get_inputs()[0].shape
-    
     # Get output details
-    output_info = ort_session.get_outputs()[0]
+    output_info = model.ort_session.get_outputs()[0]
     output_shape = output_info.shape
     output_name = output_info.name
 
-    print(f"✅ Model loaded successfully!")
-    print(f"   Input name: {input_name}")
-    print(f"   Input shape: {input_shape}")
-    print(f"   Output name: {output_name}")
-    print(f"   Output shape: {output_shape}")
+    if model.batch_size is None and MAX_BATCH_SIZE > 1 and not model_runs_batches(model):
+        model.batch_size = 1
+    if model.batch_size is None:
+        batching = f"dynamic (up to {MAX_BATCH_SIZE} images per run)"
+    elif model.batch_size > 1:
+        batching = f"fixed batch of {model.batch_size}"
+    else:
+        batching = "not supported (one image per run)"
+    logger.info(
+        "✅ Model loaded successfully!",
+        extra={
+            "model_version": model.generation,
+            "model_hash": model.hash,
+            "sessions": config,
+            "input_name": model.input_name,
+            "input_shape": model.input_shape,
+            "batching": batching,
+            "output_name": output_name,
+            "output_shape": output_shape,
+        }
+    )
     
     # Analyze expected class count from output shape
     # YOLOv8 format: [1, num_classes+4, num_predictions]
@@ -177,77 +1217,700 @@ def load_model(model_path: str):
                 num_classes_in_model = dim2 - 4
                 
             expected_classes = len(CLASS_NAMES)
-            print(f"   Model classes: {num_classes_in_model} (expected: {expected_classes})")
+            logger.info("   Model classes: %d (expected: %d)", num_classes_in_model, expected_classes)
             
             if num_classes_in_model != expected_classes:
-                print(f"   ⚠️  WARNING: Class count mismatch!")
-                print(f"      Model has {num_classes_in_model} classes but CLASS_NAMES has {expected_classes}")
-                print(f"      Update CLASS_NAMES dict if your model has different classes")
+                logger.warning(
+                    "⚠️  Class count mismatch: model has %d classes but CLASS_NAMES has %d. "
+                    "Update CLASS_NAMES dict if your model has different classes",
+                    num_classes_in_model, expected_classes
+                )
     
-    print(f"   Expected classes: {list(CLASS_NAMES.values())}")
+    logger.info("   Expected classes: %s", list(CLASS_NAMES.values()))
 
-def decode_base64_image(data_url: str) -> Image.Image:
-    """Decode base64 data URL to PIL Image"""
+    return model
+
+def activate_model(model: ModelVersion) -> Optional[ModelVersion]:
+    """Make `model` the active version; returns the version it replaced"""
+    global active_model, ort_session, session_pool, session_config, input_name, input_shape, model_batch_size, model_version
+
+    with model_lock:
+        previous, active_model = active_model, model
+        ort_session = model.ort_session
+        session_pool = model.sessions
+        session_config = model.session_config
+        input_name = model.input_name
+        input_shape = model.input_shape
+        model_batch_size = model.batch_size
+        model_version = model.hash
+        close_previous = False
+        if previous is not None:
+            previous.retired = True
+            close_previous = previous.in_flight == 0
+    if inference_batcher is not None:
+        inference_batcher.max_batch_size = MAX_BATCH_SIZE if model.batch_size is None else model.batch_size
+    if close_previous:
+        previous.close()
+    return previous
+
+def current_model() -> Optional[ModelVersion]:
+    """The model version pinned by this thread, else the active one"""
+    return getattr(pinned_models, "model", None) or active_model
+
+@contextmanager
+def pin_model(model: Optional[ModelVersion] = None):
+    """Run the block on one model version (default: the active one) even if a reload swaps it out"""
+    with model_lock:
+        model = model or active_model
+        if model is None:
+            raise RuntimeError("Model not loaded")
+        model.in_flight += 1
+    outer = getattr(pinned_models, "model", None)
+    pinned_models.model = model
     try:
-        # Handle data URL format: "data:image/jpeg;base64,/9j/4AAQ..."
-        if ',' in data_url:
-            base64_data = data_url.split(',', 1)[1]
-        else:
-            base64_data = data_url
+        yield model
+    finally:
+        pinned_models.model = outer
+        with model_lock:
+            model.in_flight -= 1
+            close = model.retired and model.in_flight == 0
+        if close:
+            model.close()
 
-        # Decode base64
-        img_bytes = base64.b64decode(base64_data)
+def warmup_batch_sizes(model: ModelVersion) -> List[int]:
+    """Batch sizes MODEL_WARMUP runs before `model` takes traffic"""
+    if MODEL_WARMUP == "off":
+        return []
+    if model.batch_size is not None:
+        return [model.batch_size]  # Fixed-batch graphs always run (padded) at this size
+    if MODEL_WARMUP == "minmax":
+        return sorted({1, MAX_BATCH_SIZE})
+    return list(range(1, MAX_BATCH_SIZE + 1))
 
-        # Convert to PIL Image
-        image = Image.open(io.BytesIO(img_bytes))
+def warmup_input_sizes(model: ModelVersion) -> List[Tuple[int, int]]:
+    """(height, width) input sizes requests can run `model` at (every tier on dynamic-size models)"""
+    if not model_has_dynamic_size(model):
+        return [model_input_size(model)]
+    return [(size, size) for size in sorted(set(RESOLUTION_TIERS.values()))]
 
-        # Convert to RGB if needed
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+def model_runs_batches(model: ModelVersion) -> bool:
+    """Whether a model declaring a dynamic batch dimension really runs a batch (one trial run of two blank images)
 
-        return image
+    Some exports mark the batch dimension dynamic but hard-code 1 inside
+    the graph (e.g. in a Reshape); those are run one image per run.
+    """
+    height, width = model_input_size(model)
+    try:
+        output = model.ort_session.run(None, {model.input_name: np.zeros((2, 3, height, width), dtype=np.float32)})[0]
     except Exception as e:
-        raise ValueError(f"Failed to decode image: {str(e)}")
-
-def preprocess_image(image: Image.Image, input_shape: tuple) -> np.ndarray:
-    """Preprocess image for YOLO ONNX model"""
-    # Get target size from model input shape (typically [1, 3, 640, 640])
-    target_height = input_shape[2] if len(input_shape) > 2 else 640
-    target_width = input_shape[3] if len(input_shape) > 3 else 640
+        logger.warning("⚠️  Dynamic batch dimension, but a batch of 2 failed (%s) - running one image per run", e)
+        return False
+    if output.shape[0] != 2:
+        logger.warning("⚠️  Dynamic batch dimension, but a batch of 2 returned %d outputs - running one image per run", output.shape[0])
+        return False
+    return True
 
-    # Convert PIL to numpy array
-    img_array = np.array(image)
+def warm_up_model(model: ModelVersion):
+    """Run blank batches of every warm-up size on each session of a new (idle) version"""
+    sizes = warmup_batch_sizes(model)
+    input_sizes = warmup_input_sizes(model) if sizes else []
+    sessions = [model.sessions.get() for _ in range(model.sessions.qsize())]
+    try:
+        for session in sessions:
+            for height, width in input_sizes:
+                for size in sizes:
+                    session.run(None, {model.input_name: np.zeros((size, 3, height, width), dtype=np.float32)})
+    finally:
+        for session in sessions:
+            model.sessions.put(session)
 
-    # Resize image
-    img_resized = cv2.resize(img_array, (target_width, target_height))
+def reload_model(model_path: Optional[str] = None, force: bool = False) -> dict:
+    """Load, warm up and swap in a model file (default: the configured one)
 
-    # Convert BGR to RGB if needed
-    if len(img_resized.shape) == 3 and img_resized.shape[2] == 3:
-        img_resized = cv2.cvtColor(img_resized, cv2.COLOR_BGR2RGB)
+    Blocking; runs next to the active version, which keeps serving until the
+    swap. An unchanged file (same hash) is not reloaded unless `force`.
+    Raises ReloadInProgress if another reload is already running.
+    """
+    if not reload_lock.acquire(blocking=False):
+        raise ReloadInProgress("A model reload is already in progress")
+    try:
+        model_path = model_path or model_variant_path(MODEL_PATH, MODEL_VARIANT)
+        previous = active_model
+        if not force and previous is not None and Path(model_path).exists() and model_file_hash(model_path) == previous.hash:
+            model_reloads_total.inc(label="unchanged")
+            return {"reloaded": False, "model": previous.info()}
 
-    # Normalize to [0, 1]
-    img_normalized = img_resized.astype(np.float32) / 255.0
+        start = time.perf_counter()
+        try:
+            model = create_model_version(model_path)
+            warm_up_model(model)
+        except Exception:
+            model_reloads_total.inc(label="failed")
+            raise
+        activate_model(model)
+        seconds = time.perf_counter() - start
+        model_reloads_total.inc(label="success")
+        logger.info(
+            "🔄 Model version %d active", model.generation,
+            extra={"model": model.info(), "previous": previous.info() if previous else None, "seconds": round(seconds, 2)}
+        )
+        return {
+            "reloaded": True,
+            "model": model.info(),
+            "previous": previous.info() if previous else None,
+            "seconds": round(seconds, 3),
+        }
+    finally:
+        reload_lock.release()
 
-    # Transpose to [C, H, W]
-    img_transposed = np.transpose(img_normalized, (2, 0, 1))
+def load_model_at_startup(loop: asyncio.AbstractEventLoop):
+    """Load, warm up and activate the configured model while the server already accepts connections"""
+    global startup_status, startup_error
 
-    # Add batch dimension [1, C, H, W]
-    img_batch = np.expand_dims(img_transposed, axis=0)
+    start = time.perf_counter()
+    model_path = model_variant_path(MODEL_PATH, MODEL_VARIANT)
+    try:
+        startup_status = "loading"
+        model = create_model_version(model_path, shared_model_path)
+        loaded = time.perf_counter()
+        startup_report["load_s"] = round(loaded - start, 3)
+        startup_status = "warming_up"
+        warm_up_model(model)
+        startup_report["warmup_s"] = round(time.perf_counter() - loaded, 3)
+        activate_model(model)
+        startup_report["time_to_ready_s"] = round(time.perf_counter() - start, 3)
+        startup_status = "ready"
+        logger.info(
+            "🚀 Ready in %.2f s", startup_report["time_to_ready_s"],
+            extra={
+                "startup": startup_report,
+                "warmup_batch_sizes": warmup_batch_sizes(model),
+                "optimized_graph": "shared" if shared_model_path else model.session_config.get("optimized_graph"),
+                "worker": worker_id,
+                "pid": os.getpid(),
+                "memory": process_memory(),
+            }
+        )
+    except Exception as e:
+        startup_status = "failed"
+        startup_error = str(e)
+        logger.error("❌ Failed to load model: %s", e)
+        logger.error("   Server will start but /detect will fail until model is loaded")
+    finally:
+        try:
+            loop.call_soon_threadsafe(model_ready.set)
+        except RuntimeError:
+            pass  # Event loop already closed (shutdown during startup)
 
-    return img_batch
+async def require_model(timeout: Optional[float] = None):
+    """Wait up to `timeout` (default MODEL_READY_WAIT_SECONDS) for a model still loading; 503 if none"""
+    if ort_session is not None:
+        return
+    if model_ready is not None and not model_ready.is_set():
+        try:
+            await asyncio.wait_for(model_ready.wait(), MODEL_READY_WAIT_SECONDS if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            pass
+    if ort_session is None:
+        if startup_status in ("failed", "ready"):
+            raise HTTPException(status_code=503, detail="Model not loaded")
+        raise HTTPException(status_code=503, detail="Model still loading", headers={"Retry-After": "1"})
 
-def sigmoid(x: np.ndarray) -> np.ndarray:
-    """Apply sigmoid activation to convert logits to probabilities"""
-    # Clip to avoid overflow in exp
-    x = np.clip(x, -500, 500)
-    return 1 / (1 + np.exp(-x))
+def model_file_state(model_path: str) -> Optional[Tuple[float, int]]:
+    """(mtime, size) of a model file, or None if it is missing"""
+    try:
+        stat = os.stat(model_path)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
 
+def watch_model_file(interval: float, stop: threading.Event):
+    """Reload the configured model whenever its file changes (polling)
 
-def postprocess_detections(
+    A change whose reload fails, or that arrives while another reload is
+    running, is retried every interval until it is loaded or the file
+    changes again (a failure is logged once per file state).
+    """
+    model_path = model_variant_path(MODEL_PATH, MODEL_VARIANT)
+    loaded_state = model_file_state(model_path)
+    failed_state = None
+    while not stop.wait(interval):
+        state = model_file_state(model_path)
+        if state is None or state == loaded_state:
+            continue
+        # Wait until the file stops changing (a copy may still be in progress)
+        if stop.wait(interval) or model_file_state(model_path) != state:
+            continue
+        if state != failed_state:
+            logger.info("👀 Model file changed: %s", model_path)
+        try:
+            reload_model(model_path)
+        except ReloadInProgress:
+            continue
+        except Exception as e:
+            if state != failed_state:
+                logger.error("❌ Model reload failed, keeping the current version (will retry): %s", e)
+            failed_state = state
+            continue
+        loaded_state = state
+        failed_state = None
+
+def available_cores() -> int:
+    """CPU cores this process may run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def session_options() -> Tuple["ort.SessionOptions", dict]:
+    """SessionOptions from the ORT_* settings, plus a summary for /health"""
+    cores = available_cores()
+    pool_size = max(1, SESSION_POOL_SIZE)
+    parallel_sessions = pool_size * max(1, WORKERS)
+    intra_threads = ORT_INTRA_OP_THREADS
+    if parallel_sessions > 1 and (intra_threads <= 0 or intra_threads * parallel_sessions > cores):
+        capped = max(1, cores // parallel_sessions)
+        if intra_threads > 0:
+            logger.warning(
+                "⚠️  %d sessions x %d threads exceeds %d cores - using %d threads per session",
+                parallel_sessions, intra_threads, cores, capped
+            )
+        intra_threads = capped
+
+    execution_modes = {
+        "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+        "parallel": ort.ExecutionMode.ORT_PARALLEL,
+    }
+    optimization_levels = {
+        "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+    }
+    if ORT_EXECUTION_MODE not in execution_modes:
+        raise ValueError(f"Unknown ORT execution mode: {ORT_EXECUTION_MODE}")
+    if ORT_GRAPH_OPTIMIZATION not in optimization_levels:
+        raise ValueError(f"Unknown ORT graph optimization level: {ORT_GRAPH_OPTIMIZATION}")
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = max(0, intra_threads)
+    options.inter_op_num_threads = max(0, ORT_INTER_OP_THREADS)
+    options.execution_mode = execution_modes[ORT_EXECUTION_MODE]
+    options.graph_optimization_level = optimization_levels[ORT_GRAPH_OPTIMIZATION]
+    options.enable_cpu_mem_arena = ORT_MEMORY_ARENA
+    spinning = "1" if ORT_ALLOW_SPINNING else "0"
+    options.add_session_config_entry("session.intra_op.allow_spinning", spinning)
+    options.add_session_config_entry("session.inter_op.allow_spinning", spinning)
+
+    return options, {
+        "pool_size": pool_size,
+        "workers": max(1, WORKERS),
+        "intra_op_threads": intra_threads if intra_threads > 0 else "auto",
+        "inter_op_threads": ORT_INTER_OP_THREADS if ORT_INTER_OP_THREADS > 0 else "auto",
+        "execution_mode": ORT_EXECUTION_MODE,
+        "graph_optimization": ORT_GRAPH_OPTIMIZATION,
+        "memory_arena": ORT_MEMORY_ARENA,
+        "allow_spinning": ORT_ALLOW_SPINNING,
+        "cores": cores,
+    }
+
+def write_optimized_model(model_path: str, optimized_path: Path):
+    """Run graph optimization and save the result, weights in an external file that can be mmap'd"""
+    sess_options, _ = session_options()
+    sess_options.log_severity_level = 3  # Hardware-specific graph warning: only reused on this machine
+    sess_options.optimized_model_filepath = str(optimized_path)
+    sess_options.add_session_config_entry(
+        "session.optimized_model_external_initializers_file_name", f"{optimized_path.name}.data"
+    )
+    sess_options.add_session_config_entry("session.optimized_model_external_initializers_min_size_in_bytes", "1024")
+    ort.InferenceSession(model_path, sess_options=sess_options, providers=['CPUExecutionProvider'])
+
+@functools.lru_cache(maxsize=1)
+def cpu_fingerprint() -> str:
+    """Architecture plus a hash of the CPU model and feature flags
+
+    Fully optimized graphs use layouts chosen for this CPU (e.g. the AVX2 or
+    AVX-512 block size), so a cached graph is only reused on the same kind.
+    """
+    details = platform.processor()
+    try:
+        with open("/proc/cpuinfo") as f:
+            details = "".join(sorted({  # Once, not per core
+                line for line in f if line.startswith(("model name", "flags", "Features"))
+            }))
+    except OSError:
+        pass
+    return f"{platform.machine()}-{hashlib.sha256(details.encode()).hexdigest()[:8]}"
+
+def optimized_model_cache(model_path: str, model_hash: Optional[str] = None) -> Optional[str]:
+    """The persisted optimized graph of a model, written on first use (None = cache off or not writable)"""
+    if not ORT_CACHE or ORT_GRAPH_OPTIMIZATION == "disable":
+        return None
+    model_hash = model_hash or model_file_hash(model_path)
+    path = Path(model_path)
+    cache_dir = Path(ORT_CACHE_DIR) if ORT_CACHE_DIR else path.parent / ".ort-cache"
+    cached = cache_dir / (
+        f"{path.stem}.{model_hash}.ort-{ort.__version__}.{ORT_GRAPH_OPTIMIZATION}.{cpu_fingerprint()}.onnx"
+    )
+    if cached.exists():
+        return str(cached)
+
+    start = time.perf_counter()
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=cache_dir) as staging:
+            staged = Path(staging) / cached.name
+            write_optimized_model(model_path, staged)
+            # Weights first, graph last: a graph file is only there once complete
+            os.replace(f"{staged}.data", f"{cached}.data")
+            os.replace(staged, cached)
+        # Entries of earlier versions of this model file
+        for stale in cache_dir.glob(f"{path.stem}.*"):
+            key = stale.name[len(path.stem) + 1:].split(".")[0]
+            if len(key) == len(model_hash) and key != model_hash and all(c in "0123456789abcdef" for c in key):
+                stale.unlink(missing_ok=True)
+    except OSError as e:
+        logger.warning("⚠️  Optimized graph cache not writable (%s) - optimizing on every load", e)
+        return None
+    logger.info(
+        "💾 Optimized graph saved for later starts",
+        extra={"path": str(cached), "seconds": round(time.perf_counter() - start, 2)}
+    )
+    return str(cached)
+
+def prepare_shared_model(model_path: str, output_dir: str) -> str:
+    """Optimize the model once (or reuse the cached graph), weights in an external file workers can mmap"""
+    cached = optimized_model_cache(model_path)
+    if cached is not None:
+        return cached
+    optimized_path = Path(output_dir) / f"{Path(model_path).stem}.optimized.onnx"
+    write_optimized_model(model_path, optimized_path)
+    return str(optimized_path)
+
+def process_memory(pid: Union[int, str] = "self") -> Dict[str, float]:
+    """Resident, proportional (shared pages split between processes) and private MB
+
+    Linux only (/proc/<pid>/smaps_rollup); empty elsewhere.
+    """
+    fields = {"Rss": "rss_mb", "Pss": "pss_mb", "Private_Clean": "private_mb", "Private_Dirty": "private_mb"}
+    memory = dict.fromkeys(fields.values(), 0.0)
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in fields:
+                    memory[fields[key]] += int(value.split()[0]) / 1024
+    except (OSError, ValueError):
+        return {}
+    return {name: round(mb, 1) for name, mb in memory.items()}
+
+def model_variant_path(model_path: str, variant: str) -> str:
+    """File of a model variant: models/best.onnx -> models/best.int8-static.onnx"""
+    if variant not in MODEL_VARIANTS:
+        raise ValueError(f"Unknown model variant: {variant} (expected one of {', '.join(MODEL_VARIANTS)})")
+    if variant == "fp32":
+        return model_path
+    path = Path(model_path)
+    return str(path.with_name(f"{path.stem}.{variant}{path.suffix}"))
+
+def model_file_hash(model_path: str) -> str:
+    """Short content hash identifying a model file (part of the cache key)"""
+    digest = hashlib.sha256()
+    with open(model_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+def model_input_size(model: Optional[ModelVersion] = None) -> Tuple[int, int]:
+    """(height, width) of the model input (default: the current version); symbolic dims fall back to 640"""
+    model = model or current_model()
+    shape = model.input_shape if model is not None else input_shape
+    height = shape[2] if shape and len(shape) > 2 and isinstance(shape[2], int) else 640
+    width = shape[3] if shape and len(shape) > 3 and isinstance(shape[3], int) else 640
+    return height, width
+
+def model_has_dynamic_size(model: Optional[ModelVersion] = None) -> bool:
+    """Whether the model (default: the current version) takes any input height and width"""
+    model = model or current_model()
+    shape = model.input_shape if model is not None else input_shape
+    return bool(shape) and len(shape) > 3 and not isinstance(shape[2], int) and not isinstance(shape[3], int)
+
+def request_input_size(
+    tier: Optional[str] = None,
+    imgsz: Optional[int] = None,
+    model: Optional[ModelVersion] = None
+) -> Tuple[int, int]:
+    """(height, width) to run at: imgsz or the tier on dynamic-size models, else the model's size
+
+    Values are used as given (requests are validated by DetectionRequest).
+    """
+    model = model or current_model()
+    if not model_has_dynamic_size(model):
+        return model_input_size(model)
+    size = imgsz if imgsz is not None else RESOLUTION_TIERS[tier or DEFAULT_TIER]
+    return size, size
+
+def detection_mode(options: DetectionRequest) -> str:
+    """How a request's images run: full (one view per image), tiled or cascade"""
+    return "tiled" if options.tiled else "cascade" if options.cascade else "full"
+
+def decode_target_size(input_size: Optional[Tuple[int, int]] = None) -> Optional[Tuple[int, int]]:
+    """(width, height) JPEGs may be reduced to while decoding for a (height, width) model input
+    (default: the model's), or None for full resolution"""
+    if not FAST_JPEG_DECODE:
+        return None
+    height, width = input_size or model_input_size()
+    return width, height
+
+def original_image_size(image: Image.Image) -> Tuple[int, int]:
+    """(width, height) of the photo as uploaded, even if it was decoded at reduced size"""
+    return image.info.get("original_size", image.size)
+
+def decode_image_bytes(
+    img_bytes: bytes,
+    target_size: Union[Tuple[int, int], Callable[[Tuple[int, int]], Optional[Tuple[int, int]]], None] = None
+) -> Image.Image:
+    """Decode raw encoded image bytes (JPEG/PNG/...) to an RGB PIL Image
+
+    With target_size=(width, height) of the model input, JPEGs are decoded
+    at the smallest DCT scale that still covers the letterboxed image; the
+    uploaded size is kept in image.info["original_size"] for bbox scaling
+    (see original_image_size). target_size may also be a function of the
+    uploaded (width, height), for targets that depend on the image size.
+    """
+    try:
+        # Convert to PIL Image (reads the header only)
+        image = Image.open(io.BytesIO(img_bytes))
+        original_size = image.size
+
+        # Reject oversized images before any pixel data is allocated
+        if MAX_IMAGE_PIXELS and original_size[0] * original_size[1] > MAX_IMAGE_PIXELS:
+            raise ValueError(
+                f"{original_size[0]}x{original_size[1]} image exceeds the "
+                f"{MAX_IMAGE_PIXELS:,} pixel limit"
+            )
+
+        # Decode JPEGs straight to a reduced resolution that still covers the
+        # size the image is letterboxed to
+        if callable(target_size):
+            target_size = target_size(original_size)
+        if target_size is not None and image.format == "JPEG":
+            ratio = min(target_size[0] / original_size[0], target_size[1] / original_size[1])
+            image.draft("RGB", (int(np.ceil(original_size[0] * ratio)), int(np.ceil(original_size[1] * ratio))))
+
+        # Convert to RGB if needed
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        else:
+            image.load()
+
+        image.info["original_size"] = original_size
+        return image
+    except Exception as e:
+        raise ValueError(f"Failed to decode image: {str(e)}")
+
+def data_url_to_bytes(data_url: str) -> bytes:
+    """Extract the encoded image bytes from a base64 data URL"""
+    try:
+        # Handle data URL format: "data:image/jpeg;base64,/9j/4AAQ..."
+        if ',' in data_url:
+            base64_data = data_url.split(',', 1)[1]
+        else:
+            base64_data = data_url
+
+        # Decode base64
+        return base64.b64decode(base64_data)
+    except Exception as e:
+        raise ValueError(f"Failed to decode image: {str(e)}")
+
+def decode_base64_image(data_url: str, target_size: Optional[Tuple[int, int]] = None) -> Image.Image:
+    """Decode base64 data URL to PIL Image"""
+    return decode_image_bytes(data_url_to_bytes(data_url), target_size)
+
+def image_payload_bytes(payload: Union[str, bytes]) -> bytes:
+    """Encoded image bytes of a base64 data URL (JSON /detect) or raw bytes (multipart /detect)"""
+    if isinstance(payload, bytes):
+        return payload
+    return data_url_to_bytes(payload)
+
+def decode_image(payload: Union[str, bytes], target_size: Optional[Tuple[int, int]] = None) -> Image.Image:
+    """Decode a base64 data URL (JSON /detect) or raw bytes (multipart /detect)"""
+    return decode_image_bytes(image_payload_bytes(payload), target_size)
+
+def preprocess_buffers(num_images: int, height: int, width: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Reusable ([num_images, 3, H, W] float32 input tensor, uint8 resize scratch) for this thread
+
+    Buffers grow to the largest request the thread has seen (up to
+    MAX_BATCH_SIZE slots) and are reused for every later one, so the calling
+    thread must be done with the tensor (inference has returned) before it
+    preprocesses its next request. There is one tensor per input size, so
+    requests at different resolution tiers do not reallocate each other's.
+    Larger requests get one-off buffers.
+    """
+    if num_images > max(MAX_BATCH_SIZE, 1):
+        return (
+            np.empty((num_images, 3, height, width), dtype=np.float32),
+            np.empty(height * width * 8, dtype=np.uint8)
+        )
+
+    tensors = getattr(thread_buffers, "tensors", None)
+    if tensors is None:
+        tensors = thread_buffers.tensors = {}
+    tensor = tensors.get((height, width))
+    if tensor is None or tensor.shape[0] < num_images:
+        capacity = max(num_images, tensor.shape[0] if tensor is not None else 0)
+        tensor = tensors[(height, width)] = np.empty((capacity, 3, height, width), dtype=np.float32)
+    scratch = getattr(thread_buffers, "scratch", None)
+    if scratch is None or scratch.size < height * width * 8:
+        scratch = thread_buffers.scratch = np.empty(height * width * 8, dtype=np.uint8)
+    return tensor[:num_images], scratch
+
+def pixel_paste_works() -> bool:
+    """Whether pasting into a buffer-backed image copies pixels into the buffer (checked once, at startup)
+
+    decoded_pixels relies on Pillow's core image object (Image.im), which is
+    not public API; if it misbehaves on the installed Pillow, it falls back
+    to np.asarray.
+    """
+    global pixel_paste_ok
+    if pixel_paste_ok is None:
+        expected = np.arange(5 * 3 * 3, dtype=np.uint8).reshape(5, 3, 3)
+        pixels = np.zeros((5, 3, 4), dtype=np.uint8)
+        try:
+            target = Image.frombuffer("RGBX", (3, 5), pixels, "raw", "RGBX", 0, 1)
+            target.im.paste(Image.fromarray(expected, "RGB").im, (0, 0, 3, 5))
+            pixel_paste_ok = bool(np.array_equal(pixels[..., :3], expected))
+        except Exception:
+            pixel_paste_ok = False
+        if not pixel_paste_ok:
+            logger.warning("⚠️  Pillow %s: buffer paste check failed - decoded pixels are copied with np.asarray",
+                           Image.__version__)
+    return pixel_paste_ok
+
+def decoded_pixels(image: Image.Image) -> np.ndarray:
+    """[H, W, 4] RGBX array of an RGB image's pixels, in this thread's reusable pixel buffer
+
+    np.asarray(image) would serialize the pixels to a new bytes object
+    first; pasting into an image that shares the buffer copies them once,
+    in place. The array is overwritten by the thread's next call. If the
+    paste does not work on the installed Pillow (see pixel_paste_works),
+    this is np.asarray(image) instead ([H, W, 3], newly allocated).
+    """
+    if not pixel_paste_works():
+        return np.asarray(image)
+    image.load()
+    width, height = image.size
+    num_bytes = width * height * 4
+    buffer = getattr(thread_buffers, "pixels", None)
+    if buffer is None or buffer.size < num_bytes:
+        buffer = np.empty(num_bytes, dtype=np.uint8)
+        if num_bytes <= PIXEL_BUFFER_MAX_BYTES:
+            thread_buffers.pixels = buffer
+    pixels = buffer[:num_bytes].reshape(height, width, 4)
+    # frombuffer images are read-only at the Python level (paste() would
+    # detach them from the buffer), so paste on the core image directly
+    target = Image.frombuffer("RGBX", image.size, pixels, "raw", "RGBX", 0, 1)
+    target.im.paste(image.im, (0, 0, width, height))
+    return pixels
+
+def preprocess_image(
+    image: Image.Image,
+    input_shape: tuple,
+    out: Optional[np.ndarray] = None,
+    scratch: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, Letterbox]:
+    """Letterbox an image into a normalized CHW tensor for the YOLO ONNX model
+
+    The image is resized with its aspect ratio preserved (as YOLOv8 was
+    trained), centered and padded with LETTERBOX_PAD_VALUE. Pixels are
+    normalized to [0, 1] and written straight into `out` ([3, H, W] or
+    [1, 3, H, W], allocated if not given); `scratch` is an optional uint8
+    buffer of at least H*W*8 bytes for the resized pixels and their channel
+    planes. The decoded pixels are read through the thread's pixel buffer
+    (see decoded_pixels), so with both buffers given nothing is allocated
+    per image. Returns `out` and the Letterbox needed to map boxes back to
+    the uploaded image.
+    """
+    # Get target size from model input shape (typically [1, 3, 640, 640])
+    # (dynamic-shape exports report symbolic dims - fall back to 640)
+    target_height = input_shape[2] if len(input_shape) > 2 and isinstance(input_shape[2], int) else 640
+    target_width = input_shape[3] if len(input_shape) > 3 and isinstance(input_shape[3], int) else 640
+
+    if out is None:
+        out = np.empty((1, 3, target_height, target_width), dtype=np.float32)
+    chw = out[0] if out.ndim == 4 else out
+
+    # PIL already gives us RGB, which is what the model expects
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    img_array = decoded_pixels(image)
+    src_height, src_width, channels = img_array.shape
+
+    # Resize to fit inside the model input, preserving aspect ratio
+    ratio = min(target_height / src_height, target_width / src_width)
+    new_width = max(1, min(target_width, round(src_width * ratio)))
+    new_height = max(1, min(target_height, round(src_height * ratio)))
+    size = new_height * new_width
+    if scratch is None or scratch.size < size * 8:
+        scratch = np.empty(size * 8, dtype=np.uint8)
+    if (new_width, new_height) != (src_width, src_height):
+        img_resized = cv2.resize(
+            img_array,
+            (new_width, new_height),
+            dst=scratch[:size * channels].reshape(new_height, new_width, channels),
+            interpolation=cv2.INTER_LINEAR
+        )
+    else:
+        img_resized = img_array
+
+    # Split HWC into contiguous channel planes (much faster to normalize
+    # than a strided transpose); a fourth is the unused RGBX padding byte
+    planes = [
+        scratch[size * (4 + c):size * (5 + c)].reshape(new_height, new_width)
+        for c in range(channels)
+    ]
+    cv2.split(img_resized, planes)
+
+    # Pad the borders around the centered image
+    left = (target_width - new_width) // 2
+    top = (target_height - new_height) // 2
+    bottom = top + new_height
+    right = left + new_width
+    pad_value = LETTERBOX_PAD_VALUE / 255.0
+    chw[:, :top, :] = pad_value
+    chw[:, bottom:, :] = pad_value
+    chw[:, top:bottom, :left] = pad_value
+    chw[:, top:bottom, right:] = pad_value
+
+    # Normalize to [0, 1] straight into the CHW tensor
+    for c in range(3):
+        np.multiply(planes[c], np.float32(1.0 / 255.0), out=chw[c, top:bottom, left:right], dtype=np.float32)
+
+    img_width, img_height = original_image_size(image)
+    letterbox = Letterbox(
+        scale_x=new_width / img_width,
+        scale_y=new_height / img_height,
+        pad_x=float(left),
+        pad_y=float(top)
+    )
+    return out, letterbox
+
+def sigmoid(x: np.ndarray) -> np.ndarray:
+    """Apply sigmoid activation to convert logits to probabilities"""
+    # Clip to avoid overflow in exp
+    x = np.clip(x, -500, 500)
+    return 1 / (1 + np.exp(-x))
+
+
+def postprocess_detections(
     outputs: np.ndarray,
     min_confidence: float,
     img_width: int,
-    img_height: int
+    img_height: int,
+    iou_threshold: float = NMS_IOU_THRESHOLD,
+    max_det: int = NMS_MAX_DETECTIONS,
+    class_agnostic: bool = False,
+    letterbox: Optional[Letterbox] = None,
+    input_size: Optional[Tuple[int, int]] = None
 ) -> List[Detection]:
     """Postprocess YOLOv8 ONNX outputs to detection objects
     
@@ -256,167 +1919,2125 @@ def postprocess_detections(
     
     Each column contains: [x_center, y_center, width, height, class0_score, ..., classN_score]
     Note: YOLOv8 does NOT have objectness score - confidence is max(class_scores)
+
+    All per-anchor work (class argmax, confidence filtering, box conversion)
+    is done on whole arrays; Detection objects are only built for the boxes
+    that survive NMS.
+
+    Boxes are mapped back to img_width x img_height using the Letterbox
+    returned by preprocess_image; without one the image is assumed to have
+    been stretched over the whole (height, width) `input_size` it ran at
+    (default: the model's).
+    """
+    candidates = extract_candidates(outputs, min_confidence, img_width, img_height, letterbox, input_size)
+    return select_detections(candidates, min_confidence, iou_threshold, max_det, class_agnostic)
+
+
+def extract_candidates(
+    outputs: np.ndarray,
+    min_confidence: float,
+    img_width: int,
+    img_height: int,
+    letterbox: Optional[Letterbox] = None,
+    input_size: Optional[Tuple[int, int]] = None
+) -> Candidates:
+    """Best class, confidence and image-space box of every anchor scoring >= min_confidence"""
+    # Work in the native YOLOv8 layout [num_features, num_predictions] so the
+    # class scores for every anchor are contiguous rows (no transposed copy).
+    if len(outputs.shape) == 3:
+        # Remove batch dimension: [1, 11, 8400] -> [11, 8400]
+        predictions = outputs[0]
+    elif len(outputs.shape) == 2 and outputs.shape[0] > outputs.shape[1]:
+        # [num_predictions, num_features] -> [num_features, num_predictions]
+        predictions = outputs.T
+    else:
+        predictions = outputs
+
+    num_features = predictions.shape[0]
+    num_classes = num_features - 4  # First 4 are bbox coords
+
+    class_scores = predictions[4:]
+
+    # Check if we need to apply sigmoid (YOLOv8 ONNX may output raw logits)
+    # Sample the max class score to determine if sigmoid is needed
+    sample_scores = class_scores[:, :100]  # First 100 detections
+    max_score = np.max(sample_scores)
+    needs_sigmoid = max_score > 1.0 or max_score < 0.0
+
+    # Best class per anchor. Sigmoid is monotonic, so the argmax over raw
+    # logits is the same as over probabilities and only the per-anchor
+    # maximum needs converting.
+    class_ids = np.argmax(class_scores, axis=0)
+    confidences = np.max(class_scores, axis=0)
+
+    if needs_sigmoid:
+        confidences = sigmoid(confidences)
+    postprocess_logger.debug(
+        "Raw output %s: %d classes, max score %.4f%s",
+        outputs.shape, num_classes, max_score, " (applying sigmoid)" if needs_sigmoid else ""
+    )
+
+    # Skip low confidence detections
+    keep_mask = confidences >= min_confidence
+    if not np.any(keep_mask):
+        return Candidates(
+            np.empty((0, 4), dtype=np.float32),
+            np.empty(0, dtype=np.float32),
+            np.empty(0, dtype=np.intp)
+        )
+
+    class_ids = class_ids[keep_mask]
+    confidences = confidences[keep_mask]
+    x_center, y_center, width, height = predictions[:4, keep_mask]
+
+    if letterbox is None:
+        # Image was stretched over the whole model input
+        model_height, model_width = input_size or model_input_size()
+        letterbox = Letterbox(model_width / img_width, model_height / img_height, 0.0, 0.0)
+    scale_x = 1.0 / letterbox.scale_x
+    scale_y = 1.0 / letterbox.scale_y
+
+    # Convert from center format to corner format, remove the letterbox
+    # padding, scale from model coordinates to image coordinates and clip
+    # to image boundaries
+    boxes = np.empty((confidences.shape[0], 4), dtype=np.float32)
+    boxes[:, 0] = (x_center - width / 2 - letterbox.pad_x) * scale_x
+    boxes[:, 1] = (y_center - height / 2 - letterbox.pad_y) * scale_y
+    boxes[:, 2] = (x_center + width / 2 - letterbox.pad_x) * scale_x
+    boxes[:, 3] = (y_center + height / 2 - letterbox.pad_y) * scale_y
+    np.clip(boxes[:, 0::2], 0, img_width, out=boxes[:, 0::2])
+    np.clip(boxes[:, 1::2], 0, img_height, out=boxes[:, 1::2])
+
+    return Candidates(boxes, confidences.astype(np.float32, copy=False), class_ids)
+
+
+def select_detections(
+    candidates: Candidates,
+    min_confidence: float,
+    iou_threshold: float = NMS_IOU_THRESHOLD,
+    max_det: int = NMS_MAX_DETECTIONS,
+    class_agnostic: bool = False
+) -> List[Detection]:
+    """Apply the confidence threshold and NMS to candidates and build Detection objects"""
+    boxes, confidences, class_ids = candidates
+    if confidences.size and confidences.min() < min_confidence:
+        keep_mask = confidences >= min_confidence
+        boxes = boxes[keep_mask]
+        confidences = confidences[keep_mask]
+        class_ids = class_ids[keep_mask]
+
+    if confidences.size == 0:
+        postprocess_logger.debug("Final detections after NMS: 0")
+        return []
+
+    # Apply Non-Maximum Suppression (NMS) to remove duplicate detections
+    keep = non_max_suppression(
+        boxes,
+        confidences,
+        iou_threshold=iou_threshold,
+        class_ids=None if class_agnostic else class_ids,
+        max_det=max_det
+    )
+
+    detections = [
+        Detection(
+            class_name=CLASS_NAMES.get(class_id, f"unknown_class_{class_id}"),
+            confidence=confidence,
+            bbox=bbox
+        )
+        for class_id, confidence, bbox in zip(
+            class_ids[keep].tolist(),
+            confidences[keep].tolist(),
+            boxes[keep].tolist()
+        )
+    ]
+
+    postprocess_logger.debug("Final detections after NMS: %d", len(detections))
+    
+    return detections
+
+
+def box_iou(boxes1: np.ndarray, boxes2: np.ndarray) -> np.ndarray:
+    """Pairwise IoU matrix [M, N] between two sets of corner-format boxes"""
+    area1 = (boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1])
+    area2 = (boxes2[:, 2] - boxes2[:, 0]) * (boxes2[:, 3] - boxes2[:, 1])
+
+    inter_w = np.minimum(boxes1[:, None, 2], boxes2[None, :, 2]) - np.maximum(boxes1[:, None, 0], boxes2[None, :, 0])
+    inter_h = np.minimum(boxes1[:, None, 3], boxes2[None, :, 3]) - np.maximum(boxes1[:, None, 1], boxes2[None, :, 1])
+    intersection = np.clip(inter_w, 0, None) * np.clip(inter_h, 0, None)
+    union = area1[:, None] + area2[None, :] - intersection
+
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union != 0)
+
+
+def non_max_suppression(
+    boxes: np.ndarray,
+    scores: np.ndarray,
+    iou_threshold: float = NMS_IOU_THRESHOLD,
+    class_ids: Optional[np.ndarray] = None,
+    max_det: int = NMS_MAX_DETECTIONS
+) -> np.ndarray:
+    """Greedy NMS over [N, 4] corner-format boxes
+
+    Returns indices of the kept boxes, highest score first (at most max_det).
+    A box is suppressed when its IoU with an already-kept box is
+    >= iou_threshold. When class_ids is given, only boxes of the same class
+    suppress each other; otherwise suppression is class-agnostic.
+
+    Candidates are swept in score order in blocks of NMS_BLOCK_SIZE. Each
+    block is first filtered against the boxes kept from earlier blocks, then
+    resolved internally by iterating the greedy rule on the block's IoU
+    matrix to its fixed point (identical to the sequential greedy result).
+    Memory stays at O(block^2) and work at O(N * kept + N * block), so
+    thousands of candidates never touch a Python-level pairwise loop.
+    """
+    num_boxes = boxes.shape[0]
+    if num_boxes == 0 or max_det <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    # Stable sort so equal scores keep their anchor order
+    order = np.argsort(-scores, kind="stable")
+    boxes = boxes[order]
+    if class_ids is not None:
+        class_ids = class_ids[order]
+
+    kept_blocks = []
+    num_kept = 0
+
+    for start in range(0, num_boxes, NMS_BLOCK_SIZE):
+        stop = min(start + NMS_BLOCK_SIZE, num_boxes)
+        alive = np.ones(stop - start, dtype=bool)
+
+        # Suppress against everything kept in earlier blocks
+        if num_kept > 0:
+            kept = np.concatenate(kept_blocks)
+            overlaps = box_iou(boxes[kept], boxes[start:stop]) >= iou_threshold
+            if class_ids is not None:
+                overlaps &= class_ids[kept, None] == class_ids[None, start:stop]
+            alive &= ~overlaps.any(axis=0)
+
+        # Only survivors of the cross-block pass take part in the block sweep
+        candidates = start + np.flatnonzero(alive)
+        if candidates.size == 0:
+            continue
+
+        # overlaps[j, i]: higher-scored box j would suppress box i
+        overlaps = np.triu(box_iou(boxes[candidates], boxes[candidates]) >= iou_threshold, k=1)
+        if class_ids is not None:
+            overlaps &= class_ids[candidates, None] == class_ids[None, candidates]
+
+        # Greedy NMS is the unique fixed point of
+        # keep[i] = not any(keep[j] and overlaps[j, i] for j < i)
+        keep = np.ones(candidates.size, dtype=bool)
+        while True:
+            next_keep = ~(overlaps & keep[:, None]).any(axis=0)
+            if np.array_equal(next_keep, keep):
+                break
+            keep = next_keep
+
+        block_kept = candidates[keep]
+        kept_blocks.append(block_kept)
+        num_kept += block_kept.size
+        if num_kept >= max_det:
+            break
+
+    return order[np.concatenate(kept_blocks)[:max_det]]
+
+
+def apply_nms(
+    detections: List[Detection],
+    iou_threshold: float = NMS_IOU_THRESHOLD,
+    class_agnostic: bool = False,
+    max_det: int = NMS_MAX_DETECTIONS
+) -> List[Detection]:
+    """Apply Non-Maximum Suppression to already-built Detection objects
+
+    Convenience wrapper around non_max_suppression for callers that hold
+    Detection lists; postprocess_detections works on arrays directly.
+    """
+    if len(detections) == 0:
+        return []
+
+    boxes = np.array([det.bbox for det in detections], dtype=np.float32)
+    scores = np.array([det.confidence for det in detections], dtype=np.float32)
+    class_ids = None
+    if not class_agnostic:
+        _, class_ids = np.unique([det.class_name for det in detections], return_inverse=True)
+
+    keep = non_max_suppression(boxes, scores, iou_threshold, class_ids, max_det)
+    return [detections[i] for i in keep]
+
+def run_inference(input_batch: np.ndarray) -> np.ndarray:
+    """Run the ONNX session on an [N, 3, H, W] batch and return [N, ...] outputs
+
+    Uses as few ort_session.run calls as the model allows: chunks of up to
+    MAX_BATCH_SIZE for dynamic-batch models, zero-padded chunks for models
+    exported with a fixed batch size, and one call per image otherwise
+    (whether a dynamic-batch model really batches is checked when it is
+    loaded, see model_runs_batches). If a batched run of a dynamic-batch
+    model fails, the images of this call are re-run singly; fixed-batch
+    models cannot run single images, so their errors are raised.
+    """
+    model = current_model()  # Pinned by this thread, else the active version
+    if model is None or model.ort_session is None:
+        raise RuntimeError("Model not loaded")
+
+    num_images = input_batch.shape[0]
+    batch_size = model.batch_size
+    chunk_size = MAX_BATCH_SIZE if batch_size is None else batch_size
+
+    if chunk_size > 1 and (num_images > 1 or batch_size is not None):
+        try:
+            outputs = []
+            for start in range(0, num_images, chunk_size):
+                chunk = input_batch[start:start + chunk_size]
+                count = chunk.shape[0]
+                if batch_size is not None and count < batch_size:
+                    # Fixed-batch graph: pad with blank images
+                    padding = np.zeros((batch_size - count,) + chunk.shape[1:], dtype=chunk.dtype)
+                    chunk = np.concatenate([chunk, padding])
+                outputs.append(run_session(model, chunk)[:count])
+            return np.concatenate(outputs)
+        except Exception as e:
+            if batch_size is not None:
+                raise
+            inference_logger.warning("⚠️  Batched inference failed (%s) - re-running the images one per run", e)
+            return run_singly(model, input_batch)
+
+    return run_singly(model, input_batch)
+
+
+def run_singly(model: ModelVersion, input_batch: np.ndarray) -> np.ndarray:
+    """One run per image of an [N, 3, H, W] batch"""
+    return np.concatenate([
+        run_session(model, input_batch[i:i + 1])
+        for i in range(input_batch.shape[0])
+    ])
+
+
+def run_session(model: ModelVersion, input_batch: np.ndarray) -> np.ndarray:
+    """One timed run on an idle session from the model's pool; returns the first output"""
+    session = model.sessions.get()
+    try:
+        start = time.perf_counter()
+        output = session.run(None, {model.input_name: input_batch})[0]
+        ort_run_seconds.observe(time.perf_counter() - start)
+    finally:
+        model.sessions.put(session)
+    return output
+
+
+def preprocess_batch(
+    images: List[Image.Image],
+    input_size: Optional[Tuple[int, int]] = None
+) -> Tuple[np.ndarray, List[Letterbox]]:
+    """Letterbox every image into this thread's reusable [N, 3, H, W] input buffer
+    (H, W = input_size, default: the model's)"""
+    height, width = input_size or model_input_size()
+    input_batch, scratch = preprocess_buffers(len(images), height, width)
+    letterboxes = [
+        preprocess_image(image, (1, 3, height, width), out=input_batch[i], scratch=scratch)[1]
+        for i, image in enumerate(images)
+    ]
+    return input_batch, letterboxes
+
+
+def infer(input_batch: np.ndarray) -> np.ndarray:
+    """Run a preprocessed batch through the batcher (or directly if it is not running)"""
+    return submit_inference(input_batch).result()
+
+
+def submit_inference(input_batch: np.ndarray) -> Future:
+    """Queue a preprocessed batch on the batcher; without one, run it now"""
+    if inference_batcher is not None and inference_batcher.running:
+        return inference_batcher.submit(input_batch)
+    future: Future = Future()
+    try:
+        future.set_result(run_inference(input_batch))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def run_detection_batch(
+    images: List[Image.Image],
+    min_confidence: float,
+    iou_threshold: float = NMS_IOU_THRESHOLD,
+    max_det: int = NMS_MAX_DETECTIONS,
+    class_agnostic: bool = False,
+    imgsz: Optional[int] = None,
+    tiled: bool = False,
+    cascade: bool = False
+) -> List[List[Detection]]:
+    """Run ONNX inference on several images with batched ort_session.run calls
+
+    imgsz picks the input size on dynamic-size models (default: DEFAULT_TIER).
+    With tiled=True each image runs as a global view plus full-resolution
+    tiles (see tile_grid), with cascade=True as a coarse pass plus its shell
+    region (see cascade_candidates); decode such images at full resolution.
+    """
+    if ort_session is None:
+        raise RuntimeError("Model not loaded")
+
+    if len(images) == 0:
+        return []
+
+    # Preprocess, run inference, then postprocess each image's slice with
+    # its own original size and letterbox
+    if tiled or cascade:
+        detection_candidates = tiled_detection_candidates if tiled else cascade_detection_candidates
+        return [
+            select_detections(
+                detection_candidates(image, min_confidence, imgsz),
+                min_confidence,
+                iou_threshold=iou_threshold,
+                max_det=max_det,
+                class_agnostic=class_agnostic
+            )
+            for image in images
+        ]
+
+    with pin_model():
+        input_size = request_input_size(imgsz=imgsz)
+        input_batch, letterboxes = preprocess_batch(images, input_size)
+        outputs = infer(input_batch)
+    return [
+        postprocess_detections(
+            outputs[i:i + 1],
+            min_confidence,
+            *original_image_size(image),
+            iou_threshold=iou_threshold,
+            max_det=max_det,
+            class_agnostic=class_agnostic,
+            letterbox=letterbox,
+            input_size=input_size
+        )
+        for i, (image, letterbox) in enumerate(zip(images, letterboxes))
+    ]
+
+
+def run_detection(
+    image: Image.Image,
+    min_confidence: float,
+    iou_threshold: float = NMS_IOU_THRESHOLD,
+    max_det: int = NMS_MAX_DETECTIONS,
+    class_agnostic: bool = False,
+    imgsz: Optional[int] = None,
+    tiled: bool = False,
+    cascade: bool = False
+) -> List[Detection]:
+    """Run ONNX inference on image (tiled=True: global view plus full-resolution
+    tiles; cascade=True: coarse pass plus the shell region)"""
+    return run_detection_batch(
+        [image],
+        min_confidence,
+        iou_threshold=iou_threshold,
+        max_det=max_det,
+        class_agnostic=class_agnostic,
+        imgsz=imgsz,
+        tiled=tiled,
+        cascade=cascade
+    )[0]
+
+
+# ============================================================================
+# TILED INFERENCE
+# ============================================================================
+
+def tile_grid(
+    img_width: int,
+    img_height: int,
+    tile_size: int,
+    overlap: float = TILE_OVERLAP,
+    max_tiles: int = TILE_MAX_TILES
+) -> List[Tuple[int, int, int, int]]:
+    """(x1, y1, x2, y2) overlapping square tiles covering an image, in image pixels
+
+    Tiles are tile_size pixels (one model input, no downscaling) and spread
+    evenly so neighbours overlap by at least `overlap` of a tile. If that
+    takes more than max_tiles, the tiles grow until max_tiles cover the
+    image. Images that fit one tile (or about one) get none: the global
+    view already sees them at (nearly) full resolution.
+    """
+    if max(img_width, img_height) <= tile_size * (1 + overlap):
+        return []  # Barely larger than one tile: tiles would add little over the global view
+    size = tile_size
+    while size < max(img_width, img_height):
+        step = size * (1 - overlap)
+        cols = 1 if img_width <= size else int(np.ceil((img_width - size) / step)) + 1
+        rows = 1 if img_height <= size else int(np.ceil((img_height - size) / step)) + 1
+        if cols * rows <= max(max_tiles, 1):
+            break
+        size = int(np.ceil(size * 1.1))
+    else:
+        return []
+
+    tile_width, tile_height = min(size, img_width), min(size, img_height)
+    xs = np.linspace(0, img_width - tile_width, cols).round().astype(int)
+    ys = np.linspace(0, img_height - tile_height, rows).round().astype(int)
+    return [(int(x), int(y), int(x) + tile_width, int(y) + tile_height) for y in ys for x in xs]
+
+
+def tiled_decode_target(input_size: Tuple[int, int]) -> Optional[Callable[[Tuple[int, int]], Tuple[int, int]]]:
+    """decode_image_bytes target for tiled images: the size at which their tiles are still
+    decoded at (nearly) model resolution, or None without FAST_JPEG_DECODE
+
+    Tiles may come out up to 10% short of the model input (and be upscaled),
+    so that e.g. a 12 MP photo, whose 12 tiles are ~1250 px, can use
+    libjpeg's 1/2 scale instead of a full-resolution decode.
+    """
+    if not FAST_JPEG_DECODE:
+        return None
+
+    def target(original_size: Tuple[int, int]) -> Tuple[int, int]:
+        tiles = tile_grid(*original_size, min(input_size))
+        if not tiles:
+            return input_size[1], input_size[0]
+        x1, y1, x2, y2 = tiles[0]
+        ratio = 0.9 * min(input_size) / max(x2 - x1, y2 - y1)
+        return int(np.ceil(original_size[0] * ratio)), int(np.ceil(original_size[1] * ratio))
+
+    return target
+
+
+def preprocess_tiled(
+    image: Image.Image,
+    input_size: Tuple[int, int]
+) -> Tuple[np.ndarray, List[Tuple[Optional[Tuple[int, int, int, int]], Letterbox]]]:
+    """Letterbox the global view and every tile of one image into one [1 + tiles, 3, H, W] batch
+
+    Returns the batch and one (tile in uploaded-image pixels or None for the
+    global view, letterbox) per row. The image may be a reduced-resolution
+    decode; tiles are cut from it at the matching scale.
+    """
+    height, width = input_size
+    img_width, img_height = original_image_size(image)
+    tiles = tile_grid(img_width, img_height, min(input_size))
+    input_batch, scratch = preprocess_buffers(1 + len(tiles), height, width)
+    views = [(None, preprocess_image(image, (1, 3, height, width), out=input_batch[0], scratch=scratch)[1])]
+    for row, tile in enumerate(tiles, start=1):
+        views.append((tile, preprocess_crop(image, tile, input_size, input_batch[row], scratch)))
+    return input_batch, views
+
+
+def preprocess_crop(
+    image: Image.Image,
+    crop: Tuple[int, int, int, int],
+    input_size: Tuple[int, int],
+    out: np.ndarray,
+    scratch: Optional[np.ndarray] = None
+) -> Letterbox:
+    """Letterbox the (x1, y1, x2, y2) region of an image (in uploaded-image pixels) into `out`
+
+    The image may be a reduced-resolution decode; the region is cut from it
+    at the matching scale. The Letterbox is relative to the region.
+    """
+    img_width, img_height = original_image_size(image)
+    x1, y1, x2, y2 = crop
+    if crop != (0, 0, img_width, img_height):
+        scale_x, scale_y = image.width / img_width, image.height / img_height
+        image = image.crop((round(x1 * scale_x), round(y1 * scale_y), round(x2 * scale_x), round(y2 * scale_y)))
+        image.info["original_size"] = (x2 - x1, y2 - y1)
+    return preprocess_image(image, (1, 3) + tuple(input_size), out=out, scratch=scratch)[1]
+
+
+def crop_candidates(
+    outputs: np.ndarray,
+    crop: Tuple[int, int, int, int],
+    letterbox: Letterbox,
+    min_confidence: float,
+    img_width: int,
+    img_height: int
+) -> Candidates:
+    """Candidates of one preprocess_crop row, in image coordinates
+
+    A box touching a crop edge that is not an image edge is cut off by the
+    crop; another view has the whole object, so such boxes are dropped.
+    """
+    x1, y1, x2, y2 = crop
+    boxes, scores, class_ids = extract_candidates(outputs, min_confidence, x2 - x1, y2 - y1, letterbox)
+    boxes += np.array([x1, y1, x1, y1], dtype=np.float32)
+    cut = (
+        ((boxes[:, 0] <= x1 + 1) & (x1 > 0))
+        | ((boxes[:, 1] <= y1 + 1) & (y1 > 0))
+        | ((boxes[:, 2] >= x2 - 1) & (x2 < img_width))
+        | ((boxes[:, 3] >= y2 - 1) & (y2 < img_height))
+    )
+    return Candidates(boxes[~cut], scores[~cut], class_ids[~cut])
+
+
+def concat_candidates(parts: List[Candidates]) -> Candidates:
+    return Candidates(
+        np.concatenate([part.boxes for part in parts]),
+        np.concatenate([part.scores for part in parts]),
+        np.concatenate([part.class_ids for part in parts])
+    )
+
+
+def merge_tiled_candidates(
+    outputs: np.ndarray,
+    views: List[Tuple[Optional[Tuple[int, int, int, int]], Letterbox]],
+    min_confidence: float,
+    img_width: int,
+    img_height: int
+) -> Candidates:
+    """Candidates of a global view and its tiles (preprocess_tiled rows) in image coordinates
+
+    Tile boxes cut by an edge shared with a neighbour are dropped (the
+    neighbour, through the overlap, or the global view has the whole
+    object). Duplicates between views are left to the NMS of
+    select_detections.
+    """
+    return concat_candidates([
+        extract_candidates(outputs[i:i + 1], min_confidence, img_width, img_height, letterbox) if tile is None
+        else crop_candidates(outputs[i:i + 1], tile, letterbox, min_confidence, img_width, img_height)
+        for i, (tile, letterbox) in enumerate(views)
+    ])
+
+
+def tiled_detection_candidates(image: Image.Image, min_confidence: float, imgsz: Optional[int] = None) -> Candidates:
+    """Merged global-view and tile candidates of one decoded image (blocking)"""
+    with pin_model():
+        input_size = request_input_size(imgsz=imgsz)
+        input_batch, views = preprocess_tiled(image, input_size)
+        outputs = infer(input_batch)
+    tiles_total.inc(len(views) - 1)
+    return merge_tiled_candidates(outputs, views, min_confidence, *original_image_size(image))
+
+
+# ============================================================================
+# CASCADE INFERENCE
+# ============================================================================
+
+def cascade_coarse_size(input_size: Tuple[int, int], model: Optional[ModelVersion] = None) -> Tuple[int, int]:
+    """(height, width) of the first cascade pass: the CASCADE_COARSE_TIER size (at most the
+    request's) on dynamic-size models, the model's own size otherwise"""
+    if not model_has_dynamic_size(model):
+        return model_input_size(model)
+    size = min(RESOLUTION_TIERS[CASCADE_COARSE_TIER], *input_size)
+    return size, size
+
+
+def cascade_decode_target(input_size: Tuple[int, int]) -> Optional[Callable[[Tuple[int, int]], Tuple[int, int]]]:
+    """decode_image_bytes target for cascade images: large enough that a shell region of
+    CASCADE_MIN_ROI of the long side is at (nearly) model resolution, or None without
+    FAST_JPEG_DECODE"""
+    if not FAST_JPEG_DECODE:
+        return None
+
+    def target(original_size: Tuple[int, int]) -> Tuple[int, int]:
+        ratio = min(1.0, 0.9 * min(input_size) / (CASCADE_MIN_ROI * max(original_size)))
+        return int(np.ceil(original_size[0] * ratio)), int(np.ceil(original_size[1] * ratio))
+
+    return target
+
+
+def cascade_roi(candidates: Candidates, img_width: int, img_height: int) -> Optional[Tuple[int, int, int, int]]:
+    """(x1, y1, x2, y2) region around the best shell (CASCADE_ROI_CLASS) candidate, grown by
+    CASCADE_MARGIN of its size on every side and clipped to the image; None without a shell"""
+    shell_ids = [class_id for class_id, name in CLASS_NAMES.items() if name == CASCADE_ROI_CLASS]
+    boxes = candidates.boxes
+    shells = (
+        np.isin(candidates.class_ids, shell_ids)
+        & (candidates.scores >= CASCADE_SHELL_CONFIDENCE)
+        & (boxes[:, 2] - boxes[:, 0] >= 2) & (boxes[:, 3] - boxes[:, 1] >= 2)  # Not clipped away at the edge
+    )
+    if not np.any(shells):
+        return None
+    best = np.flatnonzero(shells)[np.argmax(candidates.scores[shells])]
+    x1, y1, x2, y2 = boxes[best]
+    margin_x, margin_y = (x2 - x1) * CASCADE_MARGIN, (y2 - y1) * CASCADE_MARGIN
+    return (
+        max(0, int(np.floor(x1 - margin_x))),
+        max(0, int(np.floor(y1 - margin_y))),
+        min(img_width, int(np.ceil(x2 + margin_x))),
+        min(img_height, int(np.ceil(y2 + margin_y)))
+    )
+
+
+def cascade_candidates(
+    image: Image.Image,
+    input_size: Tuple[int, int],
+    min_confidence: float,
+    timer: Optional[StageTimer] = None
+) -> Candidates:
+    """Shell-guided two-pass candidates of one decoded image (blocking, on the pinned model)
+
+    The whole frame runs at cascade_coarse_size to find the shell, then the
+    shell region (see cascade_roi; the whole frame if there is none) runs
+    at input_size. The passes' candidates are merged in image coordinates;
+    boxes cut by the region's inner edges are dropped (the coarse pass has
+    those objects). Stages go to `timer` as preprocess, coarse_inference,
+    refine_inference and postprocess.
+    """
+    timer = timer if timer is not None else StageTimer()
+    img_width, img_height = original_image_size(image)
+
+    timer.mark()
+    coarse_height, coarse_width = cascade_coarse_size(input_size)
+    input_batch, scratch = preprocess_buffers(1, coarse_height, coarse_width)
+    _, letterbox = preprocess_image(image, (1, 3, coarse_height, coarse_width), out=input_batch[0], scratch=scratch)
+    timer.lap("preprocess")
+    outputs = infer(input_batch)
+    timer.lap("coarse_inference")
+    coarse = extract_candidates(
+        outputs, min(min_confidence, CASCADE_SHELL_CONFIDENCE), img_width, img_height, letterbox=letterbox
+    )
+    roi = cascade_roi(coarse, img_width, img_height)
+    cascade_rois_total.inc(label="shell" if roi is not None else "frame")
+    roi = roi or (0, 0, img_width, img_height)
+    keep = coarse.scores >= min_confidence
+    coarse = Candidates(coarse.boxes[keep], coarse.scores[keep], coarse.class_ids[keep])
+    timer.lap("postprocess")
+
+    input_batch, scratch = preprocess_buffers(1, *input_size)
+    letterbox = preprocess_crop(image, roi, input_size, input_batch[0], scratch)
+    timer.lap("preprocess")
+    outputs = infer(input_batch)
+    timer.lap("refine_inference")
+    refined = crop_candidates(outputs, roi, letterbox, min_confidence, img_width, img_height)
+    candidates = concat_candidates([coarse, refined])
+    timer.lap("postprocess")
+    return candidates
+
+
+def cascade_detection_candidates(image: Image.Image, min_confidence: float, imgsz: Optional[int] = None) -> Candidates:
+    """Merged coarse and shell-region candidates of one decoded image (blocking)"""
+    with pin_model():
+        input_size = request_input_size(imgsz=imgsz)
+        return cascade_candidates(image, input_size, min_confidence)
+
+# ============================================================================
+# INFERENCE BATCHING
+# ============================================================================
+
+# Set on threads doing bulk job work (see background_priority)
+background_work = threading.local()
+
+
+@contextmanager
+def background_priority():
+    """Submit this thread's inference at low priority while the block runs (bulk jobs)"""
+    outer = getattr(background_work, "active", False)
+    background_work.active = True
+    try:
+        yield
+    finally:
+        background_work.active = outer
+
+
+def in_background() -> bool:
+    return getattr(background_work, "active", False)
+
+
+class InferenceBatcher:
+    """Dynamic micro-batching scheduler in front of the ONNX session
+
+    Worker threads submit preprocessed [n, 3, H, W] tensors and get a Future
+    for their [n, ...] slice of the model output. A single scheduler thread
+    takes the first queued submission, keeps collecting more until
+    max_batch_size images are queued or max_wait seconds have passed, runs
+    them as one batch through run_inference and resolves every Future.
+
+    Requests register with preparing() while they decode and preprocess; if
+    none are, nothing else can arrive soon and the batch is dispatched
+    without waiting.
+
+    With a session pool, `workers` scheduler threads take turns collecting
+    batches so up to that many batches run at once, one per session.
+
+    Submissions from background_priority() threads (bulk jobs) only run
+    when no interactive submission is queued and never join a batch started
+    by one, so an interactive request waits for at most the batch already
+    running. Background requests do not count as preparing.
+    """
+
+    INTERACTIVE, BACKGROUND, STOP = 0, 1, 2  # Queue priorities
+
+    def __init__(self, max_batch_size: int, max_wait: float, workers: int = 1):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.workers = max(1, workers)
+        # (priority, sequence, (input batch, future, model version) or None to stop)
+        self._queue: "queue.PriorityQueue[tuple]" = queue.PriorityQueue()
+        self._sequence = itertools.count()  # FIFO within a priority (also for entries put back)
+        self._lock = threading.Lock()
+        self._collect_lock = threading.Lock()
+        self._preparing = 0
+        self._threads: List[threading.Thread] = []
+
+        # Statistics
+        self._queued_images = 0
+        self._max_queued_images = 0
+        self._batches = 0
+        self._images = 0
+        self._background_images = 0
+        self._batch_sizes: Dict[int, int] = {}
+        self._requests_per_batch_total = 0
+
+    @property
+    def running(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self):
+        self._threads = [
+            threading.Thread(target=self._run, name=f"inference-batcher-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        for thread in self._threads:
+            if thread.is_alive():
+                self._queue.put((self.STOP, next(self._sequence), None))
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    @contextmanager
+    def preparing(self):
+        """Mark the calling request as about to submit images"""
+        if in_background():
+            yield
+            return
+        with self._lock:
+            self._preparing += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._preparing -= 1
+
+    def submit(self, input_batch: np.ndarray) -> Future:
+        """Queue a preprocessed batch; the Future resolves to its output slice
+
+        The batch runs on the caller's current model version (see pin_model),
+        at low priority on background_priority() threads.
+        """
+        future: Future = Future()
+        priority = self.BACKGROUND if in_background() else self.INTERACTIVE
+        with self._lock:
+            self._queued_images += input_batch.shape[0]
+            self._max_queued_images = max(self._max_queued_images, self._queued_images)
+            if priority == self.BACKGROUND:
+                self._background_images += input_batch.shape[0]
+        self._queue.put((priority, next(self._sequence), (input_batch, future, current_model())))
+        return future
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": self._queued_images,
+                "max_queue_depth": self._max_queued_images,
+                "batches": self._batches,
+                "images": self._images,
+                "background_images": self._background_images,
+                "mean_batch_size": round(self._images / self._batches, 2) if self._batches else 0.0,
+                "mean_requests_per_batch": round(self._requests_per_batch_total / self._batches, 2) if self._batches else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "workers": self.workers,
+            }
+
+    def _collect(self, first_entry: tuple) -> Tuple[List[tuple], bool]:
+        """Gather submissions for one model version and input size into one batch; returns (items, stop_requested)"""
+        first_priority, _, first = first_entry
+        items = [first]
+        size = first[0].shape[0]
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch_size:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                # Only wait if another request may still submit
+                with self._lock:
+                    others_preparing = self._preparing > 0
+                remaining = deadline - time.monotonic()
+                if not others_preparing or remaining <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=min(remaining, 0.001))
+                except queue.Empty:
+                    continue
+            priority, _, item = entry
+            if item is None:
+                return items, True
+            if (
+                (priority == self.BACKGROUND and first_priority == self.INTERACTIVE)
+                or item[2] is not first[2]
+                or item[0].shape[1:] != first[0].shape[1:]
+            ):
+                # Background work while this batch is interactive, or
+                # submitted on another model version (a reload happened) or
+                # at another resolution tier: put back (keeping its place)
+                # for the next batch
+                self._queue.put(entry)
+                break
+            items.append(item)
+            size += item[0].shape[0]
+
+        return items, False
+
+    def _batch_buffer(self, batches: List[np.ndarray], total: int, buffers: Dict[tuple, np.ndarray]) -> np.ndarray:
+        """A scheduler thread's reusable batch buffer for this input size, grown to fit total images"""
+        image_shape = batches[0].shape[1:]
+        buffer = buffers.get(image_shape)
+        if buffer is None or buffer.shape[0] < total:
+            buffer = buffers[image_shape] = np.empty((max(total, self.max_batch_size),) + image_shape, dtype=np.float32)
+        return buffer
+
+    def _run(self):
+        batch_buffers: Dict[tuple, np.ndarray] = {}
+        while True:
+            # One thread collects at a time so concurrent submissions fill
+            # one batch instead of being split across scheduler threads
+            with self._collect_lock:
+                first = self._queue.get()
+                if first[2] is None:
+                    return
+                items, stop_requested = self._collect(first)
+
+            futures = [future for _, future, _ in items]
+            counts = [batch.shape[0] for batch, _, _ in items]
+            total = sum(counts)
+
+            with self._lock:
+                self._queued_images -= total
+                self._batches += 1
+                self._images += total
+                self._batch_sizes[total] = self._batch_sizes.get(total, 0) + 1
+                self._requests_per_batch_total += len(items)
+
+            try:
+                with pin_model(items[0][2]):
+                    if len(items) == 1:
+                        outputs = run_inference(items[0][0])
+                    else:
+                        batches = [batch for batch, _, _ in items]
+                        batch_buffer = self._batch_buffer(batches, total, batch_buffers)
+                        outputs = run_inference(np.concatenate(batches, out=batch_buffer[:total]))
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+            else:
+                offset = 0
+                for future, count in zip(futures, counts):
+                    future.set_result(outputs[offset:offset + count])
+                    offset += count
+
+            if stop_requested:
+                return
+
+
+# ============================================================================
+# DETECTION CACHE
+# ============================================================================
+
+def detection_cache_key(img_bytes: bytes, input_size: Optional[Tuple[int, int]] = None, mode: str = "full") -> str:
+    """Cache key of an encoded image under the current model and preprocessing at a
+    (height, width) input size (default: the model's) in a detection_mode"""
+    height, width = input_size or model_input_size()
+    digest = hashlib.blake2b(img_bytes, digest_size=20)
+    model = current_model()
+    digest.update(f"|{model.hash if model is not None else None}|{width}x{height}|{FAST_JPEG_DECODE}|{CACHE_CANDIDATE_FLOOR}".encode())
+    if mode == "tiled":
+        digest.update(f"|tiled|{TILE_OVERLAP}|{TILE_MAX_TILES}".encode())
+    elif mode == "cascade":
+        digest.update(
+            f"|cascade|{CASCADE_ROI_CLASS}|{CASCADE_COARSE_TIER}|{CASCADE_MARGIN}|{CASCADE_SHELL_CONFIDENCE}|{CASCADE_MIN_ROI}".encode()
+        )
+    return digest.hexdigest()
+
+
+class DetectionCancelled(Exception):
+    """The request that owned a cache key stopped before processing the image"""
+
+
+class DetectionCache:
+    """Content-addressed cache of per-image detection candidates
+
+    Values are the Candidates extracted at CACHE_CANDIDATE_FLOOR, before the
+    request's confidence threshold and NMS, so one entry serves every
+    minConfidence / iouThreshold / maxDetections combination.
+
+    The in-memory tier is an LRU bounded by max_bytes with a TTL; with a
+    db_path, entries are also written to SQLite and read back after a
+    restart. Concurrent requests for the same key are coalesced: lookup()
+    hands the first caller ownership of the key (it must call put() or
+    release()) and gives everyone else a Future for its result.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float, db_path: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[Candidates, float, int]]" = OrderedDict()
+        self._in_flight: Dict[str, Future] = {}
+        self._bytes = 0
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+
+        # Statistics
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._evictions = 0
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS candidates "
+                "(key TEXT PRIMARY KEY, created REAL NOT NULL, data BLOB NOT NULL)"
+            )
+            self._db.execute("DELETE FROM candidates WHERE created < ?", (time.time() - ttl,))
+            self._db.commit()
+
+    def close(self):
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def lookup(self, key: str) -> Tuple[Optional[Candidates], Optional[Future]]:
+        """Find candidates for key
+
+        Returns (candidates, None) on a hit, (None, future) when another
+        request is already computing the same key, or (None, None) when the
+        caller now owns the key and must call put() or release().
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                candidates, created, size = entry
+                if now - created <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return candidates, None
+                del self._entries[key]
+                self._bytes -= size
+
+            future = self._in_flight.get(key)
+            if future is not None:
+                self._coalesced += 1
+                return None, future
+            self._in_flight[key] = Future()
+
+        stored = self._load(key, now)
+        if stored is not None:
+            candidates, created = stored
+            with self._lock:
+                self._disk_hits += 1
+            self._insert(key, candidates, created)
+            self._resolve(key, candidates)
+            return candidates, None
+
+        with self._lock:
+            self._misses += 1
+        return None, None
+
+    def put(self, key: str, candidates: Candidates):
+        """Store the candidates of an owned key and wake coalesced requests"""
+        created = time.time()
+        self._insert(key, candidates, created)
+        self._store(key, candidates, created)
+        self._resolve(key, candidates)
+
+    def release(self, key: str, error: Exception):
+        """Give up an owned key; coalesced requests receive the error"""
+        with self._lock:
+            future = self._in_flight.pop(key, None)
+        if future is not None:
+            future.set_exception(error)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._disk_hits + self._misses + self._coalesced
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "coalesced": self._coalesced,
+                "evictions": self._evictions,
+                "hit_rate": round((self._hits + self._disk_hits + self._coalesced) / lookups, 4) if lookups else 0.0,
+                "disk_path": self.db_path,
+            }
+
+    def _resolve(self, key: str, candidates: Candidates):
+        with self._lock:
+            future = self._in_flight.pop(key, None)
+        if future is not None:
+            future.set_result(candidates)
+
+    def _insert(self, key: str, candidates: Candidates, created: float):
+        size = candidates.boxes.nbytes + candidates.scores.nbytes + candidates.class_ids.nbytes + 256
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._entries[key] = (candidates, created, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._evictions += 1
+
+    def _store(self, key: str, candidates: Candidates, created: float):
+        if self._db is None:
+            return
+        # One float32 row per candidate: x1, y1, x2, y2, score, class id
+        data = np.column_stack([
+            candidates.boxes,
+            candidates.scores,
+            candidates.class_ids.astype(np.float32)
+        ]).astype(np.float32, copy=False)
+        with self._db_lock:
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO candidates (key, created, data) VALUES (?, ?, ?)",
+                (key, created, data.tobytes())
+            )
+            self._db.commit()
+
+    def _load(self, key: str, now: float) -> Optional[Tuple[Candidates, float]]:
+        if self._db is None:
+            return None
+        with self._db_lock:
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT created, data FROM candidates WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or now - row[0] > self.ttl:
+            return None
+        data = np.frombuffer(row[1], dtype=np.float32).reshape(-1, 6)
+        candidates = Candidates(
+            np.ascontiguousarray(data[:, :4]),
+            np.ascontiguousarray(data[:, 4]),
+            data[:, 5].astype(np.intp)
+        )
+        return candidates, row[0]
+
+
+async def run_in_inference_pool(func, *args, **kwargs):
+    """Run a blocking function on the inference pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(inference_executor, functools.partial(func, *args, **kwargs))
+
+
+def process_detection_request(
+    request: DetectionRequest,
+    timer: Optional[StageTimer] = None,
+    deadline: Optional[float] = None,
+    allow_partial: bool = False
+) -> List[ImageResult]:
+    """Decode, batch-infer and postprocess every image of a JSON request (blocking)"""
+    return process_images(
+        [(img_data.stepId, img_data.dataUrl) for img_data in request.images],
+        request,
+        timer,
+        deadline,
+        allow_partial
+    )
+
+
+def process_images(
+    sources: List[Tuple[str, Union[str, bytes]]],
+    options: DetectionRequest,
+    timer: Optional[StageTimer] = None,
+    deadline: Optional[float] = None,
+    allow_partial: bool = False
+) -> List[ImageResult]:
+    """Decode, batch-infer and postprocess (stepId, data URL or bytes) pairs (blocking)
+
+    Thresholds and NMS settings are taken from `options`; its `images` list
+    is ignored. Stage durations are added to `timer` (for Server-Timing)
+    and recorded in the stage histograms. Results are in request order.
+    The whole request runs on the model version active when it started.
+    Raises DeadlineExceeded if `deadline` (time.monotonic()) has already
+    passed. With `allow_partial`, images it passes for on the way come back
+    expired; otherwise all images run as one batch once started.
+    """
+    check_deadline(deadline)
+    first_chunk = None
+    if allow_partial and deadline is not None:
+        # Smallest images first in growing chunks, so images decoded
+        # before the deadline passes are already in inference
+        first_chunk = 1
+    else:
+        deadline = None
+    with pin_model():
+        results = dict(iter_image_results(sources, options, timer, first_chunk, deadline))
+    return [results[idx] for idx in range(len(sources))]
+
+
+def iter_image_results(
+    sources: List[Tuple[str, Union[str, bytes]]],
+    options: DetectionRequest,
+    timer: Optional[StageTimer] = None,
+    first_chunk: Optional[int] = None,
+    deadline: Optional[float] = None
+) -> Iterator[Tuple[int, ImageResult]]:
+    """Yield (request index, ImageResult) for each image as soon as it is done (blocking)
+
+    Cached images come first. Without `first_chunk` the rest are decoded and
+    run as one batch. With it they go smallest payload first, in chunks of
+    first_chunk, 2x, 4x ... images (up to the batch size); each chunk is
+    decoded while the previous one is in inference and the previous results
+    are yielded as soon as they are back, so the first results are ready
+    long before the last image. Images that fail get an empty result.
+    Once `deadline` (time.monotonic()) has passed, images not yet decoded,
+    or decoded but not yet submitted for inference, get an empty result
+    marked expired; images already in inference are still returned.
+    """
+    timer = timer if timer is not None else StageTimer()
+    images_total.inc(len(sources))
+    image_logger.debug("🔍 Processing %d images (confidence: %s)", len(sources), options.minConfidence)
+
+    # Cached candidates are extracted at CACHE_CANDIDATE_FLOOR; requests
+    # asking for less than that bypass the cache
+    cache = detection_cache
+    if cache is not None and options.minConfidence < CACHE_CANDIDATE_FLOOR:
+        cache = None
+    candidate_floor = CACHE_CANDIDATE_FLOOR if cache is not None else options.minConfidence
+    input_size = request_input_size(options.tier, options.imgsz)
+
+    pending = []  # (request index, image bytes or payload) still to decode
+    waiting = {}  # request index -> (Future of an identical image being processed elsewhere, image bytes)
+    owned = {}  # request index -> cache key this request must fill in
+    class_counts = Counter()
+
+    def finish(idx: int, candidates: Optional[Candidates]) -> Tuple[int, ImageResult]:
+        """Threshold and NMS one image's candidates (None = failed image)"""
+        step_id = sources[idx][0]
+        detections = []
+        if candidates is not None:
+            detections = select_detections(
+                candidates,
+                options.minConfidence,
+                iou_threshold=options.iouThreshold,
+                max_det=options.maxDetections,
+                class_agnostic=options.classAgnosticNms
+            )
+            class_counts.update(det.class_name for det in detections)
+            image_logger.debug(
+                "%s → Found %d detection(s): %s", step_id, len(detections), DetectionSummary(detections),
+                extra={"step_id": step_id}
+            )
+        timer.lap("nms")
+        return idx, ImageResult(stepId=step_id, detections=detections)
+
+    def expire(idx: int) -> Tuple[int, ImageResult]:
+        """Skip an image at the deadline"""
+        deadline_expired_total.inc(label="image")
+        if idx in owned:
+            cache.release(owned.pop(idx), DetectionCancelled())
+        timer.mark()
+        return idx, ImageResult(stepId=sources[idx][0], detections=[], expired=True)
+
+    def image_failed(idx: int, error: Exception):
+        errors_total.inc(label="image")
+        logger.warning("❌ Error (%s): %s", sources[idx][0], error, extra={"step_id": sources[idx][0]})
+        if idx in owned:
+            cache.release(owned.pop(idx), error)
+
+    def collect(future: Future, decoded: list) -> Iterator[Tuple[int, ImageResult]]:
+        """Results of one submitted chunk, in chunk order"""
+        timer.mark()
+        try:
+            outputs = future.result()
+        except Exception as batch_error:
+            errors_total.inc(len(decoded), label="inference")
+            logger.error("❌ Error: %s", batch_error, exc_info=True)
+            for idx, *_ in decoded:
+                if idx in owned:
+                    cache.release(owned.pop(idx), batch_error)
+                yield finish(idx, None)
+            return
+        timer.lap("inference")
+        for i, (idx, img_width, img_height, letterbox) in enumerate(decoded):
+            candidates = extract_candidates(
+                outputs[i:i + 1],
+                candidate_floor,
+                img_width,
+                img_height,
+                letterbox=letterbox
+            )
+            timer.lap("postprocess")
+            if idx in owned:
+                cache.put(owned.pop(idx), candidates)
+                timer.lap("cache")
+            yield finish(idx, candidates)
+            timer.mark()
+
+    def run_tiled(pending: list) -> Iterator[Tuple[int, ImageResult]]:
+        """One image at a time: decode at tile resolution, then its global
+        view and tiles go to the batcher as one batch and their candidates
+        are merged in image coordinates."""
+        target_size = tiled_decode_target(input_size)
+        for idx, payload in pending:
+            if deadline_passed(deadline):
+                yield expire(idx)
+                continue
+            timer.mark()
+            try:
+                image = decode_image_bytes(image_payload_bytes(payload), target_size)
+                img_width, img_height = original_image_size(image)
+                timer.lap("decode")
+                input_batch, views = preprocess_tiled(image, input_size)
+                del image
+                timer.lap("preprocess")
+            except Exception as img_error:
+                image_failed(idx, img_error)
+                yield finish(idx, None)
+                continue
+            if deadline_passed(deadline):
+                yield expire(idx)
+                continue
+            yield from collect_tiled(idx, submit_inference(input_batch), views, img_width, img_height)
+
+    def collect_tiled(idx: int, future: Future, views: list, img_width: int, img_height: int):
+        """The result of one tiled image"""
+        timer.mark()
+        try:
+            outputs = future.result()
+        except Exception as batch_error:
+            errors_total.inc(label="inference")
+            logger.error("❌ Error: %s", batch_error, exc_info=True)
+            if idx in owned:
+                cache.release(owned.pop(idx), batch_error)
+            yield finish(idx, None)
+            return
+        timer.lap("inference")
+        tiles_total.inc(len(views) - 1)
+        candidates = merge_tiled_candidates(outputs, views, candidate_floor, img_width, img_height)
+        timer.lap("postprocess")
+        if idx in owned:
+            cache.put(owned.pop(idx), candidates)
+            timer.lap("cache")
+        yield finish(idx, candidates)
+
+    def run_cascade(pending: list) -> Iterator[Tuple[int, ImageResult]]:
+        """One image at a time: decode large enough for the shell crop, then
+        the coarse and ROI passes (see cascade_candidates)."""
+        target_size = cascade_decode_target(input_size)
+        for idx, payload in pending:
+            if deadline_passed(deadline):
+                yield expire(idx)
+                continue
+            timer.mark()
+            try:
+                image = decode_image_bytes(image_payload_bytes(payload), target_size)
+                timer.lap("decode")
+                candidates = cascade_candidates(image, input_size, candidate_floor, timer)
+                del image
+            except Exception as img_error:
+                image_failed(idx, img_error)
+                yield finish(idx, None)
+                continue
+            if idx in owned:
+                cache.put(owned.pop(idx), candidates)
+                timer.lap("cache")
+            yield finish(idx, candidates)
+
+    def run_pending(pending: list) -> Iterator[Tuple[int, ImageResult]]:
+        """Decode and preprocess chunk by chunk into one input tensor (chunks
+        in inference keep their slice); only the original size and the
+        letterbox are kept per image. Inference is shared with concurrent
+        requests by the batcher."""
+        if options.tiled:
+            yield from run_tiled(pending)
+            return
+        if options.cascade:
+            yield from run_cascade(pending)
+            return
+        if first_chunk:
+            pending = sorted(pending, key=lambda item: len(item[1]))
+            chunk_size = max(1, first_chunk)
+        else:
+            chunk_size = max(1, len(pending))
+        max_chunk = max(chunk_size, MAX_BATCH_SIZE if model_batch_size is None else model_batch_size)
+        target_size = decode_target_size(input_size)
+        height, width = input_size
+        input_batch, scratch = preprocess_buffers(len(pending), height, width)
+        filled = 0  # Rows of input_batch in use
+        position = 0  # Next entry of pending
+        previous = None  # (Future, decoded) of the chunk in inference
+        while position < len(pending) or previous is not None:
+            current = None
+            if position < len(pending):
+                chunk = pending[position:position + chunk_size]
+                position += len(chunk)
+                chunk_size = min(chunk_size * 2, max_chunk)
+                decoded = []  # (request index, original width, original height, letterbox)
+                failed = []
+                skipped = []  # Reached after the deadline
+                preparing = inference_batcher.preparing() if inference_batcher is not None else nullcontext()
+                with preparing:
+                    for idx, payload in chunk:
+                        if previous is not None and previous[0].done():
+                            # The previous chunk came back while this one decodes
+                            yield from collect(*previous)
+                            previous = None
+                        if deadline_passed(deadline):
+                            skipped.append(idx)
+                            continue
+                        timer.mark()
+                        try:
+                            image = decode_image_bytes(image_payload_bytes(payload), target_size)
+                            img_width, img_height = original_image_size(image)
+                            timer.lap("decode")
+                            image_logger.debug(
+                                "Decoded %s (%dx%d at %dx%d)", sources[idx][0], img_width, img_height, *image.size,
+                                extra={"step_id": sources[idx][0]}
+                            )
+                            _, letterbox = preprocess_image(
+                                image, (1, 3, height, width), out=input_batch[filled + len(decoded)], scratch=scratch
+                            )
+                            decoded.append((idx, img_width, img_height, letterbox))
+                            timer.lap("preprocess")
+                        except Exception as img_error:
+                            image_failed(idx, img_error)
+                            failed.append(idx)
+                if decoded and deadline_passed(deadline):
+                    skipped.extend(idx for idx, *_ in decoded)
+                    decoded = []
+                if decoded:
+                    current = (submit_inference(input_batch[filled:filled + len(decoded)]), decoded)
+                    filled += len(decoded)
+                for idx in failed:
+                    yield finish(idx, None)
+                for idx in skipped:
+                    yield expire(idx)
+            if previous is not None:
+                yield from collect(*previous)
+            previous = current
+
+    try:
+        # Cache lookups first: hits are answered before anything is decoded.
+        # Without the cache, data URLs are only base64-decoded with their chunk.
+        for idx, (step_id, payload) in enumerate(sources):
+            if cache is None:
+                pending.append((idx, payload))
+                continue
+            if deadline_passed(deadline):
+                yield expire(idx)
+                continue
+            timer.mark()
+            try:
+                img_bytes = image_payload_bytes(payload)
+                timer.lap("decode")
+                key = detection_cache_key(img_bytes, input_size, detection_mode(options))
+                cached, in_flight = cache.lookup(key)
+                timer.lap("cache")
+                if cached is not None:
+                    image_logger.debug("Cache hit for %s", step_id, extra={"step_id": step_id})
+                    yield finish(idx, cached)
+                    continue
+                if in_flight is not None:
+                    image_logger.debug("Waiting for identical image (%s)", step_id, extra={"step_id": step_id})
+                    waiting[idx] = (in_flight, img_bytes)
+                    continue
+                owned[idx] = key
+                pending.append((idx, img_bytes))
+            except Exception as img_error:
+                image_failed(idx, img_error)
+                yield finish(idx, None)
+
+        yield from run_pending(pending)
+
+        # Images another request was already processing; if that request
+        # stopped early, run them here
+        retry = []
+        for idx, (future, img_bytes) in waiting.items():
+            timer.mark()
+            try:
+                candidates = future.result(None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                yield expire(idx)
+                continue
+            except DetectionCancelled:
+                retry.append((idx, img_bytes))
+                continue
+            except Exception as img_error:
+                image_failed(idx, img_error)
+                candidates = None
+            timer.lap("inference")
+            yield finish(idx, candidates)
+        yield from run_pending(retry)
+    finally:
+        # Stopped early (e.g. the client of a stream went away)
+        for key in owned.values():
+            cache.release(key, DetectionCancelled())
+
+    for class_name, count in class_counts.items():
+        detections_total.inc(count, label=class_name)
+    record_stage_metrics(timer)
+
+    logger.info(
+        "✅ Complete! Total detections: %d",
+        sum(class_counts.values()),
+        extra={"images": len(sources), "duration_ms": round(timer.total() * 1000, 2)}
+    )
+
+
+async def stream_image_results(
+    sources: List[Tuple[str, Union[str, bytes]]],
+    options: DetectionRequest,
+    endpoint: str,
+    deadline: Optional[float] = None
+) -> AsyncIterator[bytes]:
+    """NDJSON lines: a StreamResult per image as it completes, then a StreamSummary
+
+    The images are processed on the inference pool; results are handed to
+    the event loop one by one. If the client disconnects, processing stops
+    after the image in progress.
+    """
+    loop = asyncio.get_running_loop()
+    results: asyncio.Queue = asyncio.Queue()
+    cancelled = threading.Event()
+    timer = StageTimer()
+
+    def produce():
+        try:
+            check_deadline(deadline)
+            with pin_model(), closing(
+                iter_image_results(sources, options, timer, first_chunk=1, deadline=deadline)
+            ) as image_results:
+                for item in image_results:
+                    if cancelled.is_set():
+                        break
+                    loop.call_soon_threadsafe(results.put_nowait, item)
+        finally:
+            loop.call_soon_threadsafe(results.put_nowait, None)
+
+    first_result_ms = None
+    detections = 0
+    expired = 0
+    error = None
+    with request_metrics(endpoint):
+        producer = loop.run_in_executor(inference_executor, produce)
+        try:
+            while (item := await results.get()) is not None:
+                idx, result = item
+                if first_result_ms is None:
+                    first_result_ms = round(timer.total() * 1000, 2)
+                detections += len(result.detections)
+                expired += result.expired
+                line = StreamResult(
+                    index=idx, stepId=result.stepId, detections=result.detections, expired=result.expired
+                )
+                yield line.model_dump_json().encode() + b"\n"
+            await producer
+        except Exception as e:
+            errors_total.inc(label="request")
+            logger.error("❌ Error: %s", e)
+            error = str(e)
+        finally:
+            cancelled.set()
+
+    summary = StreamSummary(
+        success=error is None,
+        images=len(sources),
+        detections=detections,
+        expired=expired,
+        imgsz=max(request_input_size(options.tier, options.imgsz)),
+        time_to_first_result_ms=first_result_ms,
+        duration_ms=round(timer.total() * 1000, 2),
+        stages_ms={stage: round(seconds * 1000, 2) for stage, seconds in timer.durations.items()},
+        error=error
+    )
+    yield summary.model_dump_json().encode() + b"\n"
+
+
+# ============================================================================
+# LIVE DETECTION
+# ============================================================================
+
+def detect_frame(frame: bytes, options: DetectionRequest) -> List[Detection]:
+    """Detections for one live frame (blocking; no cache, no per-frame log line)"""
+    with pin_model():
+        height, width = request_input_size(options.tier, options.imgsz)
+        image = decode_image_bytes(frame, decode_target_size((height, width)))
+        img_width, img_height = original_image_size(image)
+        input_batch, scratch = preprocess_buffers(1, height, width)
+        _, letterbox = preprocess_image(image, (1, 3, height, width), out=input_batch[0], scratch=scratch)
+        outputs = infer(input_batch)
+    candidates = extract_candidates(outputs, options.minConfidence, img_width, img_height, letterbox=letterbox)
+    return select_detections(
+        candidates,
+        options.minConfidence,
+        iou_threshold=options.iouThreshold,
+        max_det=options.maxDetections,
+        class_agnostic=options.classAgnosticNms
+    )
+
+
+class LiveTrack:
+    """An object followed across live frames by DetectionSmoother"""
+
+    __slots__ = ("class_name", "box", "confidence", "hits")
+
+    def __init__(self, detection: Detection, window: int):
+        self.class_name = detection.class_name
+        self.box = np.array(detection.bbox, dtype=np.float32)
+        self.confidence = detection.confidence
+        self.hits = deque([True], maxlen=window)
+
+
+class DetectionSmoother:
+    """Temporal smoothing of a live session's detections over the last `window` frames
+
+    Each detection is matched to a track of the same class (IoU >=
+    MATCH_IOU); a matched track moves its box and confidence towards the
+    detection by ALPHA. A track is reported once it was seen in at least half
+    of the last `window` frames and dropped after `window` frames without a
+    match, so single-frame misses and false positives do not flicker. Works
+    on the detections only - no extra inference.
+    """
+
+    MATCH_IOU = 0.3
+    ALPHA = 0.5
+
+    def __init__(self, window: int):
+        self.window = window
+        self.min_hits = (window + 1) // 2
+        self.tracks: List[LiveTrack] = []
+
+    def update(self, detections: List[Detection]) -> List[Detection]:
+        detections = sorted(detections, key=lambda det: det.confidence, reverse=True)
+        matched = set()
+        new_tracks = []
+        if detections and self.tracks:
+            boxes = np.array([det.bbox for det in detections], dtype=np.float32)
+            ious = box_iou(boxes, np.stack([track.box for track in self.tracks]))
+            same_class = np.array([
+                [det.class_name == track.class_name for track in self.tracks] for det in detections
+            ])
+            ious[~same_class] = 0.0
+        for row, detection in enumerate(detections):
+            best = None
+            if self.tracks:
+                candidate_ious = ious[row].copy()
+                candidate_ious[list(matched)] = 0.0
+                best = int(np.argmax(candidate_ious))
+                if candidate_ious[best] < self.MATCH_IOU:
+                    best = None
+            if best is None:
+                new_tracks.append(LiveTrack(detection, self.window))
+                continue
+            track = self.tracks[best]
+            track.box += self.ALPHA * (boxes[row] - track.box)
+            track.confidence += self.ALPHA * (detection.confidence - track.confidence)
+            matched.add(best)
+
+        for i, track in enumerate(self.tracks):
+            track.hits.append(i in matched)
+        self.tracks = [track for track in self.tracks if any(track.hits)] + new_tracks
+        return [
+            Detection(class_name=track.class_name, confidence=track.confidence, bbox=track.box.tolist())
+            for track in self.tracks
+            if sum(track.hits) >= self.min_hits
+        ]
+
+
+class LiveSession:
+    """One /ws/live connection: the newest unprocessed frame plus frame counters"""
+
+    def __init__(self, smoothing: int):
+        self.frame: Optional[bytes] = None
+        self.frame_seq = 0  # Sequence number of self.frame (1 = first frame received)
+        self.closed = False
+        self._ready = asyncio.Event()
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self.smoother = DetectionSmoother(smoothing) if smoothing > 1 else None
+
+    def offer(self, frame: bytes):
+        """Keep only the newest frame; one still waiting is dropped"""
+        self.received += 1
+        if self.frame is not None:
+            self.dropped += 1
+            live_frames_total.inc(label="dropped")
+        self.frame = frame
+        self.frame_seq = self.received
+        self._ready.set()
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+    async def next_frame(self) -> Tuple[int, Optional[bytes]]:
+        """(sequence number, frame) of the newest frame, or (0, None) once closed"""
+        while self.frame is None and not self.closed:
+            self._ready.clear()
+            await self._ready.wait()
+        frame, self.frame = self.frame, None
+        return (self.frame_seq, frame) if frame is not None else (0, None)
+
+    def stats(self) -> dict:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return {
+            "type": "stats",
+            "frames_received": self.received,
+            "frames_processed": self.processed,
+            "frames_dropped": self.dropped,
+            "frames_failed": self.failed,
+            "input_fps": round(self.received / elapsed, 2),
+            "fps": round(self.processed / elapsed, 2),
+            "drop_rate": round(self.dropped / self.received, 4) if self.received else 0.0,
+        }
+
+
+async def receive_live_frames(websocket: WebSocket, session: LiveSession):
+    """Feed binary messages into the session until the client disconnects"""
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            frame = message.get("bytes")
+            if frame is None:
+                continue  # Text messages are not used
+            if len(frame) > LIVE_MAX_FRAME_BYTES:
+                session.received += 1
+                session.failed += 1
+                live_frames_total.inc(label="too_large")
+                continue
+            session.offer(frame)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        session.close()
+
+
+def compact_detections(detections: List[Detection], class_index: Dict[str, int]) -> List[list]:
+    """[class index, confidence, x1, y1, x2, y2] per detection, rounded for small messages"""
+    return [
+        [class_index.get(det.class_name, -1), round(det.confidence, 3), *(round(v, 1) for v in det.bbox)]
+        for det in detections
+    ]
+
+
+# ============================================================================
+# BULK DETECTION JOBS
+# ============================================================================
+
+class JobQueue:
+    """Durable queue of bulk detection jobs in a local SQLite database
+
+    A job is a row of detection options plus one row per image, holding
+    either the encoded image or a path below JOB_IMAGE_ROOT. claim() hands
+    out queued images of the oldest job a batch at a time; complete() stores
+    their results (dropping the image bytes) numbered by a per-job sequence
+    that clients page and stream by. Several processes (--workers) can share
+    one database: claims are write transactions, and requeue_stale() queues
+    again images whose claiming process is gone or whose claim is older
+    than JOB_LEASE_SECONDS.
     """
-    detections = []
 
-    print(f"[PostProcess] Raw output shape: {outputs.shape}")
+    # Status of a claimed image that is given back
+    REQUEUED = "CASE WHEN job_id IN (SELECT id FROM jobs WHERE status = 'cancelled') THEN 'cancelled' ELSE 'queued' END"
+    STATUS_COLUMNS = "id, status, images, completed, failed, created, started, finished"
 
-    # YOLOv8 outputs shape: [1, num_features, num_predictions]
-    # num_features = 4 (bbox) + num_classes
-    # We need to transpose to [num_predictions, num_features]
-    
-    if len(outputs.shape) == 3:
-        # Remove batch dimension and transpose: [1, 11, 8400] -> [8400, 11]
-        outputs = np.transpose(outputs[0], (1, 0))
-    elif len(outputs.shape) == 2:
-        # Already in [num_predictions, num_features] format
-        if outputs.shape[0] < outputs.shape[1]:
-            outputs = np.transpose(outputs, (1, 0))
-
-    print(f"[PostProcess] Transposed shape: {outputs.shape}")
-    
-    num_features = outputs.shape[1]
-    num_classes = num_features - 4  # First 4 are bbox coords
-    
-    print(f"[PostProcess] Detected {num_classes} classes in model output")
-    
-    # Check if we need to apply sigmoid (YOLOv8 ONNX may output raw logits)
-    # Sample the max class score to determine if sigmoid is needed
-    sample_scores = outputs[:100, 4:]  # First 100 detections
-    max_score = np.max(sample_scores)
-    needs_sigmoid = max_score > 1.0 or max_score < 0.0
-    
-    if needs_sigmoid:
-        print(f"[PostProcess] Applying sigmoid (max raw score: {max_score:.2f})")
-        # Apply sigmoid to class scores only (not bbox coords)
-        outputs[:, 4:] = sigmoid(outputs[:, 4:])
-    else:
-        print(f"[PostProcess] Scores already normalized (max: {max_score:.4f})")
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.wakeup = threading.Event()  # Set when this process queues a job
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = sqlite3.connect(
+            db_path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL, options TEXT NOT NULL, images INTEGER NOT NULL,"
+            " completed INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0,"
+            " created REAL NOT NULL, started REAL, finished REAL);"
+            "CREATE TABLE IF NOT EXISTS job_images ("
+            " job_id TEXT NOT NULL, idx INTEGER NOT NULL, step_id TEXT NOT NULL, path TEXT, payload BLOB,"
+            " status TEXT NOT NULL, owner INTEGER, claimed REAL, seq INTEGER, result TEXT, error TEXT,"
+            " PRIMARY KEY (job_id, idx));"
+            "CREATE INDEX IF NOT EXISTS job_images_status ON job_images (status);"
+            "CREATE INDEX IF NOT EXISTS job_images_seq ON job_images (job_id, seq);"
+        )
 
-    # Get model input size for scaling
-    model_size = input_shape[2] if input_shape else 640
+        # Statistics (this process)
+        self._claims = 0
+        self._processed = 0
+        self._failed = 0
+        self._requeued = 0
 
-    for detection in outputs:
-        # Extract box coordinates (first 4 values)
-        x_center, y_center, width, height = detection[:4]
-        
-        # Extract class scores (remaining values after bbox)
-        # YOLOv8 does NOT have objectness - class scores ARE the confidence
-        class_scores = detection[4:]
-        
-        # Get class with highest score
-        class_id = int(np.argmax(class_scores))
-        confidence = float(class_scores[class_id])
-        
-        # Skip low confidence detections
-        if confidence < min_confidence:
-            continue
+        # Claims of a previous run (the same pid is common after a container
+        # restart) or of processes that are gone
+        self.requeue_stale(startup=True)
+        self.purge()
 
-        # Convert from center format to corner format
-        # Scale from model coordinates to image coordinates
-        x1 = (x_center - width / 2) * img_width / model_size
-        y1 = (y_center - height / 2) * img_height / model_size
-        x2 = (x_center + width / 2) * img_width / model_size
-        y2 = (y_center + height / 2) * img_height / model_size
-
-        # Clip to image boundaries
-        x1 = max(0, min(x1, img_width))
-        y1 = max(0, min(y1, img_height))
-        x2 = max(0, min(x2, img_width))
-        y2 = max(0, min(y2, img_height))
-
-        # Get class name from mapping
-        class_name = CLASS_NAMES.get(class_id, f"unknown_class_{class_id}")
-        
-        detections.append(Detection(
-            class_name=class_name,
-            confidence=confidence,
-            bbox=[float(x1), float(y1), float(x2), float(y2)]
-        ))
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
 
-    # Apply Non-Maximum Suppression (NMS) to remove duplicate detections
-    if len(detections) > 0:
-        detections = apply_nms(detections, iou_threshold=0.5)
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """A write transaction (BEGIN IMMEDIATE: writers in other processes wait for it)"""
+        with self._lock:
+            if self._db is None:
+                raise RuntimeError("Job queue closed")
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
 
-    print(f"[PostProcess] Final detections after NMS: {len(detections)}")
-    
-    return detections
+    def submit(self, options: str, images: List[Tuple[str, Optional[str], Optional[bytes]]]) -> JobStatus:
+        """Queue (stepId, path, image bytes) images with DetectionRequest options JSON"""
+        job_id = uuid.uuid4().hex
+        with self._transaction() as db:
+            db.execute(
+                "INSERT INTO jobs (id, status, options, images, created) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, options, len(images), time.time())
+            )
+            db.executemany(
+                "INSERT INTO job_images (job_id, idx, step_id, path, payload, status) VALUES (?, ?, ?, ?, ?, 'queued')",
+                ((job_id, idx, step_id, path, payload) for idx, (step_id, path, payload) in enumerate(images))
+            )
+            status = self._status(db, job_id)
+        self.wakeup.set()
+        return status
 
+    def claim(self, limit: int) -> Optional[Tuple[str, str, float, List[tuple]]]:
+        """Claim up to `limit` queued images of the oldest job that has any
 
-def apply_nms(detections: List[Detection], iou_threshold: float = 0.5) -> List[Detection]:
-    """Apply Non-Maximum Suppression to remove overlapping detections"""
-    if len(detections) == 0:
-        return []
-    
-    # Sort by confidence (highest first)
-    detections = sorted(detections, key=lambda x: x.confidence, reverse=True)
-    
-    keep = []
-    
-    while detections:
-        # Keep the detection with highest confidence
-        best = detections.pop(0)
-        keep.append(best)
-        
-        # Remove detections that overlap too much with the best one
-        remaining = []
-        for det in detections:
-            if compute_iou(best.bbox, det.bbox) < iou_threshold:
-                remaining.append(det)
-        detections = remaining
-    
-    return keep
+        Returns (job id, options JSON, claim time, [(index, stepId, path,
+        image bytes)]), or None when nothing is queued. The claim time
+        identifies the claim in complete().
+        """
+        with self._transaction() as db:
+            row = db.execute("SELECT job_id FROM job_images WHERE status = 'queued' ORDER BY rowid LIMIT 1").fetchone()
+            if row is None:
+                return None
+            job_id = row[0]
+            images = db.execute(
+                "SELECT idx, step_id, path, payload FROM job_images "
+                "WHERE status = 'queued' AND job_id = ? ORDER BY rowid LIMIT ?",
+                (job_id, limit)
+            ).fetchall()
+            claimed = time.time()
+            db.executemany(
+                "UPDATE job_images SET status = 'running', owner = ?, claimed = ? WHERE job_id = ? AND idx = ?",
+                ((os.getpid(), claimed, job_id, idx) for idx, *_ in images)
+            )
+            db.execute(
+                "UPDATE jobs SET status = 'running', started = COALESCE(started, ?) WHERE id = ? AND status = 'queued'",
+                (claimed, job_id)
+            )
+            options = db.execute("SELECT options FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+        self._claims += 1
+        return job_id, options, claimed, images
 
+    def complete(self, job_id: str, claimed: float, results: List[Tuple[int, str, Optional[str]]]) -> Optional[JobStatus]:
+        """Store (index, ImageResult JSON, error) of claimed images
 
-def compute_iou(box1: List[float], box2: List[float]) -> float:
-    """Compute Intersection over Union (IoU) between two bounding boxes"""
-    x1_1, y1_1, x2_1, y2_1 = box1
-    x1_2, y1_2, x2_2, y2_2 = box2
-    
-    # Compute intersection
-    x1_i = max(x1_1, x1_2)
-    y1_i = max(y1_1, y1_2)
-    x2_i = min(x2_1, x2_2)
-    y2_i = min(y2_1, y2_2)
-    
-    if x2_i < x1_i or y2_i < y1_i:
-        return 0.0
-    
-    intersection = (x2_i - x1_i) * (y2_i - y1_i)
-    
-    # Compute union
-    area1 = (x2_1 - x1_1) * (y2_1 - y1_1)
-    area2 = (x2_2 - x1_2) * (y2_2 - y1_2)
-    union = area1 + area2 - intersection
-    
-    if union == 0:
-        return 0.0
-    
-    return intersection / union
+        Claimed images without a result are queued again. Results of a
+        claim that was meanwhile requeued (and maybe claimed elsewhere) are
+        ignored. The job is done once every image has a result; a cancelled
+        job's finish time moves to its last result.
+        """
+        now = time.time()
+        claim = (os.getpid(), claimed)
+        with self._transaction() as db:
+            row = db.execute("SELECT completed FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None  # Deleted meanwhile
+            seq = row[0]
+            failed = 0
+            for idx, result, error in results:
+                cursor = db.execute(
+                    "UPDATE job_images SET status = ?, seq = ?, result = ?, error = ?, payload = NULL "
+                    "WHERE job_id = ? AND idx = ? AND status = 'running' AND owner = ? AND claimed = ?",
+                    ("failed" if error else "done", seq + 1, result, error, job_id, idx, *claim)
+                )
+                if cursor.rowcount:
+                    seq += 1
+                    failed += error is not None
+            requeued = db.execute(
+                f"UPDATE job_images SET status = {self.REQUEUED}, owner = NULL, claimed = NULL "
+                "WHERE job_id = ? AND status = 'running' AND owner = ? AND claimed = ?",
+                (job_id, *claim)
+            ).rowcount
+            db.execute(
+                "UPDATE jobs SET completed = ?, failed = failed + ?, "
+                "status = CASE WHEN ? = images AND status != 'cancelled' THEN 'done' ELSE status END, "
+                "finished = CASE WHEN ? = images OR status = 'cancelled' THEN ? ELSE finished END "
+                "WHERE id = ?",
+                (seq, failed, seq, seq, now, job_id)
+            )
+            status = self._status(db, job_id)
+        self._processed += len(results)
+        self._failed += failed
+        self._requeued += requeued
+        return status
 
-def run_detection(image: Image.Image, min_confidence: float) -> List[Detection]:
-    """Run ONNX inference on image"""
-    if ort_session is None:
-        raise RuntimeError("Model not loaded")
+    def cancel(self, job_id: str) -> Optional[JobStatus]:
+        """Cancel a queued or running job (images already claimed still finish)"""
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status IN ('queued', 'running')",
+                (time.time(), job_id)
+            )
+            if cursor.rowcount:
+                db.execute(
+                    "UPDATE job_images SET status = 'cancelled', payload = NULL WHERE job_id = ? AND status = 'queued'",
+                    (job_id,)
+                )
+            return self._status(db, job_id)
 
-    # Store original image size
-    img_width, img_height = image.size
+    def requeue_stale(self, startup: bool = False) -> int:
+        """Queue again images claimed by processes that are gone (or this one, at startup) or too long ago"""
+        with self._transaction() as db:
+            owners = [row[0] for row in db.execute("SELECT DISTINCT owner FROM job_images WHERE status = 'running'")]
+            gone = [owner for owner in owners if (startup and owner == os.getpid()) or not process_alive(owner)]
+            requeued = db.execute(
+                f"UPDATE job_images SET status = {self.REQUEUED}, owner = NULL, claimed = NULL "
+                f"WHERE status = 'running' AND (claimed < ? OR owner IN ({', '.join('?' * len(gone))}))",
+                (time.time() - JOB_LEASE_SECONDS, *gone)
+            ).rowcount
+        if requeued:
+            logger.info("♻️  Requeued %d job images of interrupted claims", requeued)
+        self._requeued += requeued
+        return requeued
 
-    # Preprocess image
-    input_data = preprocess_image(image, input_shape)
+    def purge(self) -> int:
+        """Delete jobs that finished more than JOB_RETENTION_SECONDS ago"""
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        with self._transaction() as db:
+            db.execute("DELETE FROM job_images WHERE job_id IN (SELECT id FROM jobs WHERE finished < ?)", (cutoff,))
+            return db.execute("DELETE FROM jobs WHERE finished < ?", (cutoff,)).rowcount
 
-    # Run inference
-    outputs = ort_session.run(None, {input_name: input_data})
+    def status(self, job_id: str) -> Optional[JobStatus]:
+        with self._lock:
+            return self._status(self._db, job_id)
 
-    # Postprocess outputs
-    detections = postprocess_detections(
-        outputs[0],
-        min_confidence,
-        img_width,
-        img_height
+    def recent(self, limit: int = 100) -> List[JobStatus]:
+        """The most recently created jobs"""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {self.STATUS_COLUMNS} FROM jobs ORDER BY created DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [job_status(row) for row in rows]
+
+    def results(self, job_id: str, after: int = 0, limit: int = JOB_RESULTS_PAGE) -> Optional[Tuple[JobStatus, List[JobResult]]]:
+        """The job's status and its results with seq > after, in seq order (None = no such job)
+
+        The status is read first, so a finished status means every result
+        is already visible.
+        """
+        with self._lock:
+            status = self._status(self._db, job_id)
+            if status is None:
+                return None
+            rows = self._db.execute(
+                "SELECT idx, seq, result, error FROM job_images WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (job_id, after, limit)
+            ).fetchall()
+        return status, [
+            JobResult(index=idx, seq=seq, error=error, **json.loads(result)) for idx, seq, result, error in rows
+        ]
+
+    def stats(self) -> dict:
+        return {
+            "db_path": self.db_path,
+            "claims": self._claims,
+            "processed": self._processed,
+            "failed": self._failed,
+            "requeued": self._requeued,
+            "batch_size": JOB_BATCH_SIZE,
+        }
+
+    def _status(self, db: sqlite3.Connection, job_id: str) -> Optional[JobStatus]:
+        if db is None:
+            raise RuntimeError("Job queue closed")
+        row = db.execute(f"SELECT {self.STATUS_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return job_status(row) if row is not None else None
+
+
+def job_status(row: tuple) -> JobStatus:
+    """JobStatus of a JobQueue.STATUS_COLUMNS row"""
+    job_id, status, images, completed, failed, created, started, finished = row
+    rate = None
+    if started is not None:
+        elapsed = (finished or time.time()) - started
+        rate = round(completed / elapsed, 2) if elapsed > 0 else None
+    return JobStatus(
+        id=job_id, status=status, images=images, completed=completed, failed=failed,
+        created=created, started=started, finished=finished, images_per_second=rate
     )
 
-    return detections
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Exists, owned by another user
+    return True
+
+
+def lower_thread_priority(increment: int):
+    """Raise the calling thread's nice value (Linux schedules threads individually; elsewhere a no-op)"""
+    if increment <= 0 or platform.system() != "Linux":
+        return
+    try:
+        tid = threading.get_native_id()
+        os.setpriority(os.PRIO_PROCESS, tid, os.getpriority(os.PRIO_PROCESS, tid) + increment)
+    except OSError as e:
+        logger.warning("⚠️  Could not lower the job runner's priority: %s", e)
+
+
+def job_image_path(path: str) -> Path:
+    """A job image path resolved below JOB_IMAGE_ROOT (ValueError without a root or outside it)"""
+    if not JOB_IMAGE_ROOT:
+        raise ValueError("Image paths need a job image root (JOB_IMAGE_ROOT / --job-image-root); send dataUrl instead")
+    root = Path(JOB_IMAGE_ROOT).resolve()
+    resolved = (root / path).resolve()
+    if not resolved.is_relative_to(root):
+        raise ValueError(f"{path} is outside the job image root")
+    return resolved
+
+
+def queue_job(jobs: JobQueue, request: JobRequest) -> JobStatus:
+    """Check the paths, decode the data URLs and queue the job (blocking)"""
+    images = []
+    for image in request.images:
+        if image.path is not None:
+            job_image_path(image.path)
+            images.append((image.stepId, image.path, None))
+        else:
+            images.append((image.stepId, None, data_url_to_bytes(image.dataUrl)))
+    return jobs.submit(request.model_dump_json(exclude={"images"}), images)
+
+
+def run_job_batch(options_json: str, images: List[tuple], stop: threading.Event) -> List[Tuple[int, str, Optional[str]]]:
+    """(index, ImageResult JSON, error) of claimed job images, run at background priority (blocking)
+
+    Unreadable files get an empty result and an error; images that fail to
+    decode get an empty result, as in /detect. Stops after the current
+    image once `stop` is set (the rest are requeued by complete()).
+    """
+    options = DetectionRequest(images=[], **json.loads(options_json))
+    results = []
+    indices, sources = [], []
+    for idx, step_id, path, payload in images:
+        if payload is None:
+            try:
+                payload = job_image_path(path).read_bytes()
+            except (OSError, ValueError) as e:
+                results.append((idx, ImageResult(stepId=step_id, detections=[]).model_dump_json(), str(e)))
+                continue
+        indices.append(idx)
+        sources.append((step_id, payload))
+    job_images_total.inc(len(results), label="failed")
+
+    if sources:
+        with background_priority(), pin_model(), closing(iter_image_results(sources, options)) as image_results:
+            for position, result in image_results:
+                results.append((indices[position], result.model_dump_json(), None))
+                job_images_total.inc(label="done")
+                if stop.is_set():
+                    break
+    return results
+
+
+def run_jobs(jobs: JobQueue, stop: threading.Event):
+    """Job runner thread: claim and process queued images while no /detect request is in progress"""
+    lower_thread_priority(JOB_NICENESS)
+    last_maintenance = time.monotonic()
+    while not stop.is_set():
+        if ort_session is None or (admission is not None and admission.admitted > 0):
+            stop.wait(JOB_POLL_SECONDS)
+            continue
+        try:
+            claim = jobs.claim(JOB_BATCH_SIZE)
+            if claim is None:
+                if time.monotonic() - last_maintenance >= 60:
+                    jobs.requeue_stale()
+                    jobs.purge()
+                    last_maintenance = time.monotonic()
+                jobs.wakeup.wait(1.0)
+                jobs.wakeup.clear()
+                continue
+        except (sqlite3.Error, RuntimeError) as e:
+            logger.error("❌ Job queue error: %s", e)
+            stop.wait(1.0)
+            continue
+
+        job_id, options, claimed, images = claim
+        try:
+            results = run_job_batch(options, images, stop)
+        except Exception as e:
+            # Fail the batch rather than retrying it forever
+            errors_total.inc(label="job_batch")
+            logger.error("❌ Job batch failed (%s): %s", job_id, e, extra={"job_id": job_id})
+            results = [
+                (idx, ImageResult(stepId=step_id, detections=[]).model_dump_json(), str(e))
+                for idx, step_id, _, _ in images
+            ]
+        try:
+            status = jobs.complete(job_id, claimed, results)
+        except (sqlite3.Error, RuntimeError) as e:
+            logger.error("❌ Job queue error: %s", e)
+            continue
+        if status is not None and status.status == "done":
+            logger.info(
+                "📦 Job %s done: %d images at %s images/s", job_id, status.images, status.images_per_second,
+                extra={"job_id": job_id, "failed": status.failed}
+            )
+
+
+async def stream_job(jobs: JobQueue, job_id: str, after: int) -> AsyncIterator[bytes]:
+    """NDJSON: JobResult lines as results are stored, a JobStatus line after each batch of them
+
+    Ends with a JobStatus line once the job is done or cancelled.
+    """
+    while True:
+        found = await asyncio.to_thread(jobs.results, job_id, after)
+        if found is None:
+            return  # Deleted meanwhile
+        status, results = found
+        for result in results:
+            yield result.model_dump_json().encode() + b"\n"
+        finished = status.status in ("done", "cancelled") and len(results) < JOB_RESULTS_PAGE
+        if results:
+            after = results[-1].seq
+        if results or finished:
+            yield status.model_dump_json().encode() + b"\n"
+        if finished:
+            return
+        if len(results) < JOB_RESULTS_PAGE:
+            await asyncio.sleep(JOB_STREAM_POLL_SECONDS)
+
 
 # ============================================================================
 # API ENDPOINTS
@@ -432,72 +4053,551 @@ async def root():
         "runtime": "ONNX Runtime (CPU)",
         "endpoints": {
             "health": "/health",
-            "detect": "/detect (POST)"
+            "live": "/live",
+            "ready": "/ready",
+            "stats": "/stats",
+            "metrics": "/metrics",
+            "detect": "/detect (POST)",
+            "detect_multipart": "/detect/multipart (POST, multipart/form-data)",
+            "detect_stream": "/detect/stream (POST, NDJSON response)",
+            "detect_multipart_stream": "/detect/multipart/stream (POST, multipart/form-data, NDJSON response)",
+            "live_detection": "/ws/live (WebSocket, binary frames in, JSON detections out)",
+            "admin_reload": "/admin/reload (POST, hot model reload)",
+            "jobs": "/jobs (POST bulk job; GET /jobs/{id}, /jobs/{id}/results, /jobs/{id}/stream; DELETE cancels)"
         }
     }
 
 @app.get("/health")
 async def health():
     """Health check endpoint"""
-    if ort_session is None:
-        raise HTTPException(status_code=503, detail="Model not loaded")
+    await require_model(HEALTH_READY_WAIT_SECONDS)
 
     return {
         "status": "healthy",
         "model_loaded": True,
         "runtime": "ONNX Runtime",
-        "model_classes": list(CLASS_NAMES.values())
+        "model_classes": list(CLASS_NAMES.values()),
+        "model_variant": MODEL_VARIANT,
+        "model": active_model.info() if active_model is not None else None,
+        "sessions": session_config
+    }
+
+@app.get("/live")
+async def live():
+    """Liveness: the process is up and serving HTTP (model may still be loading)"""
+    return {"status": "alive", "startup": startup_status, "pid": os.getpid()}
+
+@app.get("/ready")
+async def ready(response: Response):
+    """Readiness: the model is loaded and warmed up (503 until then)"""
+    if ort_session is None:
+        response.status_code = 503
+    return {
+        "status": "ready" if ort_session is not None else startup_status,
+        "error": startup_error,
+        "startup": startup_report,
+        "model": active_model.info() if active_model is not None else None,
+        "pid": os.getpid(),
+        "worker": worker_id,
+    }
+
+@app.get("/stats")
+async def stats():
+    """Process memory, request queue, inference batching, result cache and job statistics"""
+    return {
+        "process": {"pid": os.getpid(), "worker": worker_id, "memory": process_memory()},
+        "inference_workers": INFERENCE_WORKERS,
+        "live_sessions": {"open": len(open_live_sessions), "max": LIVE_MAX_SESSIONS},
+        "admission": admission.stats() if admission is not None else None,
+        "batching": inference_batcher.stats() if inference_batcher is not None else None,
+        "cache": detection_cache.stats() if detection_cache is not None else None,
+        "jobs": job_queue.stats() if job_queue is not None else None
     }
 
+def check_admin(request: Request):
+    """Admin endpoints need the ADMIN_TOKEN header, or a local client when no token is configured"""
+    if ADMIN_TOKEN:
+        if not hmac.compare_digest(request.headers.get("x-admin-token", ""), ADMIN_TOKEN):
+            raise HTTPException(status_code=403, detail="Invalid admin token")
+    elif request.client is None or request.client.host not in ("127.0.0.1", "::1", "localhost"):
+        raise HTTPException(status_code=403, detail="Admin endpoints are local-only without ADMIN_TOKEN")
+
+@app.post("/admin/reload")
+async def admin_reload(http_request: Request, request: Optional[ReloadRequest] = None):
+    """
+    Hot-reload the model without downtime
+
+    The new version is loaded and warmed up while the current one keeps
+    serving, then swapped in; requests already running finish on the old
+    version. Returns after the swap. With --workers, this reloads only the
+    worker that answers; use --watch-model to reload every worker.
+    """
+    check_admin(http_request)
+    request = request or ReloadRequest()
+    try:
+        return await asyncio.to_thread(reload_model, request.path, request.force)
+    except ReloadInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error("❌ Model reload failed, keeping the current version: %s", e)
+        raise HTTPException(status_code=500, detail=f"Reload failed: {e}")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics (stage latency histograms, counters, gauges)"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.post("/detect", response_model=DetectionResponse)
-async def detect(request: DetectionRequest):
+async def detect(
+    request: DetectionRequest,
+    response: Response,
+    x_deadline_ms: Optional[float] = Header(None, gt=0),
+    x_allow_partial: bool = Header(False)
+):
     """
     Main detection endpoint
 
-    Accepts multiple images and returns YOLO detections for each
+    Accepts multiple images and returns YOLO detections for each. 429 when
+    the request queue is full, 504 when X-Deadline-Ms passed before
+    processing started; with X-Allow-Partial: true, images it passes for
+    later come back expired.
     """
+    deadline = request_deadline(x_deadline_ms)
+    await require_model()
     try:
-        if ort_session is None:
-            raise HTTPException(status_code=503, detail="Model not loaded")
+        timer = StageTimer()
+        with request_metrics("detect"):
+            results_list = await run_in_inference_pool(
+                process_detection_request, request, timer, deadline, x_allow_partial
+            )
+        response.headers["Server-Timing"] = timer.server_timing()
+
+        return DetectionResponse(
+            success=True,
+            results=results_list,
+            imgsz=max(request_input_size(request.tier, request.imgsz)),
+            partial=any(result.expired for result in results_list)
+        )
+
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.error("❌ Error: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/detect/multipart", response_model=DetectionResponse)
+async def detect_multipart(
+    response: Response,
+    images: List[UploadFile] = File(...),
+    stepId: List[str] = Form(default=[]),
+    minConfidence: float = Form(0.5),
+    iouThreshold: float = Form(NMS_IOU_THRESHOLD),
+    maxDetections: int = Form(NMS_MAX_DETECTIONS),
+    classAgnosticNms: bool = Form(False),
+    tier: Optional[str] = Form(None),
+    imgsz: Optional[int] = Form(None),
+    tiled: bool = Form(False),
+    cascade: bool = Form(False),
+    x_deadline_ms: Optional[float] = Header(None, gt=0),
+    x_allow_partial: bool = Header(False)
+):
+    """
+    Binary multipart detection endpoint
+
+    Same as /detect, but takes raw JPEG parts (field "images") with one
+    "stepId" field per image, in the same order, instead of base64 data URLs
+    in JSON. If no stepId fields are sent, each part's filename is used.
+    """
+    check_step_ids(images, stepId)
+    options = form_options(
+        minConfidence=minConfidence,
+        iouThreshold=iouThreshold,
+        maxDetections=maxDetections,
+        classAgnosticNms=classAgnosticNms,
+        tier=tier,
+        imgsz=imgsz,
+        tiled=tiled,
+        cascade=cascade
+    )
+    deadline = request_deadline(x_deadline_ms)
+    await require_model()
+
+    try:
+        sources = await multipart_sources(images, stepId)
+
+        timer = StageTimer()
+        with request_metrics("detect_multipart"):
+            results_list = await run_in_inference_pool(
+                process_images, sources, options, timer, deadline, x_allow_partial
+            )
+        response.headers["Server-Timing"] = timer.server_timing()
+
+        return DetectionResponse(
+            success=True,
+            results=results_list,
+            imgsz=max(request_input_size(options.tier, options.imgsz)),
+            partial=any(result.expired for result in results_list)
+        )
+
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.error("❌ Error: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/detect/stream")
+async def detect_stream(request: DetectionRequest, x_deadline_ms: Optional[float] = Header(None, gt=0)):
+    """
+    Streaming detection endpoint
+
+    Same request as /detect. The response is NDJSON: one StreamResult line
+    per image as soon as it is processed (in completion order - use "index"
+    or "stepId" to match them up), then one StreamSummary line with the
+    totals, time to first result and per-stage timings.
+    """
+    deadline = request_deadline(x_deadline_ms)
+    await require_model()
+
+    sources = [(img_data.stepId, img_data.dataUrl) for img_data in request.images]
+    return StreamingResponse(
+        stream_image_results(sources, request, "detect_stream", deadline),
+        media_type="application/x-ndjson"
+    )
+
+@app.post("/detect/multipart/stream")
+async def detect_multipart_stream(
+    images: List[UploadFile] = File(...),
+    stepId: List[str] = Form(default=[]),
+    minConfidence: float = Form(0.5),
+    iouThreshold: float = Form(NMS_IOU_THRESHOLD),
+    maxDetections: int = Form(NMS_MAX_DETECTIONS),
+    classAgnosticNms: bool = Form(False),
+    tier: Optional[str] = Form(None),
+    imgsz: Optional[int] = Form(None),
+    tiled: bool = Form(False),
+    cascade: bool = Form(False),
+    x_deadline_ms: Optional[float] = Header(None, gt=0)
+):
+    """Streaming variant of /detect/multipart (NDJSON response as /detect/stream)"""
+    check_step_ids(images, stepId)
+    options = form_options(
+        minConfidence=minConfidence,
+        iouThreshold=iouThreshold,
+        maxDetections=maxDetections,
+        classAgnosticNms=classAgnosticNms,
+        tier=tier,
+        imgsz=imgsz,
+        tiled=tiled,
+        cascade=cascade
+    )
+    deadline = request_deadline(x_deadline_ms)
+    await require_model()
+
+    sources = await multipart_sources(images, stepId)
+    return StreamingResponse(
+        stream_image_results(sources, options, "detect_multipart_stream", deadline),
+        media_type="application/x-ndjson"
+    )
+
+def require_jobs() -> JobQueue:
+    if job_queue is None:
+        raise HTTPException(status_code=503, detail="Bulk jobs are disabled (no JOB_DB_PATH)")
+    return job_queue
+
+@app.post("/jobs", response_model=JobStatus, status_code=202)
+async def submit_job(request: JobRequest):
+    """
+    Bulk detection job
+
+    Queues the images (data URLs, or paths below JOB_IMAGE_ROOT) with the
+    /detect options and returns the job at once. Poll /jobs/{id}, page
+    through /jobs/{id}/results or follow /jobs/{id}/stream. Jobs survive
+    restarts and run at low priority, behind /detect requests.
+    """
+    jobs = require_jobs()
+    if not request.images:
+        raise HTTPException(status_code=422, detail="A job needs at least one image")
+    try:
+        return await asyncio.to_thread(queue_job, jobs, request)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+@app.get("/jobs", response_model=List[JobStatus])
+async def list_jobs(limit: int = Query(100, ge=1, le=1000)):
+    """Most recently submitted jobs"""
+    return await asyncio.to_thread(require_jobs().recent, limit)
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    """Job progress"""
+    status = await asyncio.to_thread(require_jobs().status, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="No such job")
+    return status
+
+@app.get("/jobs/{job_id}/results", response_model=JobResults)
+async def get_job_results(
+    job_id: str,
+    after: int = Query(0, ge=0),
+    limit: int = Query(JOB_RESULTS_PAGE, ge=1, le=JOB_RESULTS_PAGE)
+):
+    """Results stored after sequence number `after` (pass `next` to get the following page)"""
+    found = await asyncio.to_thread(require_jobs().results, job_id, after, limit)
+    if found is None:
+        raise HTTPException(status_code=404, detail="No such job")
+    status, results = found
+    return JobResults(job=status, results=results, next=results[-1].seq if results else after)
 
-        print(f"\n🔍 Processing {len(request.images)} images (confidence: {request.minConfidence})")
+@app.get("/jobs/{job_id}/stream")
+async def stream_job_results(job_id: str, after: int = Query(0, ge=0)):
+    """
+    Streaming job results
+
+    NDJSON: a JobResult line per image as results are stored (after
+    sequence number `after`), a JobStatus line ("type": "job") after each
+    batch of them, and a last JobStatus line once the job is done or
+    cancelled. Reconnect with the last seen seq as `after` to resume.
+    """
+    jobs = require_jobs()
+    if await asyncio.to_thread(jobs.status, job_id) is None:
+        raise HTTPException(status_code=404, detail="No such job")
+    return StreamingResponse(stream_job(jobs, job_id, after), media_type="application/x-ndjson")
+
+@app.delete("/jobs/{job_id}", response_model=JobStatus)
+async def cancel_job(job_id: str):
+    """Cancel a job; images already being processed still get results"""
+    status = await asyncio.to_thread(require_jobs().cancel, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="No such job")
+    return status
 
-        results_list = []
+@app.websocket("/ws/live")
+async def live_detection(
+    websocket: WebSocket,
+    minConfidence: float = 0.5,
+    iouThreshold: float = NMS_IOU_THRESHOLD,
+    maxDetections: int = LIVE_MAX_DETECTIONS,
+    smoothing: int = 0,
+    tier: str = "speed",
+    imgsz: Optional[int] = None
+):
+    """
+    Live viewfinder detection over a WebSocket
+
+    The client sends each camera frame as one binary message (a small JPEG,
+    e.g. 640x480). Only the newest frame is processed: frames that arrive
+    while the previous one is in inference replace each other and are
+    counted as dropped. Messages to the client (JSON text):
+      {"type": "hello", "classes": [...], ...}  once, after connecting
+      {"type": "frame", "seq": n, "ms": ..., "detections": [[class, conf, x1, y1, x2, y2], ...]}
+      {"type": "stats", "fps": ..., "drop_rate": ..., ...}  every LIVE_STATS_SECONDS
+    `class` indexes the hello message's class list. smoothing=N (N >= 2)
+    stabilizes boxes over the last N frames without extra inference.
+    Frames run at the "speed" tier unless `tier` or `imgsz` says otherwise
+    (on dynamic-size models; see RESOLUTION_TIERS).
+    """
+    await websocket.accept()
+    try:
+        options = DetectionRequest(
+            images=[],
+            minConfidence=minConfidence,
+            iouThreshold=iouThreshold,
+            maxDetections=maxDetections,
+            tier=tier,
+            imgsz=imgsz
+        )
+    except ValidationError as e:
+        await websocket.close(code=1008, reason=e.errors()[0]["msg"][:120])
+        return
+    try:
+        await require_model()
+    except HTTPException as e:
+        await websocket.close(code=1011 if e.detail == "Model not loaded" else 1013, reason=e.detail)
+        return
+    if len(open_live_sessions) >= LIVE_MAX_SESSIONS:
+        live_frames_total.inc(label="session_refused")
+        await websocket.close(code=1013, reason="Too many live sessions")
+        return
 
-        for idx, img_data in enumerate(request.images, 1):
+    classes = [CLASS_NAMES[i] for i in sorted(CLASS_NAMES)]
+    class_index = {name: i for i, name in enumerate(classes)}
+    session = LiveSession(smoothing)
+    open_live_sessions.add(session)
+    live_sessions.inc()
+    receiver = asyncio.create_task(receive_live_frames(websocket, session))
+    try:
+        await websocket.send_json({
+            "type": "hello",
+            "classes": classes,
+            "max_frame_bytes": LIVE_MAX_FRAME_BYTES,
+            "smoothing": session.smoother.window if session.smoother is not None else 0,
+            "imgsz": max(request_input_size(options.tier, options.imgsz))
+        })
+        next_stats = time.monotonic() + LIVE_STATS_SECONDS
+        while True:
+            seq, frame = await session.next_frame()
+            if frame is None:
+                break
+            start = time.perf_counter()
             try:
-                # Decode image
-                image = decode_base64_image(img_data.dataUrl)
-                print(f"   [{idx}/{len(request.images)}] Processing {img_data.stepId} ({image.size[0]}x{image.size[1]})")
+                detections = await run_in_inference_pool(detect_frame, frame, options)
+            except Exception as e:
+                session.failed += 1
+                live_frames_total.inc(label="failed")
+                await websocket.send_json({"type": "error", "seq": seq, "error": str(e)})
+                continue
+            if session.smoother is not None:
+                detections = session.smoother.update(detections)
+            session.processed += 1
+            live_frames_total.inc(label="processed")
+            await websocket.send_json({
+                "type": "frame",
+                "seq": seq,
+                "ms": round((time.perf_counter() - start) * 1000, 1),
+                "detections": compact_detections(detections, class_index)
+            })
+            if time.monotonic() >= next_stats:
+                await websocket.send_json(session.stats())
+                next_stats = time.monotonic() + LIVE_STATS_SECONDS
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        open_live_sessions.discard(session)
+        live_sessions.dec()
+        logger.info("📹 Live session closed", extra=session.stats())
 
-                # Run detection
-                detections = run_detection(image, request.minConfidence)
+def check_step_ids(images: List[UploadFile], step_ids: List[str]):
+    """Reject multipart requests whose stepId fields do not pair up with the images"""
+    if step_ids and len(step_ids) != len(images):
+        raise HTTPException(
+            status_code=422,
+            detail=f"Got {len(step_ids)} stepId fields for {len(images)} images"
+        )
 
-                print(f"      → Found {len(detections)} detection(s)")
-                for det in detections:
-                    print(f"         - {det.class_name}: {det.confidence:.2%}")
+def form_options(**fields) -> DetectionRequest:
+    """Detection options from multipart form fields (invalid values are a 422, as in JSON bodies)"""
+    try:
+        return DetectionRequest(images=[], **fields)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
 
-                results_list.append(ImageResult(
-                    stepId=img_data.stepId,
-                    detections=detections
-                ))
+async def multipart_sources(images: List[UploadFile], step_ids: List[str]) -> List[Tuple[str, bytes]]:
+    """(stepId, JPEG bytes) pairs; parts without a stepId field are named by filename"""
+    step_ids = step_ids or [upload.filename or f"image_{i}" for i, upload in enumerate(images)]
+    return [(step_id, await upload.read()) for step_id, upload in zip(step_ids, images)]
 
-            except Exception as img_error:
-                print(f"      ❌ Error: {str(img_error)}")
-                # Continue processing other images even if one fails
-                results_list.append(ImageResult(
-                    stepId=img_data.stepId,
-                    detections=[]
-                ))
+# ============================================================================
+# PRE-FORK WORKERS
+# ============================================================================
 
-        total_detections = sum(len(r.detections) for r in results_list)
-        print(f"✅ Complete! Total detections: {total_detections}\n")
+def run_worker(index: int, sock: socket.socket, config: uvicorn.Config) -> int:
+    """Body of a forked worker: serve the app on the inherited socket, return the exit code"""
+    global worker_id
+    worker_id = index
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    configure_logging(LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_RATE)
+    try:
+        uvicorn.Server(config).run(sockets=[sock])
+        return 0
+    except Exception:
+        logger.exception("❌ Worker %d failed", index)
+        return 1
+    finally:
+        shutdown_logging()
+
+def log_worker_memory(children: Dict[int, int]):
+    """One log line with RSS / PSS / private MB of the parent and every worker"""
+    workers = {
+        index: {"pid": pid, **process_memory(pid)}
+        for pid, index in sorted(children.items(), key=lambda child: child[1])
+    }
+    logger.info(
+        "📊 Worker memory",
+        extra={
+            "parent": process_memory(),
+            "workers": workers,
+            "total_pss_mb": round(sum(w.get("pss_mb", 0.0) for w in workers.values()), 1),
+        }
+    )
 
-        return DetectionResponse(success=True, results=results_list)
+def serve_workers(workers: int):
+    """Pre-fork server: optimize the model once, then fork workers that share it
 
-    except Exception as e:
-        print(f"❌ Error: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+    ONNX Runtime thread pools do not survive fork, so each worker still
+    creates its own sessions - but from the pre-optimized copy, without
+    re-running graph optimization or reading the weights into private memory.
+    """
+    global shared_model_path
+
+    family = socket.AF_INET6 if ":" in HOST else socket.AF_INET
+    sock = socket.create_server((HOST, PORT), family=family, backlog=2048)
+    with sock, tempfile.TemporaryDirectory(prefix="model-server-") as shared_dir:
+        model_path = model_variant_path(MODEL_PATH, MODEL_VARIANT)
+        start = time.perf_counter()
+        try:
+            shared_model_path = prepare_shared_model(model_path, shared_dir)
+            logger.info(
+                "📦 Model optimized once for %d workers", workers,
+                extra={"model": model_path, "seconds": round(time.perf_counter() - start, 2)}
+            )
+        except Exception as e:
+            # Workers still start and report the load failure themselves
+            logger.error("❌ Failed to prepare the shared model: %s", e)
+        supervise_workers(workers, sock)
+
+def supervise_workers(workers: int, sock: socket.socket):
+    """Fork the workers and restart any that exit until SIGINT/SIGTERM"""
+    config = uvicorn.Config(app, log_config=None, log_level=LOG_LEVEL.lower())
+    children: Dict[int, int] = {}  # pid -> worker index
+    stopping = False
+
+    def spawn(indexes: List[int]):
+        shutdown_logging()  # Flush queued records so forked workers do not write them again
+        for index in indexes:
+            pid = os.fork()
+            if pid == 0:
+                exit_code = 1
+                try:
+                    exit_code = run_worker(index, sock, config)
+                finally:
+                    os._exit(exit_code)
+            children[pid] = index
+        configure_logging(LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_RATE)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    spawn(list(range(workers)))
+
+    next_report = time.monotonic() + WORKER_REPORT_SECONDS
+    while children:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            time.sleep(0.5)
+            if time.monotonic() >= next_report:
+                log_worker_memory(children)
+                next_report += WORKER_REPORT_SECONDS
+            continue
+        index = children.pop(pid)
+        if not stopping:
+            logger.warning(
+                "⚠️  Worker %d (pid %d) exited with code %d - restarting",
+                index, pid, os.waitstatus_to_exitcode(status)
+            )
+            time.sleep(1)  # Do not spin if the worker fails right at startup
+            spawn([index])
 
 # ============================================================================
 # MAIN
@@ -511,6 +4611,12 @@ if __name__ == "__main__":
         default="models/best.onnx",
         help="Path to ONNX model file"
     )
+    parser.add_argument(
+        "--model-variant",
+        choices=MODEL_VARIANTS,
+        default=MODEL_VARIANT,
+        help="Which export of --model to serve (int8 variants come from export-onnx-model.py --quantize) [env MODEL_VARIANT]"
+    )
     parser.add_argument(
         "--port",
         type=int,
@@ -523,27 +4629,260 @@ if __name__ == "__main__":
         default="0.0.0.0",
         help="Host to bind to"
     )
+    parser.add_argument(
+        "--inference-workers",
+        type=int,
+        default=INFERENCE_WORKERS,
+        help="Number of /detect requests processed concurrently (off the event loop)"
+    )
+    parser.add_argument(
+        "--max-queued-requests",
+        type=int,
+        default=MAX_QUEUED_REQUESTS,
+        help="Detection requests waiting for a worker before new ones get 429 (0 = no limit) [env MAX_QUEUED_REQUESTS]"
+    )
+    parser.add_argument(
+        "--request-deadline",
+        type=float,
+        default=REQUEST_DEADLINE_SECONDS,
+        metavar="SECONDS",
+        help="Deadline of requests without an X-Deadline-Ms header (0 = none) [env REQUEST_DEADLINE_SECONDS]"
+    )
+    parser.add_argument(
+        "--watch-model",
+        type=float,
+        default=MODEL_WATCH_SECONDS,
+        metavar="SECONDS",
+        help="Poll the model file this often and hot-reload it when it changes (0 = off)"
+    )
+    parser.add_argument(
+        "--live-sessions",
+        type=int,
+        default=LIVE_MAX_SESSIONS,
+        help="Maximum concurrent /ws/live WebSocket sessions"
+    )
+    parser.add_argument(
+        "--max-image-pixels",
+        type=int,
+        default=MAX_IMAGE_PIXELS,
+        help="Reject images larger than this many pixels (0 = no limit)"
+    )
+    parser.add_argument(
+        "--no-fast-decode",
+        action="store_true",
+        help="Decode JPEGs at full resolution instead of DCT-downscaling to the model input"
+    )
+    parser.add_argument(
+        "--max-batch-size",
+        type=int,
+        default=MAX_BATCH_SIZE,
+        help="Maximum images per inference run for dynamic-batch models"
+    )
+    parser.add_argument(
+        "--batch-wait-ms",
+        type=float,
+        default=BATCH_MAX_WAIT_MS,
+        help="How long the batcher waits for images from concurrent requests"
+    )
+    parser.add_argument(
+        "--cache-mb",
+        type=float,
+        default=CACHE_MAX_MB,
+        help="In-memory detection cache size in MB (0 = disable the cache)"
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=CACHE_TTL_SECONDS,
+        help="Seconds a cached detection result stays valid"
+    )
+    parser.add_argument(
+        "--cache-db",
+        type=str,
+        default=CACHE_DB_PATH,
+        help="SQLite file for a detection cache tier that survives restarts"
+    )
+    parser.add_argument(
+        "--job-db",
+        type=str,
+        default=JOB_DB_PATH,
+        help="SQLite file of the bulk job queue (unset = no job API) [env JOB_DB_PATH]"
+    )
+    parser.add_argument(
+        "--job-image-root",
+        type=str,
+        default=JOB_IMAGE_ROOT,
+        help="Directory jobs may read image paths from (unset = data URLs only) [env JOB_IMAGE_ROOT]"
+    )
+    parser.add_argument(
+        "--job-batch-size",
+        type=int,
+        default=JOB_BATCH_SIZE,
+        help="Job images claimed and processed per batch"
+    )
+    parser.add_argument(
+        "--intra-op-threads",
+        type=int,
+        default=ORT_INTRA_OP_THREADS,
+        help="ONNX Runtime threads per session for one operator (0 = auto) [env ORT_INTRA_OP_THREADS]"
+    )
+    parser.add_argument(
+        "--inter-op-threads",
+        type=int,
+        default=ORT_INTER_OP_THREADS,
+        help="ONNX Runtime threads for parallel operators (0 = auto) [env ORT_INTER_OP_THREADS]"
+    )
+    parser.add_argument(
+        "--execution-mode",
+        choices=["sequential", "parallel"],
+        default=ORT_EXECUTION_MODE,
+        help="ONNX Runtime execution mode [env ORT_EXECUTION_MODE]"
+    )
+    parser.add_argument(
+        "--graph-optimization",
+        choices=["disable", "basic", "extended", "all"],
+        default=ORT_GRAPH_OPTIMIZATION,
+        help="ONNX Runtime graph optimization level [env ORT_GRAPH_OPTIMIZATION]"
+    )
+    parser.add_argument(
+        "--no-memory-arena",
+        action="store_true",
+        default=not ORT_MEMORY_ARENA,
+        help="Disable ONNX Runtime's CPU memory arena [env ORT_MEMORY_ARENA=0]"
+    )
+    parser.add_argument(
+        "--no-spinning",
+        action="store_true",
+        default=not ORT_ALLOW_SPINNING,
+        help="Stop idle ONNX Runtime threads from busy-waiting [env ORT_ALLOW_SPINNING=0]"
+    )
+    parser.add_argument(
+        "--ort-cache-dir",
+        type=str,
+        default=ORT_CACHE_DIR,
+        help="Where optimized graphs are saved for later starts (default: .ort-cache next to the model) [env ORT_CACHE_DIR]"
+    )
+    parser.add_argument(
+        "--no-ort-cache",
+        action="store_true",
+        default=not ORT_CACHE,
+        help="Optimize the graph on every load instead of saving it [env ORT_CACHE=0]"
+    )
+    parser.add_argument(
+        "--warmup",
+        choices=["all", "minmax", "off"],
+        default=MODEL_WARMUP,
+        help="Batch sizes run on every session before taking traffic [env MODEL_WARMUP]"
+    )
+    parser.add_argument(
+        "--default-tier",
+        choices=list(RESOLUTION_TIERS),
+        default=DEFAULT_TIER,
+        help="Resolution tier of requests that set neither tier nor imgsz (dynamic-size models) [env DEFAULT_TIER]"
+    )
+    parser.add_argument(
+        "--sessions",
+        type=int,
+        default=SESSION_POOL_SIZE,
+        help="Number of ONNX Runtime sessions run in parallel [env SESSION_POOL_SIZE]"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=WORKERS,
+        help="Pre-forked worker processes sharing the model weights and the port [env WORKERS]"
+    )
+    parser.add_argument(
+        "--log-level",
+        type=str.upper,
+        default=LOG_LEVEL,
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        help="Server log level (DEBUG adds sampled per-image lines)"
+    )
+    parser.add_argument(
+        "--log-format",
+        choices=["json", "text"],
+        default=LOG_FORMAT,
+        help="Log line format"
+    )
+    parser.add_argument(
+        "--log-sample-rate",
+        type=float,
+        default=LOG_SAMPLE_RATE,
+        help="Fraction of per-image DEBUG lines that are logged"
+    )
 
     args = parser.parse_args()
+    if args.default_tier not in RESOLUTION_TIERS:
+        parser.error(f"--default-tier / DEFAULT_TIER must be one of {', '.join(RESOLUTION_TIERS)}")
 
     # Update global config
     MODEL_PATH = args.model
+    MODEL_VARIANT = args.model_variant
     PORT = args.port
     HOST = args.host
+    MAX_BATCH_SIZE = max(1, args.max_batch_size)
+    INFERENCE_WORKERS = max(1, args.inference_workers)
+    MAX_QUEUED_REQUESTS = max(0, args.max_queued_requests)
+    REQUEST_DEADLINE_SECONDS = max(0.0, args.request_deadline)
+    LIVE_MAX_SESSIONS = max(0, args.live_sessions)
+    MODEL_WATCH_SECONDS = max(0.0, args.watch_model)
+    BATCH_MAX_WAIT_MS = max(0.0, args.batch_wait_ms)
+    MAX_IMAGE_PIXELS = max(0, args.max_image_pixels)
+    FAST_JPEG_DECODE = not args.no_fast_decode
+    CACHE_MAX_MB = max(0.0, args.cache_mb)
+    CACHE_TTL_SECONDS = max(0.0, args.cache_ttl)
+    CACHE_DB_PATH = args.cache_db
+    JOB_DB_PATH = args.job_db
+    JOB_IMAGE_ROOT = args.job_image_root
+    JOB_BATCH_SIZE = max(1, args.job_batch_size)
+    ORT_INTRA_OP_THREADS = max(0, args.intra_op_threads)
+    ORT_INTER_OP_THREADS = max(0, args.inter_op_threads)
+    ORT_EXECUTION_MODE = args.execution_mode
+    ORT_GRAPH_OPTIMIZATION = args.graph_optimization
+    ORT_MEMORY_ARENA = not args.no_memory_arena
+    ORT_ALLOW_SPINNING = not args.no_spinning
+    ORT_CACHE_DIR = args.ort_cache_dir
+    ORT_CACHE = not args.no_ort_cache
+    MODEL_WARMUP = args.warmup
+    DEFAULT_TIER = args.default_tier
+    SESSION_POOL_SIZE = max(1, args.sessions)
+    WORKERS = max(1, args.workers)
+    if WORKERS > 1 and not hasattr(os, "fork"):
+        print("⚠️  --workers needs os.fork (not available on this platform) - running one process")
+        WORKERS = 1
+    LOG_LEVEL = args.log_level
+    LOG_FORMAT = args.log_format
+    LOG_SAMPLE_RATE = min(1.0, max(0.0, args.log_sample_rate))
 
     print("=" * 60)
     print("🔥 Fire Extinguisher AI Detection Server (ONNX Runtime)")
     print("=" * 60)
-    print(f"Model: {MODEL_PATH}")
+    print(f"Model: {model_variant_path(MODEL_PATH, MODEL_VARIANT)} ({MODEL_VARIANT})")
     print(f"Server: http://{HOST}:{PORT}")
     print(f"Runtime: ONNX Runtime (CPU-only, no CUDA)")
+    if WORKERS > 1:
+        print(f"Workers: {WORKERS} (pre-forked, shared model weights)")
+    if MODEL_WATCH_SECONDS > 0:
+        print(f"Model watch: every {MODEL_WATCH_SECONDS:g} s (hot reload on change)")
+    if JOB_DB_PATH:
+        print(f"Job queue: {JOB_DB_PATH}" + (f" (image root {JOB_IMAGE_ROOT})" if JOB_IMAGE_ROOT else ""))
     print("=" * 60)
     print()
 
-    # Run server
-    uvicorn.run(
-        app,
-        host=HOST,
-        port=PORT,
-        log_level="info"
-    )
+    configure_logging(LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_RATE)
+
+    # Run server (uvicorn's own loggers go through the same queue handler)
+    try:
+        if WORKERS > 1:
+            serve_workers(WORKERS)
+        else:
+            uvicorn.run(
+                app,
+                host=HOST,
+                port=PORT,
+                log_config=None,
+                log_level=LOG_LEVEL.lower()
+            )
+    finally:
+        shutdown_logging()
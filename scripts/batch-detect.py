@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+Offline batch detection over image archives, without the HTTP server.
+
+Images come from directories (searched recursively), glob patterns, single
+files or tar archives (.tar, .tar.gz, ...). A process pool reads, decodes
+(decode_image_bytes) and letterboxes (preprocess_image) them while the main
+process runs batched ONNX Runtime inference (run_inference) and
+postprocess_detections - the same functions model_server.py serves with.
+Tiled and cascade modes decode in the pool and run run_detection_batch.
+
+Results are appended to a JSONL file, one ImageResult per line, with the
+image's path (tar members as ARCHIVE:MEMBER) as stepId. The output file is
+the checkpoint: rerunning the same command skips images it already holds,
+so an interrupted run resumes where it stopped. Images that fail to read or
+decode are reported and not written, so a rerun retries them.
+
+Usage:
+    python scripts/batch-detect.py photos/ --output results.jsonl
+    python scripts/batch-detect.py "archive/2024-*/**/*.jpg" --output results.jsonl --workers 6
+    python scripts/batch-detect.py inspections.tar.gz --output results.jsonl --tier balanced
+    python scripts/batch-detect.py photos/ --output results.jsonl --restart --summary-json summary.json
+"""
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import tarfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, Set, Tuple, Union
+
+import numpy as np
+from pydantic import ValidationError
+
+# Fix encoding for Windows
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "ai-server"))
+
+import model_server  # noqa: E402
+from model_server import DetectionRequest, ImageResult, StageTimer  # noqa: E402
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png"}
+
+# Where an image's bytes are: a file path, (uncompressed tar, data offset,
+# size) for the pool to read itself, or the bytes of a compressed tar member
+Source = Union[str, Tuple[str, int, int], bytes]
+
+# Stages timed in the pool (summed over workers) and in the main process
+WORKER_STAGES = ("read", "decode", "preprocess")
+MAIN_STAGES = ("wait", "inference", "postprocess", "write")
+
+
+# ============================================================================
+# INPUTS
+# ============================================================================
+
+def is_image(name: str) -> bool:
+    return Path(name).suffix.lower() in IMAGE_SUFFIXES
+
+
+def tar_sources(path: str) -> Iterator[Tuple[str, Source]]:
+    """(stepId, source) of the images in a tar archive, in archive order"""
+    try:
+        archive = tarfile.open(path, "r:")
+    except tarfile.ReadError:
+        archive = None
+    if archive is not None:
+        # Uncompressed: workers read members at their offsets
+        with archive:
+            for member in archive:
+                if member.isfile() and is_image(member.name):
+                    yield f"{path}:{member.name}", (path, member.offset_data, member.size)
+        return
+    # Compressed: members can only be read in order, here
+    with tarfile.open(path, "r|*") as archive:
+        for member in archive:
+            if member.isfile() and is_image(member.name):
+                yield f"{path}:{member.name}", archive.extractfile(member).read()
+
+
+def is_glob(spec: str) -> bool:
+    return any(char in spec for char in "*?[")
+
+
+def iter_sources(inputs: List[str], skip: Set[str]) -> Iterator[Tuple[str, Source]]:
+    """(stepId, source) of every image of the inputs not in skip, in a stable order"""
+    for spec in inputs:
+        path = Path(spec)
+        if is_glob(spec):
+            files = sorted(p for p in glob.glob(spec, recursive=True) if is_image(p) and os.path.isfile(p))
+        elif path.is_dir():
+            files = sorted(str(p) for p in path.rglob("*") if is_image(p.name) and p.is_file())
+        elif path.is_file() and tarfile.is_tarfile(spec):
+            for step_id, source in tar_sources(spec):
+                if step_id not in skip:
+                    yield step_id, source
+            continue
+        elif path.is_file():
+            files = [spec]
+        else:
+            raise FileNotFoundError(f"No such file or directory: {spec}")
+        for file in files:
+            step_id = Path(file).as_posix()
+            if step_id not in skip:
+                yield step_id, file
+
+
+# ============================================================================
+# WORKER PROCESSES
+# ============================================================================
+
+def init_worker(fast_decode: bool, max_image_pixels: int):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C is handled by the main process
+    model_server.FAST_JPEG_DECODE = fast_decode
+    model_server.MAX_IMAGE_PIXELS = max_image_pixels
+
+
+def read_source(source: Source) -> bytes:
+    if isinstance(source, bytes):
+        return source
+    if isinstance(source, tuple):
+        path, offset, size = source
+        with open(path, "rb") as f:
+            f.seek(offset)
+            return f.read(size)
+    return Path(source).read_bytes()
+
+
+def prepare_image(source: Source, mode: str, input_size: Tuple[int, int]):
+    """Read, decode and (in full mode) letterbox one image in a pool worker
+
+    Returns ([3, H, W] tensor, letterbox, (width, height), stage seconds) in
+    full mode, or (decoded image, None, None, stage seconds) for tiled and
+    cascade images, which run_detection_batch preprocesses itself.
+    """
+    timer = StageTimer()
+    img_bytes = read_source(source)
+    timer.lap("read")
+    if mode == "tiled":
+        target_size = model_server.tiled_decode_target(input_size)
+    elif mode == "cascade":
+        target_size = model_server.cascade_decode_target(input_size)
+    else:
+        target_size = model_server.decode_target_size(input_size)
+    image = model_server.decode_image_bytes(img_bytes, target_size)
+    timer.lap("decode")
+    if mode != "full":
+        return image, None, None, timer.durations
+    height, width = input_size
+    tensor, letterbox = model_server.preprocess_image(image, (1, 3, height, width))
+    timer.lap("preprocess")
+    return tensor[0], letterbox, model_server.original_image_size(image), timer.durations
+
+
+# ============================================================================
+# CHECKPOINT
+# ============================================================================
+
+def load_checkpoint(output: Path) -> Set[str]:
+    """stepIds already in the output file (a partly written last line is cut off)"""
+    if not output.exists():
+        return set()
+    done = set()
+    with open(output, "rb+") as f:
+        data = f.read()
+        complete = data.rfind(b"\n") + 1
+        if complete < len(data):
+            f.truncate(complete)
+        for number, line in enumerate(data[:complete].splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                done.add(json.loads(line)["stepId"])
+            except (ValueError, KeyError) as e:
+                raise ValueError(f"{output}:{number} is not an ImageResult line ({e})")
+    return done
+
+
+def check_run(meta_path: Path, run: dict, resuming: bool):
+    """Refuse to resume results produced by another model or other options"""
+    if resuming and meta_path.exists():
+        previous = json.loads(meta_path.read_text())
+        if previous != run:
+            changed = sorted(key for key in set(run) | set(previous) if run.get(key) != previous.get(key))
+            raise ValueError(
+                f"{meta_path} was written with a different {', '.join(changed)}; "
+                "use --restart (or another --output) to start over"
+            )
+    meta_path.write_text(json.dumps(run, indent=2) + "\n")
+
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch YOLO detection over image directories, globs and tar files")
+    parser.add_argument("inputs", nargs="+", help="Directories, glob patterns, image files or tar archives")
+    parser.add_argument("--output", "-o", type=Path, required=True, help="JSONL file of ImageResult lines (also the checkpoint)")
+    parser.add_argument("--restart", action="store_true", help="Discard existing results instead of resuming")
+    parser.add_argument("--model", type=str, default=model_server.MODEL_PATH, help="Path to ONNX model file")
+    parser.add_argument("--model-variant", choices=model_server.MODEL_VARIANTS, default=model_server.MODEL_VARIANT)
+    parser.add_argument("--workers", type=int, default=max(1, model_server.available_cores() - 1),
+                        help="Decode/preprocess processes (default: cores - 1)")
+    parser.add_argument("--batch-size", type=int, default=model_server.MAX_BATCH_SIZE, help="Images per inference run")
+    parser.add_argument("--intra-op-threads", type=int, default=model_server.ORT_INTRA_OP_THREADS,
+                        help="ONNX Runtime threads per run (0 = ORT default)")
+    parser.add_argument("--min-confidence", type=float, default=0.5)
+    parser.add_argument("--iou-threshold", type=float, default=model_server.NMS_IOU_THRESHOLD)
+    parser.add_argument("--max-detections", type=int, default=model_server.NMS_MAX_DETECTIONS)
+    parser.add_argument("--class-agnostic-nms", action="store_true")
+    parser.add_argument("--tier", choices=list(model_server.RESOLUTION_TIERS), default=None,
+                        help=f"Input resolution tier (default {model_server.DEFAULT_TIER})")
+    parser.add_argument("--imgsz", type=int, default=None, help="Explicit square input size, overrides --tier")
+    parser.add_argument("--tiled", action="store_true", help="Full-resolution tiles plus a global view")
+    parser.add_argument("--cascade", action="store_true", help="Coarse shell pass, then the shell region")
+    parser.add_argument("--no-fast-decode", action="store_true", help="Always decode JPEGs at full resolution")
+    parser.add_argument("--progress-seconds", type=float, default=10.0, help="Interval of progress lines (0 = none)")
+    parser.add_argument("--summary-json", type=Path, default=None, help="Also write the summary to this JSON file")
+    args = parser.parse_args()
+
+    try:
+        options = DetectionRequest(
+            images=[],
+            minConfidence=args.min_confidence,
+            iouThreshold=args.iou_threshold,
+            maxDetections=args.max_detections,
+            classAgnosticNms=args.class_agnostic_nms,
+            tier=args.tier,
+            imgsz=args.imgsz,
+            tiled=args.tiled,
+            cascade=args.cascade
+        )
+    except ValidationError as e:
+        parser.error(str(e.errors()[0]["msg"]))
+    missing = [spec for spec in args.inputs if not is_glob(spec) and not os.path.exists(spec)]
+    if missing:
+        parser.error(f"no such file or directory: {', '.join(missing)}")
+    mode = model_server.detection_mode(options)
+    workers = max(1, args.workers)
+    batch_size = max(1, args.batch_size)
+
+    model_server.FAST_JPEG_DECODE = not args.no_fast_decode
+    model_server.MAX_BATCH_SIZE = batch_size
+    model_server.ORT_INTRA_OP_THREADS = max(0, args.intra_op_threads)
+    model_server.configure_logging("WARNING", "text", 0.0)
+
+    # The pool starts before the model is loaded (spawned workers never hold a session)
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(model_server.FAST_JPEG_DECODE, model_server.MAX_IMAGE_PIXELS)
+    )
+    model_path = model_server.model_variant_path(args.model, args.model_variant)
+    model_server.load_model(model_path)
+    input_size = model_server.request_input_size(options.tier, options.imgsz)
+
+    output = args.output
+    meta_path = output.with_name(output.name + ".checkpoint.json")
+    if args.restart and output.exists():
+        output.unlink()
+    try:
+        done = load_checkpoint(output)
+        check_run(meta_path, {
+            "model": model_server.model_version,
+            "options": options.model_dump(exclude={"images", "extinguisherInfo"}),
+            "imgsz": list(input_size),
+            "fast_decode": model_server.FAST_JPEG_DECODE,
+        }, resuming=bool(done))
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(f"Model: {model_path} ({model_server.model_version}), input {input_size[1]}x{input_size[0]}, {mode} mode")
+    print(f"Workers: {workers} decode/preprocess processes, inference batches of {batch_size}")
+    if done:
+        print(f"Resuming: {len(done)} images already in {output}")
+
+    timer = StageTimer()
+    for stage in WORKER_STAGES + MAIN_STAGES:
+        timer.durations.setdefault(stage, 0.0)
+    processed = 0
+    failures: List[Tuple[str, str]] = []
+    batch = []  # (stepId, tensor or image, letterbox, original size)
+    window = workers * 4 + batch_size  # Images in flight in the pool
+    pending = deque()
+    start = time.perf_counter()
+    last_progress = start
+    interrupted = False
+
+    def run_batch(out):
+        """Infer, postprocess and append one batch of prepared images"""
+        nonlocal processed
+        timer.mark()
+        step_ids = [item[0] for item in batch]
+        if mode == "full":
+            outputs = model_server.run_inference(np.stack([item[1] for item in batch]))
+            timer.lap("inference")
+            detections = [
+                model_server.postprocess_detections(
+                    outputs[i:i + 1],
+                    options.minConfidence,
+                    *size,
+                    iou_threshold=options.iouThreshold,
+                    max_det=options.maxDetections,
+                    class_agnostic=options.classAgnosticNms,
+                    letterbox=letterbox,
+                    input_size=input_size
+                )
+                for i, (_, _, letterbox, size) in enumerate(batch)
+            ]
+            timer.lap("postprocess")
+        else:
+            detections = model_server.run_detection_batch(
+                [item[1] for item in batch],
+                options.minConfidence,
+                iou_threshold=options.iouThreshold,
+                max_det=options.maxDetections,
+                class_agnostic=options.classAgnosticNms,
+                imgsz=input_size[0],
+                tiled=options.tiled,
+                cascade=options.cascade
+            )
+            timer.lap("inference")
+        out.write("".join(
+            ImageResult(stepId=step_id, detections=dets).model_dump_json() + "\n"
+            for step_id, dets in zip(step_ids, detections)
+        ))
+        out.flush()
+        os.fsync(out.fileno())
+        timer.lap("write")
+        processed += len(batch)
+        batch.clear()
+
+    def collect(out):
+        """Take the oldest image from the pool; run a batch once it is full"""
+        step_id, future = pending.popleft()
+        timer.mark()
+        try:
+            prepared, letterbox, size, durations = future.result()
+        except Exception as e:
+            timer.lap("wait")
+            failures.append((step_id, str(e)))
+            print(f"❌ {step_id}: {e}", file=sys.stderr)
+            return
+        timer.lap("wait")
+        for stage, seconds in durations.items():
+            if stage in WORKER_STAGES:
+                timer.durations[stage] += seconds
+        batch.append((step_id, prepared, letterbox, size))
+        if len(batch) >= batch_size:
+            run_batch(out)
+
+    with open(output, "a", encoding="utf-8") as out:
+        try:
+            for step_id, source in iter_sources(args.inputs, done):
+                pending.append((step_id, pool.submit(prepare_image, source, mode, input_size)))
+                while len(pending) >= window:
+                    collect(out)
+                now = time.perf_counter()
+                if args.progress_seconds > 0 and now - last_progress >= args.progress_seconds:
+                    last_progress = now
+                    print(f"   ... {processed} images, {processed / (now - start):.1f} images/s", flush=True)
+            while pending:
+                collect(out)
+            if batch:
+                run_batch(out)
+        except KeyboardInterrupt:
+            interrupted = True
+            if batch:
+                run_batch(out)  # Keep what is already prepared
+        finally:
+            pool.shutdown(wait=not interrupted, cancel_futures=True)
+
+    wall = time.perf_counter() - start
+    summary = {
+        "images": processed,
+        "failed": len(failures),
+        "skipped": len(done),
+        "wall_seconds": round(wall, 3),
+        "images_per_second": round(processed / wall, 2) if wall > 0 else 0.0,
+        "workers": workers,
+        "batch_size": batch_size,
+        "mode": mode,
+        "imgsz": list(input_size),
+        "stage_seconds": {stage: round(timer.durations[stage], 3) for stage in WORKER_STAGES + MAIN_STAGES},
+        "interrupted": interrupted,
+    }
+
+    print()
+    print(f"{'Interrupted' if interrupted else 'Done'}: {processed} images in {wall:.1f} s = "
+          f"{summary['images_per_second']:.1f} images/s ({len(failures)} failed, {len(done)} skipped as already done)")
+    print(f"   {'stage':<12} {'total s':>9} {'ms/image':>9}")
+    for stage in WORKER_STAGES + MAIN_STAGES:
+        seconds = timer.durations[stage]
+        where = " (pool, summed over workers)" if stage in WORKER_STAGES else ""
+        print(f"   {stage:<12} {seconds:9.2f} {seconds * 1000 / max(1, processed):9.1f}{where}")
+    if mode != "full":
+        print("   (tiled/cascade: inference includes their preprocessing and postprocessing)")
+    print(f"Results: {output}")
+    if failures:
+        print(f"[WARNING] {len(failures)} images failed and were not written (a rerun retries them)")
+    if interrupted:
+        print("[INFO] Rerun the same command to resume")
+    if args.summary_json is not None:
+        args.summary_json.write_text(json.dumps(summary, indent=2) + "\n")
+
+    model_server.shutdown_logging()
+    sys.exit(130 if interrupted else 0)
+
+
+if __name__ == "__main__":
+    main()
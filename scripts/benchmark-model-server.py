@@ -0,0 +1,2324 @@
+#!/usr/bin/env python3
+"""
+Benchmark and verification tool for the AI model server (ai-server/model_server.py).
+
+Runs the server's own functions on synthetic YOLOv8-shaped outputs and a
+synthetic ONNX stand-in for models/best.onnx, so no trained model is required.
+
+Usage:
+    pip install -r ai-server/requirements.txt
+    python scripts/benchmark-model-server.py postprocess
+    python scripts/benchmark-model-server.py postprocess --candidates 2000 --repeat 50
+    python scripts/benchmark-model-server.py nms --sizes 100 500 2000 5000
+    python scripts/benchmark-model-server.py health --clients 2
+    python scripts/benchmark-model-server.py batching --clients 8
+    python scripts/benchmark-model-server.py payload --images 6
+    python scripts/benchmark-model-server.py decode --sizes 4000x3000 8000x6000
+    python scripts/benchmark-model-server.py preprocess
+    python scripts/benchmark-model-server.py cache --clients 8
+    python scripts/benchmark-model-server.py logging --requests 500
+    python scripts/benchmark-model-server.py metrics
+    python scripts/benchmark-model-server.py sessions --configs 1x0 2x0 4x0
+    python scripts/benchmark-model-server.py workers --workers 4
+    python scripts/benchmark-model-server.py live --sessions 2 --fps 30
+    python scripts/benchmark-model-server.py reload --clients 4
+    python scripts/benchmark-model-server.py startup --weights-mb 40
+    python scripts/benchmark-model-server.py tiers
+    python scripts/benchmark-model-server.py tiers --model models/best.onnx --images samples/
+    python scripts/benchmark-model-server.py modes
+    python scripts/benchmark-model-server.py modes --model models/best.onnx --images samples/ --labels labels/
+    python scripts/benchmark-model-server.py admission --burst 32 --client-timeout 3
+    python scripts/benchmark-model-server.py jobs --images 10000
+    python scripts/benchmark-model-server.py suite --output bench.json
+    python scripts/benchmark-model-server.py suite --baseline bench.json --threshold 0.15
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import base64
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+import uuid
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+# Fix encoding for Windows
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+# Import the deployed server module
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "ai-server"))
+import model_server  # noqa: E402
+from model_server import CLASS_NAMES, Detection  # noqa: E402
+
+
+# ============================================================================
+# SYNTHETIC DATA
+# ============================================================================
+
+def make_yolo_output(
+    num_candidates: int,
+    num_classes: int = len(CLASS_NAMES),
+    num_predictions: int = 8400,
+    model_size: int = 640,
+    logits: bool = False,
+    seed: int = 0
+) -> np.ndarray:
+    """Build a [1, 4+num_classes, num_predictions] YOLOv8-style output
+
+    `num_candidates` anchors get a high score for a random class and clustered
+    boxes (so NMS has real overlaps to suppress); the rest are background.
+    """
+    rng = np.random.default_rng(seed)
+    out = np.zeros((1, 4 + num_classes, num_predictions), dtype=np.float32)
+
+    # Background anchors: small random boxes with low scores
+    out[0, 0:2] = rng.uniform(0, model_size, (2, num_predictions))
+    out[0, 2:4] = rng.uniform(4, 40, (2, num_predictions))
+    out[0, 4:] = rng.uniform(0.0, 0.2, (num_classes, num_predictions))
+
+    # Candidates: jittered copies of a few "objects"
+    idx = rng.choice(num_predictions, size=min(num_candidates, num_predictions), replace=False)
+    num_objects = max(1, len(idx) // 20)
+    centers = rng.uniform(64, model_size - 64, (num_objects, 2))
+    sizes = rng.uniform(20, 200, (num_objects, 2))
+    obj = rng.integers(0, num_objects, len(idx))
+    out[0, 0:2, idx] = centers[obj] + rng.normal(0, 6, (len(idx), 2))
+    out[0, 2:4, idx] = sizes[obj] * rng.uniform(0.85, 1.15, (len(idx), 2))
+    out[0, 4 + rng.integers(0, num_classes, len(idx)), idx] = rng.uniform(0.3, 0.99, len(idx))
+
+    if logits:
+        # Convert probabilities back to raw logits
+        p = np.clip(out[0, 4:], 1e-6, 1 - 1e-6)
+        out[0, 4:] = np.log(p / (1 - p))
+
+    return out
+
+
+def make_candidates(num_boxes: int, num_classes: int = len(CLASS_NAMES), seed: int = 0):
+    """Clustered [N, 4] boxes, scores and class ids as seen after confidence filtering"""
+    rng = np.random.default_rng(seed)
+    num_objects = max(1, num_boxes // 25)
+    centers = rng.uniform(100, 3900, (num_objects, 2))
+    sizes = rng.uniform(40, 800, (num_objects, 2))
+    obj = rng.integers(0, num_objects, num_boxes)
+    xy = centers[obj] + rng.normal(0, 15, (num_boxes, 2))
+    wh = sizes[obj] * rng.uniform(0.8, 1.2, (num_boxes, 2))
+    boxes = np.concatenate([xy - wh / 2, xy + wh / 2], axis=1).astype(np.float32)
+    scores = rng.uniform(0.05, 0.99, num_boxes).astype(np.float32)
+    class_ids = rng.integers(0, num_classes, num_boxes)
+    return boxes, scores, class_ids
+
+
+def to_detections(boxes: np.ndarray, scores: np.ndarray, class_ids: np.ndarray) -> List[Detection]:
+    return [
+        Detection(class_name=CLASS_NAMES.get(int(c), f"class_{c}"), confidence=float(s), bbox=b)
+        for b, s, c in zip(boxes.tolist(), scores.tolist(), class_ids.tolist())
+    ]
+
+
+def make_synthetic_model(
+    path: Path,
+    num_classes: int = len(CLASS_NAMES),
+    batch="batch",
+    imgsz: Optional[int] = 640,
+    weights_mb: float = 0,
+    seed: int = 0
+) -> Path:
+    """Write a YOLOv8-shaped ONNX stand-in: [B, 3, imgsz, imgsz] -> [B, 4+classes, anchors]
+
+    Three strided convolutions (strides 8/16/32, as in the YOLOv8 heads) are
+    flattened and concatenated, giving 8400 anchors at 640 and roughly the
+    memory traffic of a small detector. Weights are random. As in a YOLOv8
+    export, boxes come out as pixel-space cx, cy, w, h and class scores are
+    sigmoid probabilities, mostly low. `batch` is a fixed int or a symbolic
+    name for a dynamic batch dimension; imgsz=None makes height and width
+    dynamic too (as a --dynamic export), with boxes scaled to the input
+    width. `weights_mb` adds a convolution with
+    that much weight over one 32x32 patch (added times zero), so every run
+    reads the weight memory of a real detector without its compute.
+    """
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    rng = np.random.default_rng(seed)
+    num_features = 4 + num_classes
+    nodes, initializers, heads = [], [], []
+    for i, stride in enumerate([8, 16, 32]):
+        weight = rng.normal(0, 0.05, (num_features, 3, stride, stride)).astype(np.float32)
+        initializers.append(numpy_helper.from_array(weight, f"head{i}.weight"))
+        initializers.append(numpy_helper.from_array(np.array([0, num_features, -1], dtype=np.int64), f"head{i}.shape"))
+        nodes.append(helper.make_node("Conv", ["images", f"head{i}.weight"], [f"head{i}.conv"], strides=[stride, stride]))
+        nodes.append(helper.make_node("Reshape", [f"head{i}.conv", f"head{i}.shape"], [f"head{i}"]))
+        heads.append(f"head{i}")
+    nodes.append(helper.make_node("Concat", heads, ["raw_heads" if weights_mb > 0 else "raw"], axis=2))
+
+    if weights_mb > 0:
+        filters = max(1, int(weights_mb * 1024 * 1024 / (4 * 3 * 32 * 32)))
+        weight = rng.normal(0, 0.05, (filters, 3, 32, 32)).astype(np.float32)
+        initializers.append(numpy_helper.from_array(weight, "extra.weight"))
+        initializers.append(numpy_helper.from_array(np.array([0, 0], dtype=np.int64), "extra.starts"))
+        initializers.append(numpy_helper.from_array(np.array([32, 32], dtype=np.int64), "extra.ends"))
+        initializers.append(numpy_helper.from_array(np.array([2, 3], dtype=np.int64), "extra.axes"))
+        initializers.append(numpy_helper.from_array(np.array(0.0, dtype=np.float32), "extra.zero"))
+        nodes += [
+            helper.make_node("Slice", ["images", "extra.starts", "extra.ends", "extra.axes"], ["extra.patch"]),
+            helper.make_node("Conv", ["extra.patch", "extra.weight"], ["extra.conv"], strides=[32, 32]),
+            helper.make_node("ReduceSum", ["extra.conv"], ["extra.sum"], keepdims=0),
+            helper.make_node("Mul", ["extra.sum", "extra.zero"], ["extra.out"]),
+            helper.make_node("Add", ["raw_heads", "extra.out"], ["raw"]),
+        ]
+
+    # Decode: boxes = sigmoid * [imgsz, imgsz, imgsz / 4, imgsz / 4], scores = sigmoid(x - 3)
+    initializers.append(numpy_helper.from_array(np.array([4, num_classes], dtype=np.int64), "split"))
+    if imgsz is None:
+        initializers.append(numpy_helper.from_array(
+            np.array([1, 1, 0.25, 0.25], dtype=np.float32).reshape(1, 4, 1), "box_factors"
+        ))
+        initializers.append(numpy_helper.from_array(np.array([3], dtype=np.int64), "width_index"))
+        nodes += [
+            helper.make_node("Shape", ["images"], ["input_shape"]),
+            helper.make_node("Gather", ["input_shape", "width_index"], ["input_width"]),
+            helper.make_node("Cast", ["input_width"], ["input_width_f"], to=TensorProto.FLOAT),
+            helper.make_node("Mul", ["box_factors", "input_width_f"], ["box_scale"]),
+        ]
+    else:
+        initializers.append(numpy_helper.from_array(
+            np.array([imgsz, imgsz, imgsz / 4, imgsz / 4], dtype=np.float32).reshape(1, 4, 1), "box_scale"
+        ))
+    initializers.append(numpy_helper.from_array(np.array(3.0, dtype=np.float32), "score_offset"))
+    nodes += [
+        helper.make_node("Split", ["raw", "split"], ["raw_boxes", "raw_scores"], axis=1),
+        helper.make_node("Sigmoid", ["raw_boxes"], ["unit_boxes"]),
+        helper.make_node("Mul", ["unit_boxes", "box_scale"], ["boxes"]),
+        helper.make_node("Sub", ["raw_scores", "score_offset"], ["shifted_scores"]),
+        helper.make_node("Sigmoid", ["shifted_scores"], ["scores"]),
+        helper.make_node("Concat", ["boxes", "scores"], ["output0"], axis=1),
+    ]
+
+    graph = helper.make_graph(
+        nodes,
+        "synthetic_yolov8",
+        [helper.make_tensor_value_info(
+            "images", TensorProto.FLOAT, [batch, 3, imgsz or "height", imgsz or "width"]
+        )],
+        [helper.make_tensor_value_info("output0", TensorProto.FLOAT, [batch, num_features, None])],
+        initializers
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+    model.ir_version = 8
+    onnx.save(model, str(path))
+    return path
+
+
+def make_jpeg(width: int, height: int, seed: int = 0, quality: int = 90) -> bytes:
+    """Photo-like JPEG (smooth gradients plus noise, so it compresses like a real photo)"""
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([
+        128 + 100 * np.sin(xx / (width / 3) + seed),
+        128 + 100 * np.cos(yy / (height / 2)),
+        128 + 60 * np.sin((xx + yy) / (width / 5)),
+    ], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def make_data_url(jpeg_bytes: bytes) -> str:
+    return "data:image/jpeg;base64," + base64.b64encode(jpeg_bytes).decode()
+
+
+def encode_multipart(fields: List[tuple], files: List[tuple]):
+    """Encode (name, value) fields and (name, filename, bytes) files as multipart/form-data"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields:
+        parts.append(
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"\r\n\r\n{value}\r\n".encode()
+        )
+    for name, filename, data in files:
+        parts.append(
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: image/jpeg\r\n\r\n".encode() + data + b"\r\n"
+        )
+    parts.append(f"--{boundary}--".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+# ============================================================================
+# REFERENCE (PRE-VECTORIZATION) IMPLEMENTATION
+# ============================================================================
+
+def legacy_compute_iou(box1: List[float], box2: List[float]) -> float:
+    """Per-pair IoU exactly as the server computed it before vectorization"""
+    x1_1, y1_1, x2_1, y2_1 = box1
+    x1_2, y1_2, x2_2, y2_2 = box2
+    x1_i = max(x1_1, x1_2)
+    y1_i = max(y1_1, y1_2)
+    x2_i = min(x2_1, x2_2)
+    y2_i = min(y2_1, y2_2)
+    if x2_i < x1_i or y2_i < y1_i:
+        return 0.0
+    intersection = (x2_i - x1_i) * (y2_i - y1_i)
+    area1 = (x2_1 - x1_1) * (y2_1 - y1_1)
+    area2 = (x2_2 - x1_2) * (y2_2 - y1_2)
+    union = area1 + area2 - intersection
+    if union == 0:
+        return 0.0
+    return intersection / union
+
+
+def legacy_apply_nms(detections: List[Detection], iou_threshold: float = 0.5) -> List[Detection]:
+    """Class-agnostic pop(0) NMS loop from the original server"""
+    detections = sorted(detections, key=lambda x: x.confidence, reverse=True)
+    keep = []
+    while detections:
+        best = detections.pop(0)
+        keep.append(best)
+        detections = [
+            det for det in detections
+            if legacy_compute_iou(best.bbox, det.bbox) < iou_threshold
+        ]
+    return keep
+
+
+def legacy_postprocess(
+    outputs: np.ndarray,
+    min_confidence: float,
+    img_width: int,
+    img_height: int,
+    model_size: int = 640
+) -> List[Detection]:
+    """Per-anchor Python loop from the original postprocess_detections"""
+    outputs = np.transpose(outputs[0], (1, 0)).copy()
+    sample = outputs[:100, 4:]
+    max_score = np.max(sample)
+    if max_score > 1.0 or max_score < 0.0:
+        outputs[:, 4:] = model_server.sigmoid(outputs[:, 4:])
+
+    detections = []
+    for detection in outputs:
+        x_center, y_center, width, height = detection[:4]
+        class_scores = detection[4:]
+        class_id = int(np.argmax(class_scores))
+        confidence = float(class_scores[class_id])
+        if confidence < min_confidence:
+            continue
+        x1 = (x_center - width / 2) * img_width / model_size
+        y1 = (y_center - height / 2) * img_height / model_size
+        x2 = (x_center + width / 2) * img_width / model_size
+        y2 = (y_center + height / 2) * img_height / model_size
+        x1 = max(0, min(x1, img_width))
+        y1 = max(0, min(y1, img_height))
+        x2 = max(0, min(x2, img_width))
+        y2 = max(0, min(y2, img_height))
+        detections.append(Detection(
+            class_name=CLASS_NAMES.get(class_id, f"unknown_class_{class_id}"),
+            confidence=confidence,
+            bbox=[float(x1), float(y1), float(x2), float(y2)]
+        ))
+    if detections:
+        detections = legacy_apply_nms(detections, iou_threshold=0.5)
+    return detections
+
+
+def legacy_preprocess(image, input_shape) -> np.ndarray:
+    """Stretch-resize preprocessing from the original server (one new array per step)"""
+    import cv2
+
+    img_array = np.array(image)
+    img_resized = cv2.resize(img_array, (input_shape[3], input_shape[2]))
+    img_resized = cv2.cvtColor(img_resized, cv2.COLOR_BGR2RGB)
+    img_normalized = img_resized.astype(np.float32) / 255.0
+    img_transposed = np.transpose(img_normalized, (2, 0, 1))
+    return np.expand_dims(img_transposed, axis=0)
+
+
+# ============================================================================
+# HELPERS
+# ============================================================================
+
+def time_call(fn, repeat: int) -> float:
+    """Median wall time of fn() in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples))
+
+
+def detections_match(a: List[Detection], b: List[Detection], atol: float = 1e-3) -> bool:
+    """Same detections in the same order, within float tolerance"""
+    if len(a) != len(b):
+        return False
+    for da, db in zip(a, b):
+        if da.class_name != db.class_name:
+            return False
+        if abs(da.confidence - db.confidence) > 1e-6:
+            return False
+        if not np.allclose(da.bbox, db.bbox, atol=atol):
+            return False
+    return True
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the server's log records (all levels, from every logger) while benchmarking"""
+    previous = logging.root.manager.disable
+    logging.disable(logging.CRITICAL)
+    try:
+        yield
+    finally:
+        logging.disable(previous)
+
+
+def percentile(samples: List[float], q: float) -> float:
+    return float(np.percentile(samples, q)) if samples else float("nan")
+
+
+class ServerThread:
+    """Run the real model_server app under uvicorn in a background thread"""
+
+    def __init__(self, model_path: Path, port: int = 8765, cache_mb: float = 0, cache_db: str = None, job_db: str = None):
+        import uvicorn
+
+        model_server.MODEL_PATH = str(model_path)
+        model_server.CACHE_MAX_MB = cache_mb
+        model_server.CACHE_DB_PATH = cache_db
+        model_server.JOB_DB_PATH = job_db
+        config = uvicorn.Config(model_server.app, host="127.0.0.1", port=port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.url = f"http://127.0.0.1:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+        wait_ready(self.url)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+def wait_ready(url: str, timeout: float = 120) -> dict:
+    """Poll /ready until the model is loaded; returns its body"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/ready", timeout=5) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            if json.loads(e.read()).get("status") == "failed":
+                raise RuntimeError(f"Model failed to load on {url}")
+        except OSError:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError(f"{url} not ready after {timeout} s")
+
+
+def http_get(url: str, timeout: float = 30) -> float:
+    """GET url and return the latency in milliseconds"""
+    start = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        response.read()
+    return (time.perf_counter() - start) * 1000
+
+
+def http_post_json(url: str, payload: dict, timeout: float = 300) -> dict:
+    return http_post(url, json.dumps(payload).encode(), "application/json", timeout)
+
+
+def http_post(url: str, body: bytes, content_type: str, timeout: float = 300) -> dict:
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": content_type})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def http_post_stream(url: str, payload: dict, timeout: float = 300):
+    """POST JSON to an NDJSON endpoint; (ms to the first line, ms to the last, parsed lines)"""
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    first_ms = None
+    records = []
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        for line in response:
+            if first_ms is None:
+                first_ms = (time.perf_counter() - start) * 1000
+            records.append(json.loads(line))
+    return first_ms, (time.perf_counter() - start) * 1000, records
+
+
+def measure(fn, repeat: int):
+    """(median ms, peak traced MB) of fn(); memory is traced in a separate run"""
+    median_ms = time_call(fn, repeat)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return median_ms, peak / (1024 * 1024)
+
+
+# ============================================================================
+# BENCHMARKS
+# ============================================================================
+
+def bench_postprocess(args):
+    """Check vectorized postprocess_detections against the per-row loop, then time both"""
+    model_server.input_shape = [1, 3, 640, 640]
+    img_width, img_height = 4000, 3000
+
+    print(f"[INFO] Equivalence check ({args.cases} random outputs)...")
+    for case in range(args.cases):
+        outputs = make_yolo_output(
+            num_candidates=int(np.random.default_rng(case).integers(0, 800)),
+            logits=bool(case % 2),
+            seed=case
+        )
+        min_conf = [0.25, 0.5, 0.7][case % 3]
+        expected = legacy_postprocess(outputs.copy(), min_conf, img_width, img_height)
+        with quiet():
+            actual = model_server.postprocess_detections(
+                outputs.copy(), min_conf, img_width, img_height, class_agnostic=True
+            )
+        if not detections_match(expected, actual):
+            print(f"[ERROR] Mismatch on case {case}: {len(expected)} expected vs {len(actual)} actual")
+            sys.exit(1)
+    print("[SUCCESS] Vectorized output matches the per-row implementation")
+    print()
+
+    outputs = make_yolo_output(num_candidates=args.candidates, seed=1234)
+    with quiet():
+        legacy_ms = time_call(
+            lambda: legacy_postprocess(outputs.copy(), args.min_confidence, img_width, img_height),
+            args.repeat
+        )
+        new_ms = time_call(
+            lambda: model_server.postprocess_detections(
+                outputs.copy(), args.min_confidence, img_width, img_height, class_agnostic=True
+            ),
+            args.repeat
+        )
+
+    print(f"postprocess_detections ({args.candidates} candidates, minConfidence={args.min_confidence})")
+    print(f"   per-row loop: {legacy_ms:9.2f} ms")
+    print(f"   vectorized:   {new_ms:9.2f} ms")
+    print(f"   speedup:      {legacy_ms / new_ms:9.1f}x")
+
+
+def bench_nms(args):
+    """Check the array NMS engine against the pop(0) loop, then time both as N grows"""
+    print(f"[INFO] Equivalence check ({args.cases} random candidate sets)...")
+    for case in range(args.cases):
+        boxes, scores, class_ids = make_candidates(200 + 37 * case, seed=case)
+        dets = to_detections(boxes, scores, class_ids)
+
+        # Class-agnostic mode must reproduce the original behaviour exactly
+        expected = legacy_apply_nms(list(dets), args.iou)
+        keep = model_server.non_max_suppression(boxes, scores, args.iou, max_det=len(dets))
+        if not detections_match(expected, [dets[i] for i in keep]):
+            print(f"[ERROR] Class-agnostic mismatch on case {case}")
+            sys.exit(1)
+
+        # Per-class mode equals running the original loop on each class separately
+        expected = []
+        for class_id in np.unique(class_ids):
+            expected += legacy_apply_nms([d for d, c in zip(dets, class_ids) if c == class_id], args.iou)
+        expected.sort(key=lambda d: d.confidence, reverse=True)
+        keep = model_server.non_max_suppression(boxes, scores, args.iou, class_ids, max_det=len(dets))
+        if sorted(id(d) for d in expected) != sorted(id(dets[i]) for i in keep):
+            print(f"[ERROR] Per-class mismatch on case {case}")
+            sys.exit(1)
+    print("[SUCCESS] Array NMS matches the pop(0) loop (agnostic and per-class)")
+    print()
+
+    print(f"NMS (iouThreshold={args.iou}, maxDetections={args.max_det})")
+    print(f"   {'candidates':>10} {'pop(0) loop':>14} {'array agnostic':>15} {'array per-class':>16} {'speedup':>9}")
+    for size in args.sizes:
+        boxes, scores, class_ids = make_candidates(size, seed=size)
+        dets = to_detections(boxes, scores, class_ids)
+
+        agnostic_ms = time_call(
+            lambda: model_server.non_max_suppression(boxes, scores, args.iou, max_det=args.max_det),
+            args.repeat
+        )
+        per_class_ms = time_call(
+            lambda: model_server.non_max_suppression(boxes, scores, args.iou, class_ids, args.max_det),
+            args.repeat
+        )
+        if size <= args.legacy_limit:
+            legacy_ms = time_call(lambda: legacy_apply_nms(list(dets), args.iou), max(1, args.repeat // 5))
+            legacy_col = f"{legacy_ms:11.2f} ms"
+            speedup_col = f"{legacy_ms / agnostic_ms:8.1f}x"
+        else:
+            legacy_col = f"{'skipped':>14}"
+            speedup_col = f"{'-':>9}"
+        print(f"   {size:>10} {legacy_col} {agnostic_ms:12.2f} ms {per_class_ms:13.2f} ms {speedup_col}")
+
+
+def bench_health(args):
+    """/health latency idle vs while /detect requests keep the inference pool busy
+
+    Fails if the p99 under load exceeds --threshold ms, as it does when
+    detection work blocks the event loop again (/health then waits for whole
+    requests, over a second each). The bound sits above the tail left by
+    FastAPI parsing the multi-megabyte JSON bodies on the loop (~100-250 ms).
+    """
+    workdir = Path(tempfile.mkdtemp(prefix="model-server-bench-"))
+    model_path = make_synthetic_model(workdir / "synthetic.onnx")
+    payload = {
+        "images": [
+            {"stepId": f"step{i}", "dataUrl": make_data_url(make_jpeg(4000, 3000, seed=i)), "timestamp": 0}
+            for i in range(args.images)
+        ],
+        "minConfidence": 0.5
+    }
+
+    with quiet(), ServerThread(model_path, args.port) as server:
+        idle = [http_get(f"{server.url}/health") for _ in range(args.probes)]
+
+        stop = threading.Event()
+        detect_ms = []
+
+        def client():
+            while not stop.is_set():
+                start = time.perf_counter()
+                http_post_json(f"{server.url}/detect", payload)
+                detect_ms.append((time.perf_counter() - start) * 1000)
+
+        clients = [threading.Thread(target=client) for _ in range(args.clients)]
+        for thread in clients:
+            thread.start()
+        time.sleep(0.5)  # Let the first detections start
+
+        loaded = []
+        while len(detect_ms) < args.min_detections or len(loaded) < args.probes:
+            loaded.append(http_get(f"{server.url}/health"))
+            time.sleep(0.05)
+
+        stop.set()
+        for thread in clients:
+            thread.join()
+
+    print(f"/health latency ({args.clients} concurrent /detect clients, {args.images} x 12 MP images each)")
+    print(f"   idle:       p50 {percentile(idle, 50):7.2f} ms   p99 {percentile(idle, 99):7.2f} ms")
+    print(f"   under load: p50 {percentile(loaded, 50):7.2f} ms   p99 {percentile(loaded, 99):7.2f} ms   max {max(loaded):7.2f} ms")
+    print(f"   /detect:    p50 {percentile(detect_ms, 50):7.0f} ms   ({len(detect_ms)} requests completed)")
+    loaded_p99 = percentile(loaded, 99)
+    if loaded_p99 > args.threshold:
+        print(f"[ERROR] /health p99 under load is {loaded_p99:.0f} ms (limit {args.threshold:g} ms) - "
+              "is blocking work running on the event loop?")
+        sys.exit(1)
+    print(f"[SUCCESS] /health p99 under load stays within {args.threshold:g} ms")
+
+
+def run_clients(url: str, payload: dict, clients: int, requests_per_client: int) -> List[float]:
+    """Post payload from several threads at once; returns per-request latencies (ms)"""
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            http_post_json(url, payload)
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def bench_batching(args):
+    """Throughput of concurrent single-image requests with and without cross-request batching"""
+    workdir = Path(tempfile.mkdtemp(prefix="model-server-bench-"))
+    model_path = make_synthetic_model(workdir / "synthetic.onnx")
+    payload = {
+        "images": [{"stepId": "step0", "dataUrl": make_data_url(make_jpeg(1280, 960)), "timestamp": 0}],
+        "minConfidence": 0.5
+    }
+
+    configs = [
+        ("no batching", 1, 0.0),
+        (f"batching ({args.max_batch} / {args.wait_ms:g} ms)", args.max_batch, args.wait_ms),
+    ]
+    print(f"{args.clients} concurrent clients x {args.requests} single-image requests, "
+          f"{args.workers} inference workers")
+    for label, max_batch, wait_ms in configs:
+        model_server.INFERENCE_WORKERS = args.workers
+        model_server.MAX_BATCH_SIZE = max_batch
+        model_server.BATCH_MAX_WAIT_MS = wait_ms
+
+        with quiet(), ServerThread(model_path, args.port) as server:
+            single = [
+                run_clients(f"{server.url}/detect", payload, 1, 1)[0]
+                for _ in range(5)
+            ]
+            start = time.perf_counter()
+            latencies = run_clients(f"{server.url}/detect", payload, args.clients, args.requests)
+            elapsed = time.perf_counter() - start
+            with urllib.request.urlopen(f"{server.url}/stats") as response:
+                batching = json.loads(response.read())["batching"]
+
+        print(f"   {label}")
+        print(f"      throughput:      {len(latencies) / elapsed:7.2f} images/s")
+        print(f"      latency:         p50 {percentile(latencies, 50):7.0f} ms   p99 {percentile(latencies, 99):7.0f} ms")
+        print(f"      single request:  p50 {percentile(single, 50):7.0f} ms")
+        print(f"      batches:         mean {batching['mean_batch_size']} images, "
+              f"{batching['mean_requests_per_batch']} requests, max queue depth {batching['max_queue_depth']}")
+
+
+def parse_json_body(body: bytes) -> List[bytes]:
+    """What the server does with a JSON /detect body before decoding pixels"""
+    request = model_server.DetectionRequest.model_validate(json.loads(body))
+    return [base64.b64decode(img.dataUrl.split(",", 1)[1]) for img in request.images]
+
+
+def parse_multipart_body(body: bytes, content_type: str) -> List[bytes]:
+    """What the server does with a multipart /detect/multipart body before decoding pixels"""
+    from starlette.requests import Request
+
+    images = []
+
+    # Results are handed back through `images`, not as the task result:
+    # asyncio may repr() a finished task, which is very slow for large bytes
+    async def parse():
+        chunks = [body[i:i + 65536] for i in range(0, len(body), 65536)]
+
+        async def receive():
+            chunk = chunks.pop(0) if chunks else b""
+            return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+
+        scope = {
+            "type": "http",
+            "method": "POST",
+            "headers": [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())],
+        }
+        form = await Request(scope, receive).form()
+        for upload in form.getlist("images"):
+            images.append(await upload.read())
+        await form.close()
+
+    asyncio.run(parse())
+    return images
+
+
+def bench_payload(args):
+    """JSON/base64 vs multipart: payload size, parse time, peak memory and end-to-end latency"""
+    jpegs = [make_jpeg(args.width, args.height, seed=i) for i in range(args.images)]
+    step_ids = [f"step{i}" for i in range(args.images)]
+
+    json_body = json.dumps({
+        "images": [
+            {"stepId": step_id, "dataUrl": make_data_url(jpeg), "timestamp": 0}
+            for step_id, jpeg in zip(step_ids, jpegs)
+        ],
+        "minConfidence": 0.5
+    }).encode()
+    multipart_body, multipart_type = encode_multipart(
+        [("stepId", step_id) for step_id in step_ids] + [("minConfidence", "0.5")],
+        [("images", f"{step_id}.jpg", jpeg) for step_id, jpeg in zip(step_ids, jpegs)]
+    )
+
+    assert parse_json_body(json_body) == jpegs
+    assert parse_multipart_body(multipart_body, multipart_type) == jpegs
+
+    json_ms, json_mb = measure(lambda: parse_json_body(json_body), args.repeat)
+    multipart_ms, multipart_mb = measure(lambda: parse_multipart_body(multipart_body, multipart_type), args.repeat)
+
+    workdir = Path(tempfile.mkdtemp(prefix="model-server-bench-"))
+    model_path = make_synthetic_model(workdir / "synthetic.onnx")
+    with quiet(), ServerThread(model_path, args.port) as server:
+        json_result = http_post(f"{server.url}/detect", json_body, "application/json")
+        multipart_result = http_post(f"{server.url}/detect/multipart", multipart_body, multipart_type)
+        assert json_result == multipart_result, "JSON and multipart responses differ"
+        json_e2e = time_call(lambda: http_post(f"{server.url}/detect", json_body, "application/json"), args.repeat)
+        multipart_e2e = time_call(
+            lambda: http_post(f"{server.url}/detect/multipart", multipart_body, multipart_type), args.repeat
+        )
+
+    mb = 1024 * 1024
+    print(f"{args.images} x {args.width}x{args.height} JPEG ({sum(map(len, jpegs)) / mb:.1f} MB raw)")
+    print(f"   {'':22} {'JSON/base64':>12} {'multipart':>12}")
+    print(f"   {'payload size (MB)':22} {len(json_body) / mb:12.2f} {len(multipart_body) / mb:12.2f}")
+    print(f"   {'parse time (ms)':22} {json_ms:12.2f} {multipart_ms:12.2f}")
+    print(f"   {'parse peak memory (MB)':22} {json_mb:12.2f} {multipart_mb:12.2f}")
+    print(f"   {'end-to-end /detect (ms)':22} {json_e2e:12.1f} {multipart_e2e:12.1f}")
+    print("   Responses identical: yes")
+
+
+def peak_rss_kb() -> int:
+    """Peak resident set size of this process in KB
+
+    Reads VmHWM on Linux (reset by exec, unlike ru_maxrss which a spawned
+    child inherits from its parent).
+    """
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def decode_worker(jpeg_path: str, fast: bool, repeat: int, results) -> None:
+    """Decode + preprocess one JPEG in a fresh process; reports time and peak RSS growth"""
+    model_server.input_shape = [1, 3, 640, 640]
+    model_server.FAST_JPEG_DECODE = fast
+    jpeg_bytes = Path(jpeg_path).read_bytes()
+    baseline_kb = peak_rss_kb()
+
+    decode_ms, total_ms = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        image = model_server.decode_image_bytes(jpeg_bytes, model_server.decode_target_size())
+        decoded = time.perf_counter()
+        tensor, _ = model_server.preprocess_image(image, model_server.input_shape)
+        done = time.perf_counter()
+        decode_ms.append((decoded - start) * 1000)
+        total_ms.append((done - start) * 1000)
+        decoded_size = image.size
+        del image
+
+    peak_kb = peak_rss_kb()
+    results.put({
+        "decode_ms": float(np.median(decode_ms)),
+        "total_ms": float(np.median(total_ms)),
+        "peak_rss_mb": (peak_kb - baseline_kb) / 1024,
+        "decoded_size": decoded_size,
+        "tensor": tensor,
+    })
+
+
+def bench_decode(args):
+    """Full-resolution vs DCT-reduced JPEG decode: time and peak RSS per image"""
+    workdir = Path(tempfile.mkdtemp(prefix="model-server-bench-"))
+    context = multiprocessing.get_context("spawn")
+
+    print("Decode + preprocess per image (each mode in a fresh process)")
+    print(f"   {'image':>10} {'mode':>6} {'decoded at':>11} {'decode ms':>10} {'+preproc ms':>12} {'peak RSS +MB':>13}")
+    for size in args.sizes:
+        width, height = (int(v) for v in size.lower().split("x"))
+        jpeg_path = workdir / f"{size}.jpg"
+        jpeg_path.write_bytes(make_jpeg(width, height))
+
+        runs = {}
+        for label, fast in (("full", False), ("fast", True)):
+            results = context.Queue()
+            process = context.Process(target=decode_worker, args=(str(jpeg_path), fast, args.repeat, results))
+            process.start()
+            runs[label] = results.get()
+            process.join()
+            run = runs[label]
+            decoded = "x".join(str(v) for v in run["decoded_size"])
+            print(f"   {size:>10} {label:>6} {decoded:>11} {run['decode_ms']:10.1f} "
+                  f"{run['total_ms']:12.1f} {run['peak_rss_mb']:13.1f}")
+
+        diff = np.abs(runs["full"]["tensor"] - runs["fast"]["tensor"])
+        print(f"   {'':>10} {'':>6} input tensor difference: mean {diff.mean():.4f}, max {diff.max():.3f} "
+              f"(decode {runs['full']['decode_ms'] / runs['fast']['decode_ms']:.1f}x faster)")
+
+
+def traced_allocations(fn) -> float:
+    """Peak bytes allocated (numpy buffers and Python objects) during fn(), in MB"""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return (peak - before) / (1024 * 1024)
+
+
+def bench_preprocess(args):
+    """Letterbox into reusable buffers vs the original allocate-per-step preprocessing"""
+    from PIL import Image
+
+    model_server.input_shape = [1, 3, 640, 640]
+    model_server.FAST_JPEG_DECODE = True
+
+    # Box round trip: a box placed in model space through the letterbox must
+    # come back to the same place in the uploaded image
+    print("[INFO] Letterbox round-trip check...")
+    for width, height in [(4000, 3000), (3000, 4000), (1280, 720), (640, 640), (500, 2000)]:
+        image = model_server.decode_image_bytes(make_jpeg(width, height), model_server.decode_target_size())
+        _, letterbox = model_server.preprocess_image(image, model_server.input_shape)
+        box = np.array([0.2 * width, 0.3 * height, 0.6 * width, 0.9 * height])
+        x1, x2 = box[[0, 2]] * letterbox.scale_x + letterbox.pad_x
+        y1, y2 = box[[1, 3]] * letterbox.scale_y + letterbox.pad_y
+        outputs = np.zeros((1, 4 + len(CLASS_NAMES), 8400), dtype=np.float32)
+        outputs[0, :4, 0] = [(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1]
+        outputs[0, 4, 0] = 0.9
+        with quiet():
+            detections = model_server.postprocess_detections(
+                outputs, 0.5, width, height, letterbox=letterbox
+            )
+        if len(detections) != 1 or not np.allclose(detections[0].bbox, box, atol=0.5):
+            print(f"[ERROR] {width}x{height}: expected {box.tolist()}, got {[d.bbox for d in detections]}")
+            sys.exit(1)
+    print("[SUCCESS] Boxes map back to the uploaded image for all aspect ratios")
+    print()
+
+    print(f"Preprocessing one decoded image into a 640x640 input (median of {args.repeat})")
+    print(f"   {'image':>10} {'decoded at':>11} {'legacy ms':>10} {'new ms':>8} {'legacy alloc MB':>16} {'new alloc MB':>13}")
+    for size in args.sizes:
+        width, height = (int(v) for v in size.lower().split("x"))
+        image = model_server.decode_image_bytes(make_jpeg(width, height), model_server.decode_target_size())
+        out, scratch = model_server.preprocess_buffers(1, 640, 640)
+
+        def new():
+            model_server.preprocess_image(image, model_server.input_shape, out=out[0], scratch=scratch)
+
+        def legacy():
+            legacy_preprocess(image, model_server.input_shape)
+
+        new()  # Warm up buffers
+        legacy_ms = time_call(legacy, args.repeat)
+        new_ms = time_call(new, args.repeat)
+        legacy_mb = traced_allocations(legacy)
+        new_mb = traced_allocations(new)
+        decoded = f"{image.size[0]}x{image.size[1]}"
+        print(f"   {size:>10} {decoded:>11} {legacy_ms:10.2f} {new_ms:8.2f} {legacy_mb:16.2f} {new_mb:13.2f}")
+    print("   (new path: decoded pixels and resize go through reused per-thread buffers)")
+
+
+def bench_cache(args):
+    """Cached vs uncached /detect, threshold changes, coalescing and the disk tier"""
+    workdir = Path(tempfile.mkdtemp(prefix="model-server-bench-"))
+    model_path = make_synthetic_model(workdir / "synthetic.onnx")
+    cache_db = str(workdir / "cache.sqlite")
+    width, height = args.width, args.height
+
+    def payload(seed: int, min_confidence: float) -> dict:
+        return {
+            "images": [{"stepId": "step0", "dataUrl": make_data_url(make_jpeg(width, height, seed)), "timestamp": 0}],
+            "minConfidence": min_confidence
+        }
+
+    def post(server, body: dict):
+        start = time.perf_counter()
+        response = http_post_json(f"{server.url}/detect", body)
+        return response, (time.perf_counter() - start) * 1000
+
+    def cache_stats(server) -> dict:
+        with urllib.request.urlopen(f"{server.url}/stats") as response:
+            return json.loads(response.read())["cache"]
+
+    thresholds = [0.1, 0.25, 0.5]
+    with quiet(), ServerThread(model_path, args.port) as server:
+        reference = {t: post(server, payload(0, t))[0] for t in thresholds}
+        uncached = [post(server, payload(0, 0.25))[1] for _ in range(args.repeat)]
+
+    with quiet(), ServerThread(model_path, args.port, cache_mb=64, cache_db=cache_db) as server:
+        _, first_ms = post(server, payload(0, 0.25))
+        hits = [post(server, payload(0, 0.25))[1] for _ in range(args.repeat)]
+        served = {t: post(server, payload(0, t))[0] for t in thresholds}
+
+        coalesce_payload = payload(1, 0.25)
+        before = cache_stats(server)
+        run_clients(f"{server.url}/detect", coalesce_payload, args.clients, 1)
+        after = cache_stats(server)
+
+    with quiet(), ServerThread(model_path, args.port, cache_mb=64, cache_db=cache_db) as server:
+        _, disk_ms = post(server, payload(0, 0.25))
+        restarted = cache_stats(server)
+
+    for t in thresholds:
+        if served[t]["results"] != reference[t]["results"]:
+            print(f"[ERROR] minConfidence={t}: cached response differs from the uncached one")
+            sys.exit(1)
+    print(f"[SUCCESS] Cached responses match uncached ones for minConfidence {thresholds}")
+    print()
+
+    print(f"/detect, one {width}x{height} JPEG (p50 of {args.repeat})")
+    print(f"   uncached:            {percentile(uncached, 50):8.2f} ms")
+    print(f"   first (miss):        {first_ms:8.2f} ms")
+    print(f"   memory hit:          {percentile(hits, 50):8.2f} ms")
+    print(f"   disk hit (restart):  {disk_ms:8.2f} ms   (disk_hits={restarted['disk_hits']})")
+    print(f"{args.clients} concurrent requests for one new image")
+    print(f"   inferred:  {after['misses'] - before['misses']}")
+    print(f"   coalesced: {after['coalesced'] - before['coalesced']}")
+    print(f"   hits:      {after['hits'] - before['hits']}")
+
+
+def bench_logging(args):
+    """Per-request cost of the logging subsystem at different levels"""
+    workdir = Path(tempfile.mkdtemp(prefix="model-server-bench-"))
+    model_server.load_model(str(make_synthetic_model(workdir / "synthetic.onnx")))
+    model_server.detection_cache = None
+    sources = [(f"step{i}", make_jpeg(640, 480, seed=i)) for i in range(args.images)]
+    options = model_server.DetectionRequest(images=[], minConfidence=0.5)
+
+    configs = [
+        ("off (WARNING)", "WARNING", "json", 0.0),
+        ("INFO, json", "INFO", "json", 0.0),
+        ("INFO, text", "INFO", "text", 0.0),
+        (f"DEBUG, json, {args.sample_rate:g} sampled", "DEBUG", "json", args.sample_rate),
+        ("DEBUG, json, every line", "DEBUG", "json", 1.0),
+    ]
+    # Configurations are interleaved over several rounds so drift in machine
+    # load does not land on one of them
+    for _ in range(50):
+        model_server.process_images(sources, options)
+    samples = {label: [] for label, *_ in configs}
+    call_us = {label: [] for label, *_ in configs}
+    with open(os.devnull, "w") as sink:
+        for _ in range(args.rounds):
+            for label, level, fmt, rate in configs:
+                model_server.configure_logging(level, fmt, rate, stream=sink)
+                try:
+                    for _ in range(3):
+                        model_server.process_images(sources, options)
+                    for _ in range(args.requests // args.rounds):
+                        start = time.perf_counter()
+                        model_server.process_images(sources, options)
+                        samples[label].append((time.perf_counter() - start) * 1000)
+                    call_us[label].append(time_call(
+                        lambda: model_server.logger.info("bench", extra={"images": 1, "duration_ms": 1.0}),
+                        1000
+                    ) * 1000)
+                finally:
+                    model_server.shutdown_logging()
+
+    print(f"process_images: {args.images} x 640x480 JPEG per request, p50 of {args.requests}")
+    print(f"   {'logging':<30} {'request ms':>11} {'overhead us':>12} {'log call us':>12}")
+    baseline = percentile(samples[configs[0][0]], 50)
+    for label, *_ in configs:
+        p50 = percentile(samples[label], 50)
+        print(f"   {label:<30} {p50:11.3f} {(p50 - baseline) * 1000:12.1f} {np.median(call_us[label]):12.2f}")
+    logging.getLogger("model_server").setLevel(logging.NOTSET)
+
+
+def bench_metrics(args):
+    """Cost of the per-request instrumentation, /metrics and Server-Timing"""
+    images = args.images
+
+    def instrumented_request():
+        # Everything process_images and the endpoint add for metrics
+        with model_server.request_metrics("bench"):
+            timer = model_server.StageTimer()
+            model_server.images_total.inc(images)
+            for _ in range(images):
+                timer.mark()
+                timer.lap("decode")
+                timer.lap("cache")
+                timer.lap("decode")
+                timer.lap("preprocess")
+            timer.mark()
+            model_server.ort_run_seconds.observe(0.01)
+            timer.lap("inference")
+            for _ in range(images):
+                timer.lap("postprocess")
+            timer.lap("nms")
+            model_server.detections_total.inc(3, label="shell")
+            model_server.detections_total.inc(2, label="hose")
+            model_server.record_stage_metrics(timer)
+            timer.server_timing()
+
+    per_request_us = time_call(instrumented_request, args.repeat) * 1000
+    render_ms = time_call(model_server.render_metrics, 50)
+    print(f"Instrumentation per request ({images} images, median of {args.repeat}): {per_request_us:.1f} us")
+    print(f"/metrics rendering: {render_ms:.3f} ms")
+    print()
+
+    workdir = Path(tempfile.mkdtemp(prefix="model-server-bench-"))
+    model_path = make_synthetic_model(workdir / "synthetic.onnx")
+    body = json.dumps({
+        "images": [
+            {"stepId": f"step{i}", "dataUrl": make_data_url(make_jpeg(4000, 3000, seed=i)), "timestamp": 0}
+            for i in range(images)
+        ],
+        "minConfidence": 0.5
+    }).encode()
+    with quiet(), ServerThread(model_path, args.port) as server:
+        request = urllib.request.Request(
+            f"{server.url}/detect", data=body, headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request) as response:
+            server_timing = response.headers["Server-Timing"]
+        with urllib.request.urlopen(f"{server.url}/metrics") as response:
+            exposition = response.read().decode()
+
+    stages = dict(
+        (part.split(";dur=")[0].strip(), float(part.split(";dur=")[1]))
+        for part in server_timing.split(",")
+    )
+    total = stages.pop("total")
+    print(f"Server-Timing for one /detect with {images} x 4000x3000 JPEGs:")
+    for stage, ms in stages.items():
+        print(f"   {stage:<12} {ms:8.2f} ms")
+    print(f"   {'total':<12} {total:8.2f} ms   (stages cover {sum(stages.values()) / total:.0%})")
+    if "model_server_stage_duration_seconds_count" not in exposition:
+        print("[ERROR] /metrics is missing the stage histograms")
+        sys.exit(1)
+    print(f"[SUCCESS] /metrics exposes {sum(1 for l in exposition.splitlines() if not l.startswith('#'))} samples")
+
+
+def bench_sessions(args):
+    """Throughput of session pool / thread configurations under concurrent requests"""
+    workdir = Path(tempfile.mkdtemp(prefix="model-server-bench-"))
+    model_path = make_synthetic_model(workdir / "synthetic.onnx")
+    payload = {
+        "images": [{"stepId": "step0", "dataUrl": make_data_url(make_jpeg(1280, 960)), "timestamp": 0}],
+        "minConfidence": 0.5
+    }
+
+    print(f"{args.clients} concurrent clients x {args.requests} single-image requests, "
+          f"{model_server.available_cores()} cores, spinning {'off' if args.no_spinning else 'on'}")
+    print(f"   {'sessions x threads':<20} {'images/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'single ms':>10}")
+    for config in args.configs:
+        sessions, threads = (int(v) for v in config.lower().split("x"))
+        model_server.SESSION_POOL_SIZE = sessions
+        model_server.ORT_INTRA_OP_THREADS = threads
+        model_server.ORT_ALLOW_SPINNING = not args.no_spinning
+        model_server.INFERENCE_WORKERS = max(args.clients, sessions)
+
+        with quiet(), ServerThread(model_path, args.port) as server:
+            with urllib.request.urlopen(f"{server.url}/health") as response:
+                active = json.loads(response.read())["sessions"]
+            single = [run_clients(f"{server.url}/detect", payload, 1, 1)[0] for _ in range(5)]
+            start = time.perf_counter()
+            latencies = run_clients(f"{server.url}/detect", payload, args.clients, args.requests)
+            elapsed = time.perf_counter() - start
+
+        label = f"{active['pool_size']} x {active['intra_op_threads']}"
+        print(f"   {label:<20} {len(latencies) / elapsed:9.2f} {percentile(latencies, 50):8.0f} "
+              f"{percentile(latencies, 99):8.0f} {percentile(single, 50):10.0f}")
+
+
+def child_pids(pid: int) -> List[int]:
+    """Direct children of a process (Linux)"""
+    try:
+        return [int(c) for c in Path(f"/proc/{pid}/task/{pid}/children").read_text().split()]
+    except OSError:
+        return []
+
+
+def start_server_process(model_path: Path, port: int, workers: int, extra_args: tuple = ()):
+    """Start model_server.py as a subprocess and wait until every worker answers /ready"""
+    import subprocess
+
+    server_script = Path(model_server.__file__)
+    process = subprocess.Popen(
+        [sys.executable, str(server_script), "--model", str(model_path), "--port", str(port),
+         "--workers", str(workers), "--cache-mb", "0", "--log-level", "WARNING", *extra_args],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    seen = set()
+    while len(seen) < workers:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server on port {port} exited with code {process.returncode}")
+        if time.perf_counter() - start > 120:
+            process.kill()
+            raise RuntimeError(f"Server on port {port} did not start")
+        try:
+            with urllib.request.urlopen(f"{url}/ready", timeout=5) as response:
+                seen.add(json.loads(response.read())["pid"])
+        except OSError:
+            time.sleep(0.1)
+    return process, url, time.perf_counter() - start
+
+
+def bench_workers(args):
+    """Memory of N pre-forked workers sharing the model vs N independent server processes"""
+    import signal
+
+    if not hasattr(os, "fork") or not Path("/proc/self/smaps_rollup").exists():
+        print("[ERROR] needs Linux (os.fork and /proc/<pid>/smaps_rollup)")
+        sys.exit(1)
+
+    workdir = Path(tempfile.mkdtemp(prefix="model-server-bench-"))
+    model_path = make_synthetic_model(workdir / "synthetic.onnx", weights_mb=args.weights_mb)
+    payload = {
+        "images": [{"stepId": "step0", "dataUrl": make_data_url(make_jpeg(1280, 960)), "timestamp": 0}],
+        "minConfidence": 0.5
+    }
+    print(f"{args.workers} workers, synthetic model {model_path.stat().st_size / (1024 * 1024):.1f} MB, "
+          f"{args.requests} warm-up requests per worker")
+
+    def run(layout: str):
+        if layout == "pre-fork":
+            servers = [start_server_process(model_path, args.port, args.workers)]
+            parent = servers[0][0].pid
+            pids = [(str(i), pid) for i, pid in enumerate(child_pids(parent))] + [("parent", parent)]
+        else:
+            servers = [start_server_process(model_path, args.port + 1 + i, 1) for i in range(args.workers)]
+            pids = [(str(i), process.pid) for i, (process, _, _) in enumerate(servers)]
+        try:
+            urls = [url for _, url, _ in servers]
+            for url in urls:
+                run_clients(f"{url}/detect", payload, args.workers, args.requests * args.workers // len(urls))
+            memory = [(label, model_server.process_memory(pid)) for label, pid in pids]
+        finally:
+            for process, _, _ in servers:
+                process.send_signal(signal.SIGTERM)
+            for process, _, _ in servers:
+                process.wait(timeout=30)
+        ready = max(seconds for _, _, seconds in servers)
+        return memory, ready
+
+    results = {}
+    for layout in ("independent", "pre-fork"):
+        memory, ready = run(layout)
+        results[layout] = memory
+        print()
+        print(f"{layout}: all {args.workers} workers ready after {ready:.2f} s")
+        print(f"   {'process':<8} {'RSS MB':>8} {'PSS MB':>8} {'private MB':>11}")
+        for label, m in memory:
+            print(f"   {label:<8} {m['rss_mb']:8.1f} {m['pss_mb']:8.1f} {m['private_mb']:11.1f}")
+        print(f"   {'total':<8} {sum(m['rss_mb'] for _, m in memory):8.1f} "
+              f"{sum(m['pss_mb'] for _, m in memory):8.1f} {sum(m['private_mb'] for _, m in memory):11.1f}")
+
+    independent = sum(m["pss_mb"] for _, m in results["independent"])
+    shared = sum(m["pss_mb"] for _, m in results["pre-fork"])
+    print()
+    print(f"[INFO] Pre-fork workers use {independent - shared:.1f} MB less in total "
+          f"({shared / independent:.0%} of independent processes, by PSS)")
+
+
+def live_session(url: str, frames: List[bytes], fps: float, seconds: float) -> dict:
+    """Send frames to /ws/live at a fixed rate; per processed frame: latency and detections"""
+    from websockets.sync.client import connect
+
+    sent_at = {}
+    results = []
+    stats = None
+    with connect(url, max_size=None) as websocket:
+        hello = json.loads(websocket.recv())
+
+        def send():
+            start = time.perf_counter()
+            count = int(fps * seconds)
+            for i in range(count):
+                delay = start + i / fps - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                sent_at[i + 1] = time.perf_counter()
+                websocket.send(frames[i % len(frames)])
+
+        sender = threading.Thread(target=send)
+        sender.start()
+        deadline = None
+        while True:
+            if deadline is None and not sender.is_alive():
+                deadline = time.perf_counter() + 2.0
+            try:
+                message = json.loads(websocket.recv(timeout=0.2))
+            except TimeoutError:
+                if deadline is not None and time.perf_counter() > deadline:
+                    break
+                continue
+            if message["type"] == "frame":
+                results.append(((time.perf_counter() - sent_at[message["seq"]]) * 1000, message["detections"]))
+            elif message["type"] == "stats":
+                stats = message
+        sender.join()
+    return {"hello": hello, "results": results, "stats": stats, "sent": len(sent_at)}
+
+
+def flicker(results: List[tuple]) -> float:
+    """Mean detections appearing or disappearing per processed frame (by class count)"""
+    changes = []
+    previous = None
+    for _, detections in results:
+        counts = {}
+        for det in detections:
+            counts[det[0]] = counts.get(det[0], 0) + 1
+        if previous is not None:
+            changes.append(sum(abs(counts.get(c, 0) - previous.get(c, 0)) for c in set(counts) | set(previous)))
+        previous = counts
+    return float(np.mean(changes)) if changes else 0.0
+
+
+def bench_live(args):
+    """/ws/live: frames sent faster than inference, newest-frame processing, session limit and smoothing"""
+    from websockets.exceptions import ConnectionClosed
+    from websockets.sync.client import connect
+
+    workdir = Path(tempfile.mkdtemp(prefix="model-server-bench-"))
+    model_path = make_synthetic_model(workdir / "synthetic.onnx")
+    frames = [make_jpeg(640, 480, seed=i, quality=70) for i in range(10)]
+    model_server.LIVE_MAX_SESSIONS = args.sessions
+    model_server.LIVE_STATS_SECONDS = 1.0
+    print(f"{args.sessions} sessions sending 640x480 frames ({np.mean([len(f) for f in frames]) / 1024:.0f} KB) "
+          f"at {args.fps} fps for {args.seconds} s, {model_server.available_cores()} cores")
+
+    with quiet(), ServerThread(model_path, args.port) as server:
+        url = server.url.replace("http://", "ws://") + f"/ws/live?minConfidence={args.min_confidence}"
+        single = [live_session(url, frames[:1], 2, 1)["results"][-1][0] for _ in range(3)]
+
+        sessions = [None] * args.sessions
+
+        def run(i):
+            smoothing = args.smoothing if i % 2 else 0
+            sessions[i] = live_session(f"{url}&smoothing={smoothing}", frames, args.fps, args.seconds)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(args.sessions)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.5)
+        try:
+            with connect(url) as websocket:
+                websocket.recv()
+                websocket.recv(timeout=5)
+            refused = "accepted"
+        except ConnectionClosed as e:
+            refused = f"closed with {e.rcvd.code} ({e.rcvd.reason})"
+        for thread in threads:
+            thread.join()
+
+    print(f"   single frame, idle server: {percentile(single, 50):.0f} ms")
+    print(f"   session {args.sessions + 1} while {args.sessions} are open: {refused}")
+    print()
+    print(f"   {'session':<8} {'smoothing':>9} {'sent':>6} {'done':>6} {'fps':>6} {'drop rate':>10} "
+          f"{'p50 ms':>7} {'p95 ms':>7} {'flicker':>8}")
+    for i, session in enumerate(sessions):
+        latencies = [ms for ms, _ in session["results"]]
+        stats = session["stats"] or {}
+        print(f"   {i:<8} {session['hello']['smoothing']:>9} {session['sent']:6d} {len(session['results']):6d} "
+              f"{stats.get('fps', 0):6.1f} {stats.get('drop_rate', 0):10.1%} "
+              f"{percentile(latencies, 50):7.0f} {percentile(latencies, 95):7.0f} {flicker(session['results']):8.2f}")
+    print()
+    print("[INFO] fps and drop rate are the server's last stats message; latency is send to result "
+          "of the frames that were processed; flicker = detections appearing/disappearing per frame")
+
+
+def bench_reload(args):
+    """Hot model reload under load: failed requests and latency around the swap, then a file-watch reload"""
+    workdir = Path(tempfile.mkdtemp(prefix="model-server-bench-"))
+    model_a = make_synthetic_model(workdir / "a.onnx", weights_mb=args.weights_mb, seed=0)
+    model_b = make_synthetic_model(workdir / "b.onnx", weights_mb=args.weights_mb, seed=1)
+    live_path = workdir / "best.onnx"
+    shutil.copy(model_a, live_path)
+    payload = {
+        "images": [{"stepId": "step0", "dataUrl": make_data_url(make_jpeg(1280, 960)), "timestamp": 0}],
+        "minConfidence": 0.5
+    }
+    model_server.MODEL_WATCH_SECONDS = 0.2
+    print(f"{args.clients} clients sending single-image /detect requests, synthetic model "
+          f"{model_a.stat().st_size / (1024 * 1024):.1f} MB, {model_server.available_cores()} cores")
+
+    samples = []  # (start, end, ok)
+    stop = threading.Event()
+
+    def client():
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                http_post_json(f"{server.url}/detect", payload)
+                ok = True
+            except Exception:
+                ok = False
+            samples.append((start, time.perf_counter(), ok))
+
+    def health_hash() -> str:
+        with urllib.request.urlopen(f"{server.url}/health") as response:
+            return json.loads(response.read())["model"]["hash"]
+
+    with quiet(), ServerThread(live_path, args.port) as server:
+        first = model_server.active_model
+        threads = [threading.Thread(target=client) for _ in range(args.clients)]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds)
+
+        admin = (time.perf_counter(),)
+        reload = http_post_json(f"{server.url}/admin/reload", {"path": str(model_b)})
+        admin += (time.perf_counter(),)
+        pinned = first.in_flight
+        time.sleep(args.seconds)
+        released = first.ort_session is None
+
+        # Deploy by atomic rename over the watched file
+        watch = (time.perf_counter(),)
+        shutil.copy(model_a, workdir / "best.onnx.tmp")
+        os.replace(workdir / "best.onnx.tmp", live_path)
+        target = model_server.model_file_hash(str(model_a))
+        while health_hash() != target:
+            time.sleep(0.05)
+        watch += (time.perf_counter(),)
+        time.sleep(args.seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        versions = model_server.active_model.generation
+
+    def phase(name: str, start: float, end: float):
+        rows = [(s, e, ok) for s, e, ok in samples if e >= start and s <= end]
+        latencies = [(e - s) * 1000 for s, e, ok in rows if ok]
+        failed = sum(1 for _, _, ok in rows if not ok)
+        print(f"   {name:<26} {len(rows):9d} {failed:7d} {percentile(latencies, 50):7.0f} {percentile(latencies, 99):7.0f}")
+
+    print()
+    print(f"   /admin/reload: version {reload['previous']['version']} -> {reload['model']['version']}, "
+          f"load + warm-up {reload['seconds'] * 1000:.0f} ms")
+    print(f"   requests still on version 1 at the swap: {pinned}, its sessions released afterwards: {released}")
+    print(f"   file watch: new file served after {(watch[1] - watch[0]) * 1000:.0f} ms "
+          f"(poll {model_server.MODEL_WATCH_SECONDS} s), {versions} versions loaded in total")
+    print()
+    print(f"   {'phase':<26} {'requests':>9} {'failed':>7} {'p50 ms':>7} {'p99 ms':>7}")
+    phase("before reload", samples[0][0], admin[0])
+    phase("during /admin/reload", *admin)
+    phase("between reloads", admin[1], watch[0])
+    phase("during file-watch reload", *watch)
+    phase("after", watch[1], samples[-1][1])
+
+
+def bench_startup(args):
+    """Cold start: time until the port answers and until the model is ready, with and without the graph cache"""
+    import signal
+    import subprocess
+
+    workdir = Path(tempfile.mkdtemp(prefix="model-server-bench-"))
+    model_path = make_synthetic_model(workdir / "synthetic.onnx", weights_mb=args.weights_mb)
+    cache_dir = workdir / "ort-cache"
+    server_script = Path(model_server.__file__)
+    payload = {
+        "images": [
+            {"stepId": f"step{i}", "dataUrl": make_data_url(make_jpeg(1280, 960, seed=i)), "timestamp": 0}
+            for i in range(args.images)
+        ],
+        "minConfidence": 0.5
+    }
+    url = f"http://127.0.0.1:{args.port}"
+    print(f"Synthetic model {model_path.stat().st_size / (1024 * 1024):.1f} MB, {args.images}-image /detect, "
+          f"{model_server.available_cores()} cores; times from process start")
+
+    def run(extra_args: List[str], early: bool) -> dict:
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, str(server_script), "--model", str(model_path), "--port", str(args.port),
+             "--cache-mb", "0", "--log-level", "WARNING", "--ort-cache-dir", str(cache_dir), *extra_args],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            while True:
+                try:
+                    http_get(f"{url}/live", timeout=5)
+                    break
+                except OSError:
+                    if process.poll() is not None:
+                        raise RuntimeError(f"Server exited with code {process.returncode}")
+                    time.sleep(0.005)
+            live = time.perf_counter() - start
+            early_ms = float("nan")
+            if early:
+                # Sent while the model is still loading: waits instead of a 503
+                sent = time.perf_counter()
+                http_post_json(f"{url}/detect", payload)
+                early_ms = (time.perf_counter() - sent) * 1000
+            report = wait_ready(url)
+            ready = time.perf_counter() - start
+            first = sample_call(lambda: http_post_json(f"{url}/detect", payload), 1, warmup=0)[0]
+            steady = percentile(sample_call(lambda: http_post_json(f"{url}/detect", payload), 5), 50)
+        finally:
+            process.send_signal(signal.SIGTERM)
+            process.wait(timeout=30)
+        return {"live": live, "ready": ready, "early_ms": early_ms, "first_ms": first, "steady_ms": steady,
+                "startup": report["startup"]}
+
+    scenarios = [
+        ("no graph cache, no warm-up", ["--no-ort-cache", "--warmup", "off"], False),
+        ("no graph cache, warm-up", ["--no-ort-cache"], False),
+        ("graph cache (first start)", [], False),
+        ("graph cache (later starts)", [], False),
+        ("graph cache, no warm-up", ["--warmup", "off"], False),
+        ("/detect during startup", [], True),
+    ]
+    print()
+    print(f"   {'start':<28} {'/live s':>8} {'/ready s':>9} {'load s':>7} {'warm s':>7} "
+          f"{'early ms':>9} {'1st ms':>7} {'p50 ms':>7}")
+    for name, extra_args, early in scenarios:
+        r = run(extra_args, early)
+        print(f"   {name:<28} {r['live']:8.2f} {r['ready']:9.2f} {r['startup'].get('load_s', 0):7.2f} "
+              f"{r['startup'].get('warmup_s', 0):7.2f} {r['early_ms']:9.0f} {r['first_ms']:7.0f} {r['steady_ms']:7.0f}")
+    print()
+    print("[INFO] early = /detect sent as soon as /live answers (waits for the model instead of a 503); "
+          "1st = first /detect after /ready; load/warm = server's startup report")
+
+
+
+def post_timed(url: str, payload: dict):
+    """POST JSON; (parsed response, ms, Server-Timing stages in ms)"""
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=300) as response:
+        body = json.loads(response.read())
+        timing = response.headers.get("Server-Timing", "")
+    ms = (time.perf_counter() - start) * 1000
+    stages = {}
+    for part in filter(None, timing.split(", ")):
+        name, _, duration = part.partition(";dur=")
+        stages[name] = float(duration)
+    return body, ms, stages
+
+
+def matched_detections(reference: List[dict], candidate: List[dict], iou_threshold: float) -> List[bool]:
+    """Per reference detection: whether a same-class candidate matches it (greedy, one to one)"""
+    matched = [False] * len(reference)
+    for det in sorted(candidate, key=lambda det: -det["confidence"]):
+        same_class = [i for i, ref in enumerate(reference) if ref["class_name"] == det["class_name"] and not matched[i]]
+        if not same_class:
+            continue
+        box = np.array([det["bbox"]], dtype=np.float32)
+        ref_boxes = np.array([reference[i]["bbox"] for i in same_class], dtype=np.float32)
+        ious = model_server.box_iou(box, ref_boxes)[0]
+        # Boxes clipped to zero area at the image edge have IoU 0 even with themselves
+        ious[np.all(ref_boxes == box, axis=1)] = 1.0
+        best = int(np.argmax(ious))
+        if ious[best] >= iou_threshold:
+            matched[same_class[best]] = True
+    return matched
+
+
+def bench_tiers(args):
+    """Resolution tiers: /detect latency per tier and detections kept relative to the accurate tier"""
+    workdir = Path(tempfile.mkdtemp(prefix="model-server-bench-"))
+    model_path = Path(args.model) if args.model else make_synthetic_model(workdir / "dynamic.onnx", imgsz=None)
+    if args.images:
+        files = sorted(p for p in Path(args.images).rglob("*") if p.suffix.lower() in {".jpg", ".jpeg", ".png"})
+        images = [p.read_bytes() for p in files[:args.limit]]
+        if not images:
+            print(f"[ERROR] No images (.jpg/.jpeg/.png) found in {args.images}")
+            sys.exit(1)
+        sizes = None
+    else:
+        sizes = [(4032, 3024) if i % 2 == 0 else (3024, 4032) for i in range(args.limit)]
+        images = [make_jpeg(width, height, seed=i) for i, (width, height) in enumerate(sizes)]
+    tiers = list(model_server.RESOLUTION_TIERS)
+    print(f"{len(images)} images, model {model_path}, {model_server.available_cores()} cores")
+
+    def payload(batch: List[bytes], tier: str) -> dict:
+        return {
+            "images": [{"stepId": f"img{i}", "dataUrl": make_data_url(data), "timestamp": 0} for i, data in enumerate(batch)],
+            "minConfidence": args.min_confidence,
+            "tier": tier
+        }
+
+    results = {}
+    with quiet(), ServerThread(model_path, args.port) as server:
+        url = f"{server.url}/detect"
+        dynamic = wait_ready(server.url)["model"]["input_size"] == "dynamic"
+        for tier in tiers:
+            post_timed(url, payload(images[:1], tier))
+            single_ms, inference_ms, detections, imgsz = [], [], [], None
+            for _ in range(args.repeat):
+                detections = []
+                for data in images:
+                    body, ms, stages = post_timed(url, payload([data], tier))
+                    single_ms.append(ms)
+                    inference_ms.append(stages.get("inference", 0.0))
+                    detections.append(body["results"][0]["detections"])
+                    imgsz = body["imgsz"]
+            batch_ms = [post_timed(url, payload(images[:args.batch], tier))[1] for _ in range(args.repeat)]
+            results[tier] = {
+                "imgsz": imgsz,
+                "single_ms": percentile(single_ms, 50),
+                "inference_ms": percentile(inference_ms, 50),
+                "batch_ms": percentile(batch_ms, 50),
+                "detections": detections,
+            }
+
+    static_path = make_synthetic_model(workdir / "static.onnx")
+    with quiet(), ServerThread(static_path, args.port) as server:
+        speed = http_post_json(f"{server.url}/detect", payload(images[:1], "speed"))
+        accurate = http_post_json(f"{server.url}/detect", payload(images[:1], "accurate"))
+        try:
+            http_post_json(f"{server.url}/detect", dict(payload(images[:1], "speed"), imgsz=333))
+            rejected = "accepted"
+        except urllib.error.HTTPError as e:
+            rejected = f"HTTP {e.code}"
+    if speed["imgsz"] != 640 or speed["results"] != accurate["results"]:
+        print("[ERROR] A fixed 640x640 model did not ignore tier=speed")
+        sys.exit(1)
+    print(f"[SUCCESS] Fixed-size model: tier=speed runs at {speed['imgsz']} like accurate; imgsz=333 -> {rejected}")
+    if not dynamic:
+        print(f"[WARNING] {model_path} has a fixed input size, so every tier runs at the same size "
+              "(export with scripts/export-onnx-model.py --dynamic)")
+    print()
+
+    reference = results["accurate"]["detections"]
+    print(f"/detect per tier (p50 of {args.repeat} passes; batch = {min(args.batch, len(images))} images per request)")
+    print(f"   {'tier':<9} {'imgsz':>5} {'1 image ms':>11} {'inference':>10} {'batch ms':>9} {'speedup':>8} "
+          f"{'dets':>6} {'recall':>7} {'small':>7} {'precision':>10} {'box x':>6}")
+    for tier, r in results.items():
+        matched = small_total = small_matched = 0
+        reference_total = sum(len(dets) for dets in reference)
+        candidate_total = sum(len(dets) for dets in r["detections"])
+        centers = []
+        for i, (ref, cand) in enumerate(zip(reference, r["detections"])):
+            hits = matched_detections(ref, cand, args.match_iou)
+            matched += sum(hits)
+            long_side = max(sizes[i]) if sizes else max(max(d["bbox"][2], d["bbox"][3]) for d in ref + cand or [{"bbox": [0, 0, 1, 1]}])
+            for det, hit in zip(ref, hits):
+                if max(det["bbox"][2] - det["bbox"][0], det["bbox"][3] - det["bbox"][1]) < args.small * long_side:
+                    small_total += 1
+                    small_matched += hit
+            if sizes:
+                centers += [(d["bbox"][0] + d["bbox"][2]) / 2 / sizes[i][0] for d in cand]
+        ratio = lambda part, total: f"{part / total:.1%}" if total else "-"
+        print(f"   {tier:<9} {r['imgsz']:>5} {r['single_ms']:11.1f} {r['inference_ms']:10.1f} {r['batch_ms']:9.1f} "
+              f"{results['accurate']['single_ms'] / r['single_ms']:7.2f}x {candidate_total:6d} "
+              f"{ratio(matched, reference_total):>7} {ratio(small_matched, small_total):>7} "
+              f"{ratio(matched, candidate_total):>10} {np.mean(centers) if centers else float('nan'):6.2f}")
+    print()
+    print(f"[INFO] recall/precision = detections matching the accurate tier's (same class, IoU >= {args.match_iou}); "
+          f"small = reference boxes under {args.small:.0%} of the image's long side; "
+          "box x = mean box center / image width, the same for every tier when boxes are scaled back "
+          "to the image correctly")
+    if not args.model:
+        print("[INFO] The synthetic model has random weights, so its agreement between tiers is not a recall "
+              "measurement; pass --model (a --dynamic export) and --images for real numbers")
+
+
+
+# Classes that shrink to a few pixels in a full-frame 640x640 view
+SMALL_CLASSES = ("safety_pin", "pin_seal", "service_tag")
+
+
+def load_yolo_labels(path: Path, img_width: int, img_height: int) -> List[dict]:
+    """Ground-truth boxes of a YOLO label file (class cx cy w h, normalized) as detection dicts"""
+    labels = []
+    if not path.exists():
+        return labels
+    for line in path.read_text().splitlines():
+        values = line.split()
+        if len(values) < 5:
+            continue
+        class_id, cx, cy, w, h = int(values[0]), *(float(v) for v in values[1:5])
+        labels.append({
+            "class_name": CLASS_NAMES.get(class_id, f"unknown_class_{class_id}"),
+            "confidence": 1.0,
+            "bbox": [(cx - w / 2) * img_width, (cy - h / 2) * img_height,
+                     (cx + w / 2) * img_width, (cy + h / 2) * img_height],
+        })
+    return labels
+
+
+def bench_modes(args):
+    """Full-frame vs tiled vs cascade /detect: latency, tiles, stage timings and (with labels) recall per class"""
+    from PIL import Image
+
+    workdir = Path(tempfile.mkdtemp(prefix="model-server-bench-"))
+    model_path = Path(args.model) if args.model else make_synthetic_model(workdir / "synthetic.onnx", imgsz=None)
+    if args.images:
+        files = sorted(p for p in Path(args.images).rglob("*") if p.suffix.lower() in {".jpg", ".jpeg", ".png"})
+        files = files[:args.limit]
+        if not files:
+            print(f"[ERROR] No images (.jpg/.jpeg/.png) found in {args.images}")
+            sys.exit(1)
+        images = {p.name: p.read_bytes() for p in files}
+    else:
+        files = []
+        images = {size: make_jpeg(*(int(v) for v in size.split("x")), seed=i) for i, size in enumerate(args.resolutions)}
+    modes = args.modes
+    print(f"{len(images)} images, model {model_path}, {model_server.available_cores()} cores, modes {', '.join(modes)}")
+    print(f"tiles: overlap {model_server.TILE_OVERLAP:.0%}, max {model_server.TILE_MAX_TILES}; cascade: coarse tier "
+          f"{model_server.CASCADE_COARSE_TIER}, margin {model_server.CASCADE_MARGIN:.0%}")
+
+    def payload(name: str, mode: str) -> dict:
+        return {
+            "images": [{"stepId": name, "dataUrl": make_data_url(images[name]), "timestamp": 0}],
+            "minConfidence": args.min_confidence,
+            "tiled": mode == "tiled",
+            "cascade": mode == "cascade"
+        }
+
+    if not args.model:
+        # Random weights never score a shell; guide by a class they do score so the ROI pass runs
+        model_server.CASCADE_ROI_CLASS = "pressure_gauge"
+
+    rows, detections = [], {mode: {} for mode in modes}
+    with quiet(), ServerThread(model_path, args.port) as server:
+        url = f"{server.url}/detect"
+        input_size = wait_ready(server.url)["model"]["input_size"]
+        tile_size = 640 if input_size == "dynamic" else min(input_size)
+        for name, data in images.items():
+            size = Image.open(io.BytesIO(data)).size
+            timings = {}
+            for mode in modes:
+                post_timed(url, payload(name, mode))
+                samples = [post_timed(url, payload(name, mode)) for _ in range(args.repeat)]
+                stages = {stage: percentile([s.get(stage, 0.0) for _, _, s in samples], 50) for stage in samples[-1][2]}
+                timings[mode] = (percentile([ms for _, ms, _ in samples], 50), stages)
+                detections[mode][name] = (size, samples[-1][0]["results"][0]["detections"])
+            rows.append((name, size, len(model_server.tile_grid(*size, tile_size)), timings))
+        metrics = urllib.request.urlopen(f"{server.url}/metrics").read().decode()
+
+    print()
+    print(f"/detect, one image per request (p50 of {args.repeat}, ms)")
+    print(f"   {'image':<16} {'size':>10} {'tiles':>6} " + " ".join(f"{mode:>9}" for mode in modes)
+          + (f" {'ms/tile':>8}" if {"full", "tiled"} <= set(modes) else ""))
+    for name, size, tiles, timings in rows:
+        line = f"   {name[:16]:<16} {f'{size[0]}x{size[1]}':>10} {tiles:6d} " + " ".join(
+            f"{timings[mode][0]:9.1f}" for mode in modes
+        )
+        if {"full", "tiled"} <= set(modes):
+            line += f" {(timings['tiled'][0] - timings['full'][0]) / tiles if tiles else float('nan'):8.1f}"
+        print(line)
+    print()
+    print("Server-Timing stages (p50 ms)")
+    stage_names = ["decode", "preprocess", "inference", "coarse_inference", "refine_inference", "postprocess", "nms"]
+    print(f"   {'image':<16} {'mode':<8} " + " ".join(f"{stage[:12]:>12}" for stage in stage_names))
+    for name, _, _, timings in rows:
+        for mode in modes:
+            stages = timings[mode][1]
+            print(f"   {name[:16]:<16} {mode:<8} " + " ".join(
+                f"{stages[stage]:12.1f}" if stage in stages else f"{'-':>12}" for stage in stage_names
+            ))
+    counters = [line for line in metrics.splitlines()
+                if line.startswith(("model_server_tiles_total", "model_server_cascade_rois_total"))]
+    print(f"[INFO] {'; '.join(counters)}")
+    print("[INFO] ms/tile = (tiled - full) / tiles")
+
+    if not args.labels:
+        print()
+        for mode in modes:
+            counts = {cls: sum(sum(d["class_name"] == cls for d in dets) for _, dets in detections[mode].values())
+                      for cls in SMALL_CLASSES}
+            print(f"   {mode:<8} small-class detections: " + ", ".join(f"{cls} {count}" for cls, count in counts.items()))
+        print("[INFO] Recall needs ground truth: pass --model, --images and --labels (YOLO .txt files)")
+        if not args.model:
+            print("[INFO] The synthetic model has random weights; its detection counts only exercise the pipeline")
+        return
+
+    print()
+    print(f"Recall against {args.labels} (same class, IoU >= {args.match_iou})")
+    print(f"   {'class':<16} {'labels':>7} " + " ".join(f"{mode:>8}" for mode in modes))
+    for class_name in CLASS_NAMES.values():
+        found = {mode: 0 for mode in modes}
+        total = 0
+        for path in files:
+            size, _ = detections[modes[0]][path.name]
+            truth = [d for d in load_yolo_labels(Path(args.labels) / f"{path.stem}.txt", *size) if d["class_name"] == class_name]
+            total += len(truth)
+            for mode in modes:
+                found[mode] += sum(matched_detections(truth, detections[mode][path.name][1], args.match_iou))
+        if total:
+            marker = " *" if class_name in SMALL_CLASSES else ""
+            print(f"   {class_name:<16} {total:7d} " + " ".join(f"{found[mode] / total:8.1%}" for mode in modes) + marker)
+    print("   (* small classes)")
+
+
+def post_status(url: str, payload, headers: Optional[dict] = None, timeout: float = 300):
+    """POST JSON (a dict or encoded bytes); (HTTP status, parsed body, response headers, ms), errors included"""
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json", **(headers or {})})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            status, body, response_headers = response.status, json.loads(response.read()), response.headers
+    except urllib.error.HTTPError as e:
+        status, body, response_headers = e.code, json.loads(e.read()), e.headers
+    return status, body, response_headers, (time.perf_counter() - start) * 1000
+
+
+def bench_admission(args):
+    """A burst of /detect requests with and without the bounded queue and client deadlines, then partial results"""
+    workdir = Path(tempfile.mkdtemp(prefix="model-server-bench-"))
+    model_path = make_synthetic_model(workdir / "synthetic.onnx")
+    width, height = (int(v) for v in args.resolution.split("x"))
+    jpegs = [make_jpeg(width, height, seed=i) for i in range(args.images * 2)]
+
+    def payload(count: int) -> dict:
+        return {
+            "images": [{"stepId": f"step{i}", "dataUrl": make_data_url(data), "timestamp": 0}
+                       for i, data in enumerate(jpegs[:count])],
+            "minConfidence": 0.5
+        }
+
+    burst_payload = json.dumps(payload(args.images)).encode()
+    model_server.INFERENCE_WORKERS = args.workers
+    print(f"Burst of {args.burst} requests x {args.images} images ({args.resolution}), {args.workers} inference "
+          f"workers, {model_server.available_cores()} cores; clients give up after {args.client_timeout:g} s")
+
+    configs = [
+        ("unbounded, no deadline", 0, None),
+        ("unbounded + deadline", 0, args.client_timeout),
+        (f"queue {args.max_queued} + deadline", args.max_queued, args.client_timeout),
+    ]
+    rows = []
+    for label, max_queued, deadline in configs:
+        model_server.MAX_QUEUED_REQUESTS = max_queued
+        headers = {"X-Deadline-Ms": str(int(deadline * 1000)), "X-Allow-Partial": "true"} if deadline else {}
+        with quiet(), ServerThread(model_path, args.port) as server:
+            url = f"{server.url}/detect"
+            single_ms = percentile([post_status(url, burst_payload)[3] for _ in range(3)], 50)
+            outcomes = []
+            lock = threading.Lock()
+            barrier = threading.Barrier(args.burst)
+
+            def client():
+                barrier.wait()
+                status, body, response_headers, ms = post_status(url, burst_payload, headers)
+                with lock:
+                    outcomes.append((status, body, response_headers.get("Retry-After"), ms))
+
+            start = time.perf_counter()
+            threads = [threading.Thread(target=client) for _ in range(args.burst)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            busy_s = time.perf_counter() - start
+            metrics = urllib.request.urlopen(f"{server.url}/metrics").read().decode()
+
+        in_time = [ms for status, _, _, ms in outcomes if status == 200 and ms <= args.client_timeout * 1000]
+        late = sum(status == 200 and ms > args.client_timeout * 1000 for status, _, _, ms in outcomes)
+        statuses = {code: sum(status == code for status, *_ in outcomes) for code in (429, 504)}
+        partial = sum(status == 200 and body["partial"] for status, body, _, _ in outcomes)
+        retry_after = sorted({int(value) for status, _, value, _ in outcomes if status == 429 and value})
+        counters = [line for line in metrics.splitlines()
+                    if line.startswith(("model_server_requests_rejected_total", "model_server_deadline_expired_total"))]
+        rows.append((label, single_ms, len(in_time), late, partial, statuses, retry_after, busy_s,
+                     percentile(in_time, 50) if in_time else float("nan"), counters))
+
+    print()
+    print(f"   {'config':<24} {'in time':>8} {'partial':>8} {'late':>5} {'429':>5} {'504':>5} "
+          f"{'p50 ok ms':>10} {'busy s':>7} {'retry-after s':>14}")
+    for label, single_ms, in_time, late, partial, statuses, retry_after, busy_s, p50, _ in rows:
+        print(f"   {label:<24} {in_time:8d} {partial:8d} {late:5d} {statuses[429]:5d} {statuses[504]:5d} "
+              f"{p50:10.0f} {busy_s:7.1f} {','.join(map(str, retry_after)) or '-':>14}")
+    print(f"[INFO] One request alone: {rows[0][1]:.0f} ms. in time = 200 within the client timeout (partial = some "
+          "images expired); late = 200 after the client gave up (wasted work); busy s = burst start to last response")
+    for label, *_, counters in rows:
+        print(f"[INFO] {label}: {'; '.join(counters) or 'no rejections or expiries'}")
+
+    # Partial results: a deadline shorter than the request leaves its last images unprocessed
+    model_server.MAX_QUEUED_REQUESTS = args.max_queued
+    big = payload(args.images * 2)
+    with quiet(), ServerThread(model_path, args.port) as server:
+        url = f"{server.url}/detect"
+        post_status(url, big)
+        _, full, _, full_ms = post_status(url, big)
+        budget_ms = int(full_ms / 2)
+        whole_status, whole, _, whole_ms = post_status(url, big, {"X-Deadline-Ms": str(budget_ms)})
+        status, cut, _, cut_ms = post_status(url, big, {"X-Deadline-Ms": str(budget_ms), "X-Allow-Partial": "true"})
+        queued_status = post_status(url, big, {"X-Deadline-Ms": "0.001"})[0]
+        invalid_status = post_status(url, big, {"X-Deadline-Ms": "soon"})[0]
+    done = [r for r in cut["results"] if not r["expired"]]
+    same = all(r["detections"] == full["results"][i]["detections"]
+               for i, r in enumerate(cut["results"]) if not r["expired"])
+    print()
+    print(f"Partial result: {len(big['images'])} images take {full_ms:.0f} ms; with X-Deadline-Ms {budget_ms} -> "
+          f"HTTP {status} in {cut_ms:.0f} ms, {len(done)} processed, {len(cut['results']) - len(done)} expired, "
+          f"partial={cut['partial']}")
+    print(f"Without X-Allow-Partial: HTTP {whole_status} in {whole_ms:.0f} ms, "
+          f"{sum(not r['expired'] for r in whole['results'])} of {len(big['images'])} processed")
+    if not same:
+        print("[ERROR] Processed images of the partial result differ from the full run")
+        sys.exit(1)
+    if whole["partial"] or whole["results"] != full["results"]:
+        print("[ERROR] A request without X-Allow-Partial returned a partial result")
+        sys.exit(1)
+    print(f"[SUCCESS] Processed images match the full run; a deadline already spent -> HTTP {queued_status}, "
+          f"X-Deadline-Ms: soon -> HTTP {invalid_status}")
+
+
+def http_json(url: str, method: str = "GET", timeout: float = 30) -> dict:
+    request = urllib.request.Request(url, method=method)
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def wait_job(url: str, job_id: str, timeout: float = 3600, stop_after: Optional[int] = None) -> dict:
+    """Poll a job until it is finished (or has at least stop_after results); returns its status"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        status = http_json(f"{url}/jobs/{job_id}")
+        if status["status"] in ("done", "cancelled") or (stop_after is not None and status["completed"] >= stop_after):
+            return status
+        time.sleep(0.1)
+    raise RuntimeError(f"Job {job_id} not finished after {timeout} s")
+
+
+def bench_jobs(args):
+    """Bulk job throughput, /detect latency while a job runs, and resuming a job after a restart"""
+    workdir = Path(tempfile.mkdtemp(prefix="model-server-bench-"))
+    model_path = make_synthetic_model(workdir / "synthetic.onnx")
+    image_root = workdir / "images"
+    image_root.mkdir()
+    width, height = (int(v) for v in args.resolution.split("x"))
+    # A pool of distinct photos referenced repeatedly (the result cache is off,
+    # so every image of the job is decoded and run)
+    files = []
+    for i in range(args.distinct):
+        path = image_root / f"photo{i:04d}.jpg"
+        path.write_bytes(make_jpeg(width, height, seed=i))
+        files.append(path.name)
+    job = {
+        "images": [{"stepId": f"step{i}", "path": files[i % len(files)]} for i in range(args.images)],
+        "minConfidence": 0.5
+    }
+    interactive = {
+        "images": [{"stepId": "step0", "dataUrl": make_data_url(make_jpeg(width, height, seed=10_000)), "timestamp": 0}],
+        "minConfidence": 0.5
+    }
+    model_server.JOB_IMAGE_ROOT = str(image_root)
+    model_server.JOB_BATCH_SIZE = args.batch
+    db_path = str(workdir / "jobs.db")
+    print(f"{args.images} job images ({args.resolution}, {args.distinct} distinct files), claims of {args.batch}, "
+          f"max batch {model_server.MAX_BATCH_SIZE}, {model_server.available_cores()} cores")
+
+    with quiet(), ServerThread(model_path, args.port, job_db=db_path) as server:
+        idle = [post_timed(f"{server.url}/detect", interactive)[1] for _ in range(args.probes)]
+
+        # Synchronous /detect at full speed, for comparison
+        sync_payload = {
+            "images": [{"stepId": f"step{i}", "dataUrl": make_data_url((image_root / files[i % len(files)]).read_bytes()),
+                        "timestamp": 0} for i in range(model_server.MAX_BATCH_SIZE)],
+            "minConfidence": 0.5
+        }
+        start = time.perf_counter()
+        sync_images = 0
+        while time.perf_counter() - start < args.sync_seconds:
+            http_post_json(f"{server.url}/detect", sync_payload)
+            sync_images += len(sync_payload["images"])
+        sync_rate = sync_images / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        submitted = http_post_json(f"{server.url}/jobs", job)
+        submit_ms = (time.perf_counter() - start) * 1000
+
+        # Interactive requests while the job runs, paced like inspectors
+        stop = threading.Event()
+        loaded = []
+
+        def client():
+            while not stop.wait(args.interval):
+                loaded.append(post_timed(f"{server.url}/detect", interactive)[1])
+
+        thread = threading.Thread(target=client)
+        thread.start()
+        status = wait_job(server.url, submitted["id"])
+        stop.set()
+        thread.join()
+        batching = http_json(f"{server.url}/stats")["batching"]
+
+    job_seconds = status["finished"] - status["started"]
+    print()
+    print(f"   job:             {status['completed']} images in {job_seconds:.1f} s = {status['images_per_second']:.1f} images/s "
+          f"(submit {submit_ms:.0f} ms, {status['failed']} failed)")
+    print(f"   sync /detect:    {sync_rate:.1f} images/s ({len(sync_payload['images'])} images per request, back to back)")
+    print(f"   /detect alone:   p50 {percentile(idle, 50):6.0f} ms   p95 {percentile(idle, 95):6.0f} ms")
+    print(f"   /detect + job:   p50 {percentile(loaded, 50):6.0f} ms   p95 {percentile(loaded, 95):6.0f} ms   "
+          f"({len(loaded)} requests, one every {args.interval:g} s)")
+    print(f"   batches:         mean {batching['mean_batch_size']} images, {batching['background_images']} background images")
+
+    # Restart in the middle of a job: it resumes, and every image gets exactly one result
+    resume = {"images": job["images"][:args.resume_images], "minConfidence": 0.5}
+    with quiet(), ServerThread(model_path, args.port, job_db=db_path) as server:
+        job_id = http_post_json(f"{server.url}/jobs", resume)["id"]
+        before = wait_job(server.url, job_id, stop_after=args.resume_images // 3)["completed"]
+    with quiet(), ServerThread(model_path, args.port, job_db=db_path) as server:
+        status = wait_job(server.url, job_id)
+        with urllib.request.urlopen(f"{server.url}/jobs/{job_id}/stream", timeout=300) as response:
+            lines = [json.loads(line) for line in response]
+    indices = sorted(line["index"] for line in lines if line["type"] == "result")
+    print()
+    print(f"Restart: {before} of {args.resume_images} images done before, job {status['status']} after the restart "
+          f"with {status['completed']} results")
+    if indices != list(range(args.resume_images)) or lines[-1]["type"] != "job":
+        print("[ERROR] The resumed job is missing results or has duplicates")
+        sys.exit(1)
+    print("[SUCCESS] Every image has exactly one result; /jobs/{id}/stream replayed them and ended with the status")
+
+
+# Phone camera resolutions (landscape and portrait 12 MP, 16:9 1080p, 48 MP)
+PHONE_RESOLUTIONS = ["4032x3024", "3024x4032", "1920x1080", "8064x6048"]
+
+
+def sample_call(fn, repeat: int, warmup: int = 1) -> List[float]:
+    """Wall times of fn() in milliseconds after warmup calls"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def summarize(samples: List[float]) -> dict:
+    return {
+        "median_ms": round(float(np.median(samples)), 4),
+        "p90_ms": round(percentile(samples, 90), 4),
+        "min_ms": round(min(samples), 4),
+        "repeat": len(samples),
+    }
+
+
+def parse_batch(value: str):
+    """Value of --batch: an integer batch size or 'dynamic'"""
+    return "batch" if value == "dynamic" else int(value)
+
+
+def compare_results(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """Benchmarks whose median got slower than baseline by more than threshold"""
+    regressions = []
+    print(f"Comparison with baseline ({baseline['meta'].get('timestamp', '?')}), threshold +{threshold:.0%}")
+    for key in ("config", "cpu_count", "onnxruntime"):
+        if baseline["meta"].get(key) != results["meta"].get(key):
+            print(f"[WARNING] Baseline {key} differs: {baseline['meta'].get(key)} vs {results['meta'].get(key)}")
+    print(f"   {'benchmark':<36} {'baseline ms':>12} {'current ms':>11} {'change':>8}")
+    for name, current in results["results"].items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            print(f"   {name:<36} {'-':>12} {current['median_ms']:11.3f} {'new':>8}")
+            continue
+        change = current["median_ms"] / previous["median_ms"] - 1 if previous["median_ms"] else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"   {name:<36} {previous['median_ms']:12.3f} {current['median_ms']:11.3f} {change:+8.1%}{flag}")
+    return regressions
+
+
+def bench_suite(args):
+    """Per-stage and end-to-end benchmarks on a synthetic model, saved as JSON"""
+    import onnxruntime
+    from fastapi.testclient import TestClient
+
+    workdir = Path(tempfile.mkdtemp(prefix="model-server-bench-"))
+    model_path = make_synthetic_model(workdir / "synthetic.onnx", num_classes=args.classes, batch=args.batch)
+    model_server.CACHE_MAX_MB = 0
+    with quiet():
+        model_server.load_model(str(model_path))
+    target_size = model_server.decode_target_size()
+    height, width = model_server.model_input_size()
+    results = {}
+
+    def record(name: str, samples: List[float]):
+        results[name] = summarize(samples)
+        print(f"   {name:<36} {results[name]['median_ms']:10.3f} ms   (p90 {results[name]['p90_ms']:.3f})")
+
+    print(f"Synthetic model: {args.classes} classes, batch {args.batch if args.batch != 'batch' else 'dynamic'}, "
+          f"{args.repeat} repetitions")
+    jpegs = {size: make_jpeg(*(int(v) for v in size.split("x")), seed=i) for i, size in enumerate(args.resolutions)}
+
+    for size, jpeg in jpegs.items():
+        data_url = make_data_url(jpeg)
+        record(f"decode_base64_image[{size}]", sample_call(
+            lambda: model_server.decode_base64_image(data_url, target_size), args.repeat
+        ))
+        image = model_server.decode_base64_image(data_url, target_size)
+        out, scratch = model_server.preprocess_buffers(1, height, width)
+        record(f"preprocess_image[{size}]", sample_call(
+            lambda: model_server.preprocess_image(image, model_server.input_shape, out=out[0], scratch=scratch),
+            args.repeat
+        ))
+
+    batch_sizes = [1] if model_server.model_batch_size == 1 else sorted({1, model_server.model_batch_size or args.images})
+    for batch_size in batch_sizes:
+        input_batch = np.random.default_rng(0).random((batch_size, 3, height, width), dtype=np.float32)
+        record(f"inference[batch={batch_size}]", sample_call(
+            lambda: model_server.run_inference(input_batch), args.repeat
+        ))
+
+    # Tiled mode: global view plus tiles of one image in one batch
+    for size, jpeg in jpegs.items():
+        image = model_server.decode_image_bytes(jpeg, model_server.tiled_decode_target((height, width)))
+        tiles = len(model_server.tile_grid(*model_server.original_image_size(image), min(height, width)))
+        samples = sample_call(lambda: model_server.tiled_detection_candidates(image, 0.25), args.repeat)
+        record(f"tiled_detection[{size}, {tiles} tiles]", samples)
+        record(f"tiled_detection_per_view[{size}]", [ms / (tiles + 1) for ms in samples])
+        image = model_server.decode_image_bytes(jpeg, model_server.cascade_decode_target((height, width)))
+        record(f"cascade_detection[{size}]", sample_call(
+            lambda: model_server.cascade_detection_candidates(image, 0.25), args.repeat
+        ))
+
+    outputs = make_yolo_output(num_candidates=args.candidates, num_classes=args.classes, seed=1)
+    record(f"postprocess_detections[{args.candidates}]", sample_call(
+        lambda: model_server.postprocess_detections(outputs, 0.25, 4032, 3024), args.repeat
+    ))
+    boxes, scores, class_ids = make_candidates(args.candidates, num_classes=args.classes, seed=2)
+    detections = to_detections(boxes, scores, class_ids)
+    record(f"apply_nms[{args.candidates}]", sample_call(
+        lambda: model_server.apply_nms(detections, 0.5), args.repeat
+    ))
+
+    # Full request path through FastAPI (validation, pool, batcher, response)
+    resolutions = list(jpegs)
+    request = {
+        "images": [
+            {"stepId": f"step{i}", "dataUrl": make_data_url(jpegs[resolutions[i % len(resolutions)]]), "timestamp": 0}
+            for i in range(args.images)
+        ],
+        "minConfidence": 0.5
+    }
+    files = [("images", (f"step{i}.jpg", jpegs[resolutions[i % len(resolutions)]], "image/jpeg")) for i in range(args.images)]
+    model_server.MODEL_PATH = str(model_path)
+    for name in ("multipart", "python_multipart"):
+        logging.getLogger(name).setLevel(logging.ERROR)  # httpx ends bodies with CRLF
+    with quiet(), TestClient(model_server.app) as client:
+        samples = sample_call(lambda: client.post("/detect", json=request).raise_for_status(), args.repeat)
+        multipart_samples = sample_call(
+            lambda: client.post("/detect/multipart", files=files).raise_for_status(), args.repeat
+        )
+    record(f"detect[{args.images} images]", samples)
+    record(f"detect_multipart[{args.images} images]", multipart_samples)
+
+    # Streaming needs a real server (TestClient buffers the whole body)
+    with quiet(), ServerThread(model_path, args.port) as server:
+        detect_http = sample_call(lambda: http_post_json(f"{server.url}/detect", request), args.repeat)
+        http_post_stream(f"{server.url}/detect/stream", request)
+        streams = [http_post_stream(f"{server.url}/detect/stream", request) for _ in range(args.repeat)]
+    record(f"detect_http[{args.images} images]", detect_http)
+    record(f"detect_stream_first_result[{args.images} images]", [first for first, _, _ in streams])
+    record(f"detect_stream[{args.images} images]", [total for _, total, _ in streams])
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "onnxruntime": onnxruntime.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": {
+                "classes": args.classes,
+                "batch": "dynamic" if args.batch == "batch" else args.batch,
+                "resolutions": args.resolutions,
+                "images": args.images,
+                "candidates": args.candidates,
+                "repeat": args.repeat,
+            },
+        },
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"[INFO] Results written to {args.output}")
+
+    if args.baseline:
+        print()
+        regressions = compare_results(report, json.loads(Path(args.baseline).read_text()), args.threshold)
+        if regressions:
+            print(f"[ERROR] {len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+        print("[SUCCESS] No regressions against the baseline")
+
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="AI model server benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("postprocess", help="Vectorized postprocessing vs per-row loop")
+    p.add_argument("--candidates", type=int, default=300, help="Anchors above background score")
+    p.add_argument("--min-confidence", type=float, default=0.25, help="Confidence threshold")
+    p.add_argument("--cases", type=int, default=30, help="Random outputs for the equivalence check")
+    p.add_argument("--repeat", type=int, default=20, help="Timing repetitions")
+    p.set_defaults(func=bench_postprocess)
+
+    p = subparsers.add_parser("nms", help="Array NMS engine vs pop(0) loop")
+    p.add_argument("--sizes", type=int, nargs="+", default=[100, 500, 2000, 5000], help="Candidate counts")
+    p.add_argument("--iou", type=float, default=0.5, help="IoU threshold")
+    p.add_argument("--max-det", type=int, default=300, help="Maximum detections kept")
+    p.add_argument("--legacy-limit", type=int, default=2000, help="Skip the O(n^2) loop above this size")
+    p.add_argument("--cases", type=int, default=10, help="Random sets for the equivalence check")
+    p.add_argument("--repeat", type=int, default=10, help="Timing repetitions")
+    p.set_defaults(func=bench_nms)
+
+    p = subparsers.add_parser("health", help="/health latency while /detect is busy")
+    p.add_argument("--clients", type=int, default=2, help="Concurrent /detect clients")
+    p.add_argument("--images", type=int, default=6, help="Images per /detect request")
+    p.add_argument("--probes", type=int, default=50, help="/health probes per phase")
+    p.add_argument("--min-detections", type=int, default=4, help="/detect requests to complete under load")
+    p.add_argument("--threshold", type=float, default=500.0, help="Under-load /health p99 (ms) flagged as a failure")
+    p.add_argument("--port", type=int, default=8765, help="Local port for the test server")
+    p.set_defaults(func=bench_health)
+
+    p = subparsers.add_parser("batching", help="Cross-request micro-batching throughput")
+    p.add_argument("--clients", type=int, default=8, help="Concurrent clients")
+    p.add_argument("--requests", type=int, default=10, help="Requests per client")
+    p.add_argument("--workers", type=int, default=8, help="Inference workers")
+    p.add_argument("--max-batch", type=int, default=8, help="Maximum batch size")
+    p.add_argument("--wait-ms", type=float, default=10, help="Batcher max wait")
+    p.add_argument("--port", type=int, default=8766, help="Local port for the test server")
+    p.set_defaults(func=bench_batching)
+
+    p = subparsers.add_parser("payload", help="JSON/base64 vs multipart request bodies")
+    p.add_argument("--images", type=int, default=6, help="Images per request")
+    p.add_argument("--width", type=int, default=4000, help="Image width")
+    p.add_argument("--height", type=int, default=3000, help="Image height")
+    p.add_argument("--repeat", type=int, default=5, help="Timing repetitions")
+    p.add_argument("--port", type=int, default=8767, help="Local port for the test server")
+    p.set_defaults(func=bench_payload)
+
+    p = subparsers.add_parser("decode", help="Full vs reduced-resolution JPEG decode")
+    p.add_argument("--sizes", nargs="+", default=["1920x1440", "4000x3000", "8000x6000"], help="WIDTHxHEIGHT")
+    p.add_argument("--repeat", type=int, default=5, help="Timing repetitions")
+    p.set_defaults(func=bench_decode)
+
+    p = subparsers.add_parser("preprocess", help="Letterbox into reusable buffers vs original preprocessing")
+    p.add_argument("--sizes", nargs="+", default=["1280x720", "4000x3000", "3000x4000"], help="WIDTHxHEIGHT")
+    p.add_argument("--repeat", type=int, default=50, help="Timing repetitions")
+    p.set_defaults(func=bench_preprocess)
+
+    p = subparsers.add_parser("cache", help="Detection result cache hits, coalescing and disk tier")
+    p.add_argument("--width", type=int, default=4000, help="Image width")
+    p.add_argument("--height", type=int, default=3000, help="Image height")
+    p.add_argument("--clients", type=int, default=8, help="Concurrent requests for the same image")
+    p.add_argument("--repeat", type=int, default=20, help="Timing repetitions")
+    p.add_argument("--port", type=int, default=8768, help="Local port for the test server")
+    p.set_defaults(func=bench_cache)
+
+    p = subparsers.add_parser("logging", help="Per-request overhead of logging on and off")
+    p.add_argument("--images", type=int, default=1, help="Images per request")
+    p.add_argument("--requests", type=int, default=500, help="Timed requests per configuration")
+    p.add_argument("--sample-rate", type=float, default=0.01, help="Per-image DEBUG sample rate")
+    p.add_argument("--rounds", type=int, default=10, help="Interleaved rounds over the configurations")
+    p.set_defaults(func=bench_logging)
+
+    p = subparsers.add_parser("metrics", help="Instrumentation overhead, /metrics and Server-Timing")
+    p.add_argument("--images", type=int, default=6, help="Images per request")
+    p.add_argument("--repeat", type=int, default=2000, help="Timing repetitions")
+    p.add_argument("--port", type=int, default=8769, help="Local port for the test server")
+    p.set_defaults(func=bench_metrics)
+
+    p = subparsers.add_parser("sessions", help="Session pool size and thread configurations")
+    p.add_argument("--configs", nargs="+", default=["1x0", "2x0", "4x0"],
+                   help="SESSIONSxTHREADS per run (0 threads = cores / sessions)")
+    p.add_argument("--clients", type=int, default=8, help="Concurrent clients")
+    p.add_argument("--requests", type=int, default=10, help="Requests per client")
+    p.add_argument("--no-spinning", action="store_true", help="Disable ONNX Runtime thread spinning")
+    p.add_argument("--port", type=int, default=8770, help="Local port for the test server")
+    p.set_defaults(func=bench_sessions)
+
+    p = subparsers.add_parser("workers", help="Memory of pre-forked workers vs independent processes")
+    p.add_argument("--workers", type=int, default=4, help="Worker processes")
+    p.add_argument("--weights-mb", type=float, default=40, help="Synthetic model weight size (YOLOv8s is ~43 MB)")
+    p.add_argument("--requests", type=int, default=4, help="Warm-up /detect requests per worker")
+    p.add_argument("--port", type=int, default=8771, help="Local port (independent servers use the next ports)")
+    p.set_defaults(func=bench_workers)
+
+    p = subparsers.add_parser("live", help="/ws/live frame dropping, session limit and smoothing")
+    p.add_argument("--sessions", type=int, default=2, help="Concurrent sessions (also the session limit)")
+    p.add_argument("--fps", type=float, default=30, help="Frames sent per second per session")
+    p.add_argument("--seconds", type=float, default=10, help="Seconds of frames per session")
+    p.add_argument("--smoothing", type=int, default=3, help="Smoothing window of every second session")
+    p.add_argument("--min-confidence", type=float, default=0.3, help="Detection threshold")
+    p.add_argument("--port", type=int, default=8773)
+    p.set_defaults(func=bench_live)
+
+    p = subparsers.add_parser("reload", help="Hot model reload under load (admin endpoint and file watch)")
+    p.add_argument("--clients", type=int, default=4, help="Concurrent /detect clients")
+    p.add_argument("--seconds", type=float, default=3, help="Seconds of traffic between steps")
+    p.add_argument("--weights-mb", type=float, default=40, help="Extra weights in the synthetic model")
+    p.add_argument("--port", type=int, default=8774)
+    p.set_defaults(func=bench_reload)
+
+    p = subparsers.add_parser("startup", help="Time to /live and /ready, optimized graph cache and warm-up")
+    p.add_argument("--weights-mb", type=float, default=40, help="Extra weights in the synthetic model")
+    p.add_argument("--images", type=int, default=8, help="Images per /detect request")
+    p.add_argument("--port", type=int, default=8775)
+    p.set_defaults(func=bench_startup)
+
+    p = subparsers.add_parser("tiers", help="Resolution tiers: latency vs detections kept per tier")
+    p.add_argument("--model", type=str, help="Dynamic-size ONNX model (default: synthetic)")
+    p.add_argument("--images", type=str, help="Folder of sample images (default: synthetic 12 MP JPEGs)")
+    p.add_argument("--limit", type=int, default=6, help="Maximum images")
+    p.add_argument("--batch", type=int, default=6, help="Images per batched request")
+    p.add_argument("--repeat", type=int, default=3, help="Passes over the images per tier")
+    p.add_argument("--min-confidence", type=float, default=0.25, help="Detection threshold")
+    p.add_argument("--match-iou", type=float, default=0.5, help="IoU for a detection to count as kept")
+    p.add_argument("--small", type=float, default=0.05, help="Small-object size, fraction of the long side")
+    p.add_argument("--port", type=int, default=8776)
+    p.set_defaults(func=bench_tiers)
+
+    p = subparsers.add_parser("modes", aliases=["tiling", "cascade"],
+                              help="Full-frame vs tiled vs cascade detection: latency, stages, small-class recall")
+    p.add_argument("--model", type=str, help="ONNX model (default: synthetic, dynamic input size)")
+    p.add_argument("--images", type=str, help="Folder of sample images (default: synthetic JPEGs of --resolutions)")
+    p.add_argument("--labels", type=str, help="Folder of YOLO label files (<image stem>.txt) for recall")
+    p.add_argument("--modes", nargs="+", choices=["full", "tiled", "cascade"], default=["full", "tiled", "cascade"])
+    p.add_argument("--resolutions", nargs="+", default=["1920x1080", "4032x3024", "8064x6048"],
+                   help="Synthetic JPEG sizes (WIDTHxHEIGHT)")
+    p.add_argument("--limit", type=int, default=50, help="Maximum images")
+    p.add_argument("--repeat", type=int, default=3, help="Timed requests per image and mode")
+    p.add_argument("--min-confidence", type=float, default=0.25, help="Detection threshold")
+    p.add_argument("--match-iou", type=float, default=0.5, help="IoU for a label to count as found")
+    p.add_argument("--port", type=int, default=8777)
+    p.set_defaults(func=bench_modes)
+
+    p = subparsers.add_parser("admission", help="Bounded request queue (429), client deadlines (504) and partial results")
+    p.add_argument("--burst", type=int, default=32, help="Requests sent at once")
+    p.add_argument("--images", type=int, default=4, help="Images per request")
+    p.add_argument("--resolution", type=str, default="4032x3024", help="JPEG size (WIDTHxHEIGHT)")
+    p.add_argument("--workers", type=int, default=4, help="Inference workers")
+    p.add_argument("--max-queued", type=int, default=4, help="Requests waiting for a worker before 429")
+    p.add_argument("--client-timeout", type=float, default=3.0, help="Seconds the clients wait (sent as X-Deadline-Ms)")
+    p.add_argument("--port", type=int, default=8778)
+    p.set_defaults(func=bench_admission)
+
+    p = subparsers.add_parser("jobs", help="Bulk job throughput, /detect latency during a job, resume after restart")
+    p.add_argument("--images", type=int, default=10_000, help="Images in the job")
+    p.add_argument("--distinct", type=int, default=100, help="Distinct image files the job cycles through")
+    p.add_argument("--resolution", type=str, default="1280x960", help="JPEG size (WIDTHxHEIGHT)")
+    p.add_argument("--batch", type=int, default=model_server.JOB_BATCH_SIZE, help="Job images per claim")
+    p.add_argument("--probes", type=int, default=20, help="Interactive /detect requests measured idle")
+    p.add_argument("--interval", type=float, default=0.5, help="Seconds between interactive requests during the job")
+    p.add_argument("--sync-seconds", type=float, default=10.0, help="Duration of the synchronous /detect comparison")
+    p.add_argument("--resume-images", type=int, default=300, help="Images in the job interrupted by a restart")
+    p.add_argument("--port", type=int, default=8779)
+    p.set_defaults(func=bench_jobs)
+
+    p = subparsers.add_parser("suite", help="Per-stage and /detect benchmarks to JSON, with baseline comparison")
+    p.add_argument("--classes", type=int, default=len(CLASS_NAMES), help="Synthetic model class count")
+    p.add_argument("--batch", type=parse_batch, default="dynamic", help='Model batch dimension: N or "dynamic"')
+    p.add_argument("--resolutions", nargs="+", default=PHONE_RESOLUTIONS, help="JPEG sizes (WIDTHxHEIGHT)")
+    p.add_argument("--images", type=int, default=6, help="Images per /detect request")
+    p.add_argument("--candidates", type=int, default=300, help="Candidates for postprocess and NMS")
+    p.add_argument("--repeat", type=int, default=10, help="Timing repetitions")
+    p.add_argument("--output", type=str, help="Write results to this JSON file")
+    p.add_argument("--baseline", type=str, help="Compare against a previous --output file")
+    p.add_argument("--threshold", type=float, default=0.15, help="Relative slowdown flagged as a regression")
+    p.add_argument("--port", type=int, default=8772, help="Local port for the streaming test server")
+    p.set_defaults(func=bench_suite)
+
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("AI Model Server Benchmark")
+    print("=" * 60)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Compare FP32 and INT8 exports of the YOLO model on sample images.
+
+Every variant runs through the server's own decode, preprocess_image,
+run_inference and postprocess_detections, so the numbers match what
+model_server.py would serve. Reports model size, latency and, per class,
+how many FP32 detections each INT8 variant reproduces (same class,
+IoU >= --match-iou).
+
+Usage:
+    python scripts/export-onnx-model.py --skip-export --quantize all --calibration-dir samples/
+    python scripts/compare-model-variants.py --images samples/
+    python scripts/compare-model-variants.py --images samples/ --variants fp32 int8-static --json report.json
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+# Fix encoding for Windows
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "ai-server"))
+
+import model_server  # noqa: E402
+from model_server import CLASS_NAMES, MODEL_VARIANTS, Detection  # noqa: E402
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png"}
+
+
+def run_variant(images: List[bytes], input_shape: tuple, min_confidence: float, repeat: int):
+    """Detections per image plus inference and end-to-end latencies (ms) with the loaded model
+
+    `input_shape` is the model's [1, 3, H, W] input; `repeat` must be at least 1.
+    """
+    target_size = model_server.decode_target_size(tuple(input_shape[2:]))
+
+    detections, inference_ms, total_ms = [], [], []
+    for img_bytes in images:
+        for run in range(repeat):
+            start = time.perf_counter()
+            image = model_server.decode_image_bytes(img_bytes, target_size)
+            img_width, img_height = model_server.original_image_size(image)
+            tensor, letterbox = model_server.preprocess_image(image, input_shape)
+            inference_start = time.perf_counter()
+            outputs = model_server.run_inference(tensor)
+            inference_end = time.perf_counter()
+            result = model_server.postprocess_detections(
+                outputs, min_confidence, img_width, img_height, letterbox=letterbox
+            )
+            end = time.perf_counter()
+            inference_ms.append((inference_end - inference_start) * 1000)
+            total_ms.append((end - start) * 1000)
+        detections.append(result)
+    return detections, inference_ms, total_ms
+
+
+def match_count(reference: List[Detection], candidate: List[Detection], iou_threshold: float) -> int:
+    """Greedy one-to-one matches between two detection lists of the same class"""
+    if not reference or not candidate:
+        return 0
+    ref_boxes = np.array([d.bbox for d in reference], dtype=np.float32)
+    cand_boxes = np.array([d.bbox for d in sorted(candidate, key=lambda d: d.confidence, reverse=True)], dtype=np.float32)
+    ious = model_server.box_iou(cand_boxes, ref_boxes)
+    # Boxes clipped to zero area at the image edge have IoU 0 even with themselves
+    ious[np.all(cand_boxes[:, None] == ref_boxes[None], axis=-1)] = 1.0
+    taken = np.zeros(len(reference), dtype=bool)
+    matched = 0
+    for row in ious:
+        row = np.where(taken, -1.0, row)
+        best = int(np.argmax(row))
+        if row[best] >= iou_threshold:
+            taken[best] = True
+            matched += 1
+    return matched
+
+
+def agreement(reference: List[List[Detection]], candidate: List[List[Detection]], iou_threshold: float) -> Dict[str, dict]:
+    """Per-class counts and matches of candidate detections against the reference"""
+    per_class = {}
+    for class_name in list(CLASS_NAMES.values()):
+        ref_total = cand_total = matched = 0
+        for ref_dets, cand_dets in zip(reference, candidate):
+            ref_cls = [d for d in ref_dets if d.class_name == class_name]
+            cand_cls = [d for d in cand_dets if d.class_name == class_name]
+            ref_total += len(ref_cls)
+            cand_total += len(cand_cls)
+            matched += match_count(ref_cls, cand_cls, iou_threshold)
+        per_class[class_name] = {
+            "fp32": ref_total,
+            "variant": cand_total,
+            "matched": matched,
+            "recall": round(matched / ref_total, 4) if ref_total else None,
+            "precision": round(matched / cand_total, 4) if cand_total else None,
+        }
+    return per_class
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare FP32 and INT8 model variants")
+    parser.add_argument("--model", type=str, default="models/best.onnx", help="FP32 ONNX model")
+    parser.add_argument("--images", type=Path, required=True, help="Folder of sample images")
+    parser.add_argument("--limit", type=int, default=100, help="Maximum images")
+    parser.add_argument("--variants", nargs="+", choices=MODEL_VARIANTS, default=list(MODEL_VARIANTS),
+                        help="Variants to compare (missing files are skipped)")
+    parser.add_argument("--min-confidence", type=float, default=0.5, help="Detection threshold")
+    parser.add_argument("--match-iou", type=float, default=0.5, help="IoU for a detection to count as reproduced")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per image")
+    parser.add_argument("--json", type=str, help="Also write the report to this JSON file")
+    args = parser.parse_args()
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+
+    files = sorted(p for p in args.images.rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)[:args.limit]
+    if not files:
+        print(f"[ERROR] No images (.jpg/.jpeg/.png) found in {args.images}")
+        sys.exit(1)
+    images = [p.read_bytes() for p in files]
+
+    variants = ["fp32"] + [v for v in args.variants if v != "fp32"]
+    paths = {v: model_server.model_variant_path(args.model, v) for v in variants}
+    if not Path(paths["fp32"]).exists():
+        print(f"[ERROR] FP32 model not found at {paths['fp32']}")
+        sys.exit(1)
+
+    print("=" * 60)
+    print("YOLO Model Variant Comparison")
+    print("=" * 60)
+    print(f"Images: {len(images)} from {args.images}")
+    print(f"minConfidence: {args.min_confidence}   match IoU: {args.match_iou}")
+    print("=" * 60)
+    print()
+
+    results = {}
+    for variant in variants:
+        if not Path(paths[variant]).exists():
+            print(f"[WARNING] {variant}: {paths[variant]} not found - skipping")
+            continue
+        print(f"[INFO] Running {variant} ({paths[variant]})...")
+        model_server.load_model(paths[variant])
+        input_shape = (1, 3) + model_server.model_input_size()
+        detections, inference_ms, total_ms = run_variant(images, input_shape, args.min_confidence, args.repeat)
+        results[variant] = {
+            "path": paths[variant],
+            "size_mb": Path(paths[variant]).stat().st_size / (1024 * 1024),
+            "inference_ms": float(np.median(inference_ms)),
+            "total_ms": float(np.median(total_ms)),
+            "detections": detections,
+        }
+    print()
+
+    fp32 = results["fp32"]
+    print(f"{'variant':<14} {'size MB':>8} {'inference ms':>13} {'speedup':>8} {'end-to-end ms':>14}")
+    for variant, result in results.items():
+        print(f"{variant:<14} {result['size_mb']:8.2f} {result['inference_ms']:13.2f} "
+              f"{fp32['inference_ms'] / result['inference_ms']:7.2f}x {result['total_ms']:14.2f}")
+
+    report = {variant: {k: v for k, v in result.items() if k != "detections"} for variant, result in results.items()}
+    for variant, result in results.items():
+        if variant == "fp32":
+            continue
+        per_class = agreement(fp32["detections"], result["detections"], args.match_iou)
+        report[variant]["agreement"] = per_class
+        print()
+        print(f"Per-class agreement, {variant} vs fp32")
+        print(f"   {'class':<16} {'fp32':>6} {variant:>13} {'matched':>8} {'recall':>7} {'precision':>10}")
+        for class_name, row in per_class.items():
+            recall = f"{row['recall']:.1%}" if row["recall"] is not None else "-"
+            precision = f"{row['precision']:.1%}" if row["precision"] is not None else "-"
+            print(f"   {class_name:<16} {row['fp32']:6d} {row['variant']:13d} {row['matched']:8d} {recall:>7} {precision:>10}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+        print()
+        print(f"[INFO] Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
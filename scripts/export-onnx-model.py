@@ -10,17 +10,176 @@ Solution: Re-export the model with opset=21
 Usage:
     pip install ultralytics
     python scripts/export-onnx-model.py
+
+    Or export with dynamic axes (lets the server run all images of a
+    /detect request in one inference call, and serve the speed/balanced/
+    accurate resolution tiers from one model):
+    python scripts/export-onnx-model.py --dynamic-batch
+
+    Also write INT8 variants (served with model_server.py --model-variant):
+    python scripts/export-onnx-model.py --quantize all --calibration-dir samples/
+    python scripts/export-onnx-model.py --skip-export --quantize dynamic
 """
 
+import argparse
 import sys
 import os
 from pathlib import Path
 
+import numpy as np
+
 # Fix encoding for Windows
 if sys.platform == 'win32':
     sys.stdout.reconfigure(encoding='utf-8')
 
+CALIBRATION_SUFFIXES = {".jpg", ".jpeg", ".png"}
+
+
+def load_model_server():
+    """Import ai-server/model_server.py so calibration uses the server's own preprocessing"""
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "ai-server"))
+    import model_server
+    return model_server
+
+
+def make_calibration_reader(model_path: Path, image_dir: Path, limit: int):
+    """CalibrationDataReader feeding images through the server's decode + letterbox"""
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationDataReader
+
+    model_server = load_model_server()
+    session = ort.InferenceSession(str(model_path), providers=['CPUExecutionProvider'])
+    model_input = session.get_inputs()[0]
+    input_shape = model_input.shape
+    batch = input_shape[0] if isinstance(input_shape[0], int) and input_shape[0] > 0 else 1
+    model_server.input_shape = input_shape
+
+    files = sorted(p for p in image_dir.rglob("*") if p.suffix.lower() in CALIBRATION_SUFFIXES)[:limit]
+    if not files:
+        print(f"[ERROR] No calibration images (.jpg/.jpeg/.png) found in {image_dir}")
+        sys.exit(1)
+    print(f"[INFO] Calibrating on {len(files)} images from {image_dir}")
+
+    class ImageFolderReader(CalibrationDataReader):
+        def __init__(self):
+            self.files = iter(files)
+
+        def get_next(self):
+            tensors = []
+            for path in self.files:
+                try:
+                    image = model_server.decode_image_bytes(path.read_bytes(), model_server.decode_target_size())
+                except ValueError as e:
+                    print(f"[WARNING] Skipping {path}: {e}")
+                    continue
+                tensor, _ = model_server.preprocess_image(image, input_shape)
+                tensors.append(tensor)
+                if len(tensors) == batch:
+                    break
+            if not tensors:
+                return None
+            while len(tensors) < batch:
+                tensors.append(tensors[-1])
+            return {model_input.name: np.concatenate(tensors)}
+
+    return ImageFolderReader()
+
+
+def quantize_model(onnx_path: Path, variant: str, calibration_dir: Path, calibration_count: int) -> Path:
+    """Write an INT8 variant of onnx_path and return its path"""
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    output_path = Path(load_model_server().model_variant_path(str(onnx_path), variant))
+    prepared_path = onnx_path.with_name(f"{onnx_path.stem}.prepared{onnx_path.suffix}")
+
+    print(f"[INFO] Quantizing ({variant}) -> {output_path}")
+    # Shape inference and graph cleanup recommended before quantization
+    quant_pre_process(str(onnx_path), str(prepared_path))
+    try:
+        if variant == "int8-dynamic":
+            # Weights to int8 offline, activations quantized per run. ConvInteger
+            # on CPU needs uint8 weights.
+            quantize_dynamic(str(prepared_path), str(output_path), weight_type=QuantType.QUInt8)
+        else:
+            # Only the convolutions (and matmuls) are quantized; the detection
+            # head's concat/decoding stays in float so box coordinates keep
+            # full precision
+            quantize_static(
+                str(prepared_path),
+                str(output_path),
+                make_calibration_reader(prepared_path, calibration_dir, calibration_count),
+                quant_format=QuantFormat.QDQ,
+                per_channel=True,
+                activation_type=QuantType.QUInt8,
+                weight_type=QuantType.QInt8,
+                op_types_to_quantize=["Conv", "MatMul"],
+            )
+    finally:
+        prepared_path.unlink(missing_ok=True)
+
+    return output_path
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Re-export YOLO model to ONNX (opset 21)")
+    parser.add_argument(
+        "--dynamic-batch", "--dynamic",
+        action="store_true",
+        help="Export with dynamic batch, height and width so the server can batch several images "
+             "per run and serve every resolution tier (per-request tier / imgsz)"
+    )
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=1,
+        help="Fixed batch size for a static export (ignored with --dynamic-batch)"
+    )
+    parser.add_argument(
+        "--quantize",
+        choices=["none", "dynamic", "static", "all"],
+        default="none",
+        help="Also write INT8 variants: dynamic (no calibration) and/or static (calibrated)"
+    )
+    parser.add_argument(
+        "--calibration-dir",
+        type=Path,
+        help="Folder of sample images for static quantization calibration"
+    )
+    parser.add_argument(
+        "--calibration-count",
+        type=int,
+        default=200,
+        help="Maximum calibration images"
+    )
+    parser.add_argument(
+        "--skip-export",
+        action="store_true",
+        help="Quantize the existing models/best.onnx instead of re-exporting it"
+    )
+    args = parser.parse_args()
+
+    # Paths
+    pt_model_path = Path("models/best.pt")
+    onnx_output_path = Path("models/best.onnx")
+
+    variants = {
+        "none": [],
+        "dynamic": ["int8-dynamic"],
+        "static": ["int8-static"],
+        "all": ["int8-dynamic", "int8-static"],
+    }[args.quantize]
+    if "int8-static" in variants and args.calibration_dir is None:
+        print("[ERROR] --quantize static needs --calibration-dir with sample images")
+        sys.exit(1)
+
+    if args.skip_export:
+        if not onnx_output_path.exists():
+            print(f"[ERROR] ONNX model not found at {onnx_output_path}")
+            sys.exit(1)
+        quantize_variants(onnx_output_path, variants, args)
+        return
+
     try:
         from ultralytics import YOLO
     except ImportError:
@@ -28,10 +187,6 @@ def main():
         print("   Run: pip install ultralytics")
         sys.exit(1)
 
-    # Paths
-    pt_model_path = Path("models/best.pt")
-    onnx_output_path = Path("models/best.onnx")
-
     if not pt_model_path.exists():
         print(f"[ERROR] PyTorch model not found at {pt_model_path}")
         print("   Please ensure models/best.pt exists")
@@ -43,6 +198,10 @@ def main():
     print(f"Input model:  {pt_model_path}")
     print(f"Output model: {onnx_output_path}")
     print(f"ONNX opset:   21 (compatible with onnxruntime 1.20.x)")
+    if args.dynamic_batch:
+        print(f"Batch size:   dynamic (input size dynamic too: resolution tiers enabled)")
+    else:
+        print(f"Batch size:   {args.batch} (static)")
     print("=" * 60)
     print()
 
@@ -56,8 +215,9 @@ def main():
         format='onnx',
         opset=21,  # Use opset 21 for compatibility
         simplify=True,  # Simplify the model for better performance
-        dynamic=False,  # Use static input size
-        imgsz=640,  # Standard YOLO input size
+        dynamic=args.dynamic_batch,  # Dynamic batch/height/width: batched inference and resolution tiers
+        batch=1 if args.dynamic_batch else args.batch,
+        imgsz=640,  # Standard YOLO input size (the "accurate" tier)
     )
 
     # Check if export was successful
@@ -70,6 +230,7 @@ def main():
         print(f"   Size:   {size_mb:.2f} MB")
         print("=" * 60)
         print()
+        quantize_variants(onnx_output_path, variants, args)
         print("Next steps:")
         print("  1. Commit the new model: git add models/best.onnx")
         print("  2. Push to GitHub: git commit -m \"fix: Re-export ONNX model with opset 21\"")
@@ -79,5 +240,20 @@ def main():
         print("[ERROR] Export failed - output file not found")
         sys.exit(1)
 
+def quantize_variants(onnx_path: Path, variants, args):
+    """Write the requested INT8 variants and print their sizes"""
+    if not variants:
+        return
+    fp32_mb = onnx_path.stat().st_size / (1024 * 1024)
+    for variant in variants:
+        output_path = quantize_model(onnx_path, variant, args.calibration_dir, args.calibration_count)
+        size_mb = output_path.stat().st_size / (1024 * 1024)
+        print(f"[SUCCESS] {variant}: {output_path} ({size_mb:.2f} MB, {size_mb / fp32_mb:.0%} of FP32)")
+    print()
+    print("Compare accuracy and speed before deploying:")
+    print("  python scripts/compare-model-variants.py --images <sample folder>")
+    print("Serve a variant with: python model_server.py --model-variant int8-static")
+    print()
+
 if __name__ == "__main__":
     main()
@@ -269,6 +269,8 @@ async function detectWithDigitalOcean(
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          // Lets the server drop this request instead of running it after we gave up
+          'X-Deadline-Ms': String(DETECTION_TIMEOUT),
         },
         body: JSON.stringify({
           images,
@@ -294,6 +296,12 @@ async function detectWithDigitalOcean(
         throw new Error('AI model is still loading. Please wait a moment and try again.');
       }
 
+      // We don't send X-Allow-Partial, so this shouldn't happen; but an image skipped at the
+      // deadline comes back with no detections and must not read as "component not found"
+      if (data.partial || (data.results || []).some((result: any) => result.expired)) {
+        throw new Error('AI detection reached its timeout before all images were analyzed');
+      }
+
       // Map Python server response format to our format
       // Python server returns: { results: [{ stepId, detections: [{ class_name, confidence, bbox }] }] }
       // We need: { results: [{ stepId, detections: [{ class, confidence, bbox }] }] }